@@ -3,14 +3,31 @@ ASGI config for AppName project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Normal traffic is served by the WSGI workers (see ``startup.sh``); the ASGI
+server only handles the async endpoints listed in ``settings.ASGI_PATHS`` and
+answers 404 to anything else, so sync views never run under ASGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AppName.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] not in settings.ASGI_PATHS:
+        await send({
+            'type': 'http.response.start',
+            'status': 404,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': b'{"error": "Not found"}'})
+        return
+    await django_application(scope, receive, send)
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -24,6 +24,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = config('SECRET_KEY', 'secret')
 JWT_KEY = config('JWT_KEY', 'secret')
+# Users resolved from JWT cookies are cached per process (see authentication/authentication.py).
+# Saves and deletes reach other processes within CACHE_LOCAL_TIMEOUT through a generation
+# token in the shared cache; QuerySet.update() changes can stay stale for AUTH_USER_CACHE_TTL.
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', 1024, cast=int)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', 60, cast=int)
 ENVIRONMENT = config('ENVIRONMENT', 'production')
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -51,7 +56,8 @@ INSTALLED_APPS = [
     'admin_honeypot',
     'chartjs',
     'organisation',
-    'forms'
+    'forms',
+    'utils',
 ]
 
 AUTH_USER_MODEL = 'authentication.User'
@@ -101,9 +107,15 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
     ),
+    # Reverse proxies in front of the app (nginx appends the client address to
+    # X-Forwarded-For); throttles key on the address the last of them saw
+    'NUM_PROXIES': config('NUM_PROXIES', 1, cast=int),
 }
 
 WSGI_APPLICATION = 'AppName.wsgi.application'
+ASGI_APPLICATION = 'AppName.asgi.application'
+# Async endpoints, served by the ASGI server only (see AppName/asgi.py and AppName/wsgi.py)
+ASGI_PATHS = ('/api/forms/ai-fill/stream/',)
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -118,6 +130,11 @@ if DEBUG:
     }
 else:
     # Production
+    # DB_POOL: 'none' keeps one persistent connection per worker for
+    # DB_CONN_MAX_AGE seconds, 'psycopg' uses Django's connection pool
+    # (needs psycopg 3 with psycopg_pool), 'pgbouncer' is for a
+    # transaction-pooling PgBouncer in front of Postgres.
+    DB_POOL = config('DB_POOL', 'none')
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.postgresql',
@@ -125,9 +142,75 @@ else:
             'USER': config('DB_USER'),
             'PASSWORD': config('DB_PASSWORD'),
             'HOST': config('DB_HOST'),
-            'PORT': '5432',
+            'PORT': config('DB_PORT', '5432'),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', 60, cast=int),
+            'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', True, cast=bool),
+            'OPTIONS': {},
         }
     }
+    if DB_POOL == 'psycopg':
+        # Pooled connections are returned after each request instead
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', 2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', 10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', 10, cast=int),
+        }
+    elif DB_POOL == 'pgbouncer':
+        # Server-side cursors do not survive transaction pooling
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 'default' is a per-process LRU in front of the 'shared' cache (see utils/cache.py).
+# The shared cache must be shared by every app node: 'db' or 'redis'; 'file' and
+# 'locmem' only suit a single host.
+
+CACHE_BACKEND = config('CACHE_BACKEND', 'db')
+# The db and file caches cull once they hold MAX_ENTRIES keys (Django's default
+# is 300), dropping 1/CULL_FREQUENCY of them in key order. That would drop form
+# schemas first, then rate limit buckets and single-flight locks, so keep
+# MAX_ENTRIES well above the working set. Redis evicts by its own policy.
+SHARED_CACHE_OPTIONS = {
+    'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', 100000, cast=int),
+    'CULL_FREQUENCY': config('CACHE_CULL_FREQUENCY', 10, cast=int),
+}
+SHARED_CACHE_BACKENDS = {
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_LOCATION', '') or str(BASE_DIR / '.cache'),
+        'OPTIONS': SHARED_CACHE_OPTIONS,
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': config('CACHE_LOCATION', '') or 'app_cache',
+        'OPTIONS': SHARED_CACHE_OPTIONS,
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_LOCATION', '') or 'redis://127.0.0.1:6379',
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'utils.cache.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': config('CACHE_LOCAL_MAX_ENTRIES', 1000, cast=int),
+            'LOCAL_TIMEOUT': config('CACHE_LOCAL_TIMEOUT', 5, cast=int),
+        },
+    },
+    'shared': {
+        **SHARED_CACHE_BACKENDS[CACHE_BACKEND],
+        'KEY_PREFIX': config('CACHE_KEY_PREFIX', 'anonymous-form'),
+        'TIMEOUT': 60 * 60 * 24,
+    },
+}
     
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -176,6 +259,31 @@ else:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Form upload storage: 'filesystem' or 'object-store'
+FORM_UPLOAD_STORAGE = config('FORM_UPLOAD_STORAGE', 'filesystem')
+
+if FORM_UPLOAD_STORAGE == 'object-store':
+    FORM_UPLOAD_STORAGE_BACKEND = {
+        'BACKEND': 'forms.storage.ObjectStoreStorage',
+        'OPTIONS': {
+            'bucket': config('FORM_UPLOAD_BUCKET', 'form-uploads'),
+            'endpoint_url': config('FORM_UPLOAD_ENDPOINT_URL', None),
+            'access_key': config('FORM_UPLOAD_ACCESS_KEY', None),
+            'secret_key': config('FORM_UPLOAD_SECRET_KEY', None),
+            'region': config('FORM_UPLOAD_REGION', None),
+            'base_url': config('FORM_UPLOAD_BASE_URL', None),
+            'client': config('FORM_UPLOAD_CLIENT', None),
+        },
+    }
+else:
+    FORM_UPLOAD_STORAGE_BACKEND = {'BACKEND': 'django.core.files.storage.FileSystemStorage'}
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'form_uploads': FORM_UPLOAD_STORAGE_BACKEND,
+}
+
 
 CORS_ORIGIN_ALLOW_ALL = False
 
@@ -265,6 +373,38 @@ CLIENT_URL = config('CLIENT_URL', 'https://localhost:5173')
 
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 100000
 
+# Post-submission tasks (see forms/tasks.py)
+FORM_TASKS_EAGER = config('FORM_TASKS_EAGER', False, cast=bool)
+FORM_TASK_WORKERS = config('FORM_TASK_WORKERS', 2, cast=int)
+FORM_UPLOAD_SCAN_HOOK = config('FORM_UPLOAD_SCAN_HOOK', None)
+FORM_NOTIFICATION_EMAILS = config('FORM_NOTIFICATION_EMAILS', '', cast=Csv())
+
+# Also write each answer to the indexed Answer table (see forms/answers.py)
+FORM_STORE_ANSWERS = config('FORM_STORE_ANSWERS', False, cast=bool)
+
+# Columnar response snapshots for analytics (see forms/snapshots.py)
+FORM_SNAPSHOT_DIR = config('FORM_SNAPSHOT_DIR', '') or str(BASE_DIR / 'snapshots')
+
+# AI form filling (see forms/ai.py)
+GEMINI_API_KEY = config('GEMINI_API_KEY', None)
+FORM_AI_MODEL = config('FORM_AI_MODEL', 'gemini-2.5-flash')
+FORM_AI_CLIENT = config('FORM_AI_CLIENT', 'forms.ai.gemini_model')
+FORM_AI_CACHE_TIMEOUT = config('FORM_AI_CACHE_TIMEOUT', 60 * 60, cast=int)
+FORM_AI_STREAM_CONCURRENCY = config('FORM_AI_STREAM_CONCURRENCY', 8, cast=int)
+FORM_AI_STREAM_TIMEOUT = config('FORM_AI_STREAM_TIMEOUT', 60, cast=int)
+# Seconds a streamed fill waits for one of the FORM_AI_STREAM_CONCURRENCY slots before a 503
+FORM_AI_STREAM_QUEUE_TIMEOUT = config('FORM_AI_STREAM_QUEUE_TIMEOUT', 5, cast=float)
+FORM_AI_CHUNK_SIZE = config('FORM_AI_CHUNK_SIZE', 40, cast=int)
+FORM_AI_CHUNK_WORKERS = config('FORM_AI_CHUNK_WORKERS', 4, cast=int)
+FORM_AI_CHUNK_RETRIES = config('FORM_AI_CHUNK_RETRIES', 1, cast=int)
+# Seconds before retrying a rate limited or timed out model call, doubled per attempt
+FORM_AI_RETRY_BACKOFF = config('FORM_AI_RETRY_BACKOFF', 1, cast=float)
+FORM_AI_COALESCE_TIMEOUT = config('FORM_AI_COALESCE_TIMEOUT', 60, cast=int)
+# Token buckets as '<requests>/<period>' (see utils/throttling.py)
+FORM_AI_USER_RATE = config('FORM_AI_USER_RATE', '10/min')
+FORM_AI_IP_RATE = config('FORM_AI_IP_RATE', '30/min')
+FORM_BATCH_SUBMIT_RATE = config('FORM_BATCH_SUBMIT_RATE', '30/min')
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10 MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10 MB
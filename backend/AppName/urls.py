@@ -19,11 +19,15 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from utils.views import CacheStatsAPI, DatabaseStatsAPI
+
 urlpatterns = [
     path('admin/', include('admin_honeypot.urls', namespace='admin_honeypot')),
     path('admin-back-office/', admin.site.urls),
     path('api/', include('authentication.urls')),
     path('api/', include('forms.urls')),
+    path('api/cache/stats/', CacheStatsAPI.as_view(), name='cache-stats'),
+    path('api/db/stats/', DatabaseStatsAPI.as_view(), name='db-stats'),
     path('api-auth/', include('rest_framework.urls')),
 ]
 
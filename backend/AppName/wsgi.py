@@ -3,14 +3,27 @@ WSGI config for AppName project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+The async endpoints in ``settings.ASGI_PATHS`` are answered with 404 here:
+under WSGI their streams would be buffered in full, hold a worker for the
+whole model call and escape the concurrency limit. They are served by the
+ASGI server (see ``asgi.py`` and ``startup.sh``).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AppName.settings')
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+
+def application(environ, start_response):
+    if environ.get('PATH_INFO') in settings.ASGI_PATHS:
+        start_response('404 Not Found', [('Content-Type', 'application/json')])
+        return [b'{"error": "Not found, this endpoint is served by the ASGI server"}']
+    return django_application(environ, start_response)
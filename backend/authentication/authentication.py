@@ -1,62 +1,148 @@
+"""
+Cookie JWT authentication.
+
+The three authentication classes differ only in how they report a missing
+or bad token; the work is shared by ``authenticate_request``:
+
+* the outcome is memoized on the underlying ``HttpRequest``, so stacking
+  several of these classes decodes the token and looks up the user once;
+* users are kept in a bounded per-process TTL cache keyed by the email
+  claim, so an authenticated request costs no query while the entry is
+  fresh. Each entry records the user's *generation*, a token kept in the
+  shared cache that is replaced whenever the user is saved or deleted (see
+  ``signals``). An entry whose generation no longer matches is reloaded,
+  so every process sees the change once the local tier of the default
+  cache lets go of the old token (``CACHE_LOCAL_TIMEOUT``). Changes made
+  with ``QuerySet.update`` send no signal and are picked up when the entry
+  expires (``AUTH_USER_CACHE_TTL``).
+"""
+import copy
+import threading
+import uuid
+
+from cachetools import TTLCache
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework import authentication, exceptions
+from utils.cache import cache_key, USERS
 from .models import User
 import jwt
 
+MISSING, EXPIRED, INVALID, UNKNOWN_USER = 'missing', 'expired', 'invalid', 'unknown_user'
+
+_user_cache = TTLCache(maxsize=settings.AUTH_USER_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+
+def _generation_key(pk):
+    return cache_key(USERS, 'generation', pk)
+
+
+def get_user_generation(pk):
+    """Return the current generation token of the user with ``pk``."""
+    key = _generation_key(pk)
+    generation = cache.get(key)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(key, generation):
+            generation = cache.get(key)
+    return generation
+
+
+def get_cached_user(email):
+    """Return the user with ``email``, from the cache when possible."""
+    with _user_cache_lock:
+        entry = _user_cache.get(email)
+    if entry is not None:
+        user, generation = entry
+        current = get_user_generation(user.pk)
+        if generation != current:
+            # Saved or deleted by some process since it was cached
+            user = User.objects.get(email=email)
+            with _user_cache_lock:
+                _user_cache[email] = (user, current)
+    else:
+        user = User.objects.get(email=email)
+        with _user_cache_lock:
+            _user_cache[email] = (user, get_user_generation(user.pk))
+    # Each request gets its own instance
+    return copy.copy(user)
+
+
+def invalidate_user(user):
+    """
+    Drop every cache entry of ``user``, including ones under a previous
+    email, and make other processes reload it.
+    """
+    with _user_cache_lock:
+        stale = [email for email, (cached, _) in _user_cache.items() if cached.pk == user.pk or email == user.email]
+        for email in stale:
+            _user_cache.pop(email, None)
+    cache.set(_generation_key(user.pk), uuid.uuid4().hex)
+
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+
+
+def _resolve(request):
+    token = request.COOKIES.get('token')
+    if not token:
+        return None, MISSING
+    try:
+        payload = jwt.decode(token, settings.JWT_KEY, algorithms=['HS256'])
+        email = payload['id']
+    except jwt.ExpiredSignatureError:
+        return None, EXPIRED
+    except (jwt.InvalidTokenError, KeyError, TypeError):
+        return None, INVALID
+    try:
+        return get_cached_user(email), None
+    except User.DoesNotExist:
+        return None, UNKNOWN_USER
+
+
+def authenticate_request(request):
+    """
+    Return ``(user, error)`` for the token cookie of ``request``.
+
+    ``error`` is one of ``MISSING``, ``EXPIRED``, ``INVALID`` and
+    ``UNKNOWN_USER`` when there is no user. Computed once per request.
+    """
+    http_request = getattr(request, '_request', request)
+    result = getattr(http_request, '_jwt_authentication', None)
+    if result is None:
+        result = _resolve(http_request)
+        http_request._jwt_authentication = result
+    return result
+
+
 class IsAuthenticated(authentication.BaseAuthentication):
     def authenticate(self, request):
-        try:
-            token = request.COOKIES.get('token')
-            if not token:
-                raise exceptions.AuthenticationFailed('Authentication Failed')
-            try:
-                payload = jwt.decode(token, settings.JWT_KEY, 'HS256')
-            except:
-                raise exceptions.AuthenticationFailed('Authentication Failed')
-            email = payload['id']
-
-            try:
-                user = User.objects.get(email=email)
-            except User.DoesNotExist:
-                raise exceptions.AuthenticationFailed('Authentication Failed')
-
-            return (user, None)
-        except:
+        user, error = authenticate_request(request)
+        if error:
             raise exceptions.AuthenticationFailed('Authentication Failed')
+        return (user, None)
 
 class JWTCookieAuthentication(authentication.BaseAuthentication):
+    messages = {
+        EXPIRED: 'Token expired',
+        INVALID: 'Invalid token',
+        UNKNOWN_USER: 'User not found',
+    }
+
     def authenticate(self, request):
-        token = request.COOKIES.get('token')
-        
-        if not token:
-            return None 
-        try:
-            payload = jwt.decode(token, settings.JWT_KEY, algorithms=['HS256'])
-            email = payload['id']
-            user = User.objects.get(email=email)
-            return (user, None)
-        except jwt.ExpiredSignatureError:
-            raise exceptions.AuthenticationFailed('Token expired')
-        except jwt.InvalidTokenError:
-            raise exceptions.AuthenticationFailed('Invalid token')
-        except User.DoesNotExist:
-            raise exceptions.AuthenticationFailed('User not found')
+        user, error = authenticate_request(request)
+        if error == MISSING:
+            return None
+        if error:
+            raise exceptions.AuthenticationFailed(self.messages[error])
+        return (user, None)
 
 class CheckAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
-        try:
-            token = request.COOKIES.get('token')
-            if not token:
-                return (None, None)
-            try:
-                payload = jwt.decode(token, settings.JWT_KEY, 'HS256')
-            except jwt.ExpiredSignatureError:
-                return (None, None)
-            email=payload['id']
-            try:
-                user = User.objects.get(email=email)
-            except User.DoesNotExist:
-                return (None, None)
-            return (user, None)
-        except:
-            return (None, None)
\ No newline at end of file
+        user, error = authenticate_request(request)
+        if error:
+            return (None, None)
+        return (user, None)
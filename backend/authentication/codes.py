@@ -0,0 +1,72 @@
+"""
+Helpers for user codes.
+
+A user code is the short secret a respondent types in to submit a form.
+Codes are unique; ``rekey_duplicate_codes`` is shared by the migration that
+added the constraint and the ``rekey_user_codes`` management command.
+"""
+import random
+import string
+
+CODE_LENGTH = 6
+CODE_CHARACTERS = string.ascii_uppercase + string.digits
+
+
+def random_code():
+    return ''.join(random.choices(CODE_CHARACTERS, k=CODE_LENGTH))
+
+
+def unused_code(model):
+    """Return a random code that no row of ``model`` holds yet."""
+    while True:
+        code = random_code()
+        if not model.objects.filter(code=code).exists():
+            return code
+
+
+def find_rekey_candidates(model):
+    """
+    Return the ids of users whose code must be regenerated.
+
+    That is every user with a blank code, and every user but the earliest
+    sharing a code with someone else.
+    """
+    from django.db.models import Count, Min
+
+    ids = list(model.objects.filter(code='').values_list('id', flat=True))
+    duplicates = (
+        model.objects.exclude(code='')
+        .values('code')
+        .annotate(total=Count('id'), first_id=Min('id'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        ids.extend(
+            model.objects.filter(code=duplicate['code'])
+            .exclude(id=duplicate['first_id'])
+            .values_list('id', flat=True)
+        )
+    return sorted(ids)
+
+
+def rekey_duplicate_codes(model, batch_size=500):
+    """
+    Give every candidate from ``find_rekey_candidates`` a fresh unique code.
+
+    Rows are updated with ``bulk_update`` in batches of ``batch_size``.
+    Returns the list of rekeyed user ids.
+    """
+    ids = find_rekey_candidates(model)
+    taken = set()
+
+    for start in range(0, len(ids), batch_size):
+        users = list(model.objects.filter(id__in=ids[start:start + batch_size]).only('id', 'code'))
+        for user in users:
+            code = unused_code(model)
+            while code in taken:
+                code = unused_code(model)
+            taken.add(code)
+            user.code = code
+        model.objects.bulk_update(users, ['code'])
+
+    return ids
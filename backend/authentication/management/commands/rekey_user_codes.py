@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from authentication.codes import find_rekey_candidates, rekey_duplicate_codes
+from authentication.models import User
+
+
+class Command(BaseCommand):
+    help = "Give users with a blank or duplicated code a fresh unique code"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Users updated per query")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many users would be rekeyed")
+        parser.add_argument('--notify', action='store_true', help="Email rekeyed users their new code")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            ids = find_rekey_candidates(User)
+            self.stdout.write(f"{len(ids)} users would get a new code")
+            return
+
+        ids = rekey_duplicate_codes(User, batch_size=options['batch_size'])
+
+        if options['notify']:
+            for user in User.objects.filter(id__in=ids).iterator(chunk_size=options['batch_size']):
+                user.send_user_code()
+
+        self.stdout.write(self.style.SUCCESS(f"Rekeyed {len(ids)} users"))
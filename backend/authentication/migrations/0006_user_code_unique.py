@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:17
+
+from django.db import migrations, models
+
+from authentication.codes import rekey_duplicate_codes
+
+
+def rekey_user_codes(apps, schema_editor):
+    User = apps.get_model('authentication', 'User')
+    rekey_duplicate_codes(User)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_remove_verificationcode_user_delete_forgetpassword_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(rekey_user_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='code',
+            field=models.CharField(blank=True, default='', max_length=100, unique=True, verbose_name='User Code'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.hashers import make_password
@@ -10,7 +10,9 @@ from rest_framework import status
 
 from utils.send_mail import send_email, send_html_email
 
-import uuid, jwt, string, random
+from .codes import unused_code
+
+import uuid, jwt
 
 from organisation.models import *
 
@@ -56,10 +58,12 @@ class User(AbstractUser):
     department = models.ForeignKey(Department, on_delete=models.SET_NULL, related_name='user_department',null=True, blank=True)
     group = models.ForeignKey(Group, on_delete=models.SET_NULL, related_name='user_group',null=True, blank=True)
     
-    code = models.CharField("User Code", max_length=100, default="", blank=True)
+    code = models.CharField("User Code", max_length=100, default="", blank=True, unique=True)
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
+    
+    CODE_ATTEMPTS = 5
 
     objects = UserManager()
 
@@ -68,9 +72,7 @@ class User(AbstractUser):
             self.code = self.generate_user_code()
     
     def generate_user_code(self, *args, **kwargs):
-        length = 6
-        characters = string.ascii_uppercase + string.digits
-        return ''.join(random.choices(characters, k=length))
+        return unused_code(User)
 
     
     def save(self, *args, **kwargs):
@@ -79,9 +81,25 @@ class User(AbstractUser):
         
         # Generate user code if empty
         if not self.code or self.code.strip() == "":
-            self.code = self.generate_user_code()
+            self._save_with_new_code(*args, **kwargs)
+            return
         
         super().save(*args, **kwargs)
+    
+    def _save_with_new_code(self, *args, **kwargs):
+        # Another user created concurrently may take the same code between the
+        # lookup in generate_user_code and the insert; the unique constraint
+        # catches that and we retry with a fresh code
+        for attempt in range(self.CODE_ATTEMPTS):
+            self.code = self.generate_user_code()
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if not User.objects.filter(code=self.code).exclude(pk=self.pk).exists():
+                    raise
+        raise IntegrityError(f"Could not generate a unique user code in {self.CODE_ATTEMPTS} attempts")
 
     def get_name(self):
         if self.last_name:
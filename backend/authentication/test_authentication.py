@@ -0,0 +1,101 @@
+"""
+Tests for cookie JWT authentication
+"""
+import jwt
+import pytest
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from authentication.authentication import _generation_key, CheckAuthentication, IsAuthenticated, JWTCookieAuthentication
+from authentication.models import User
+
+
+def make_request(token=None):
+    request = APIRequestFactory().get('/')
+    if token:
+        request.COOKIES['token'] = token
+    return Request(request)
+
+
+def make_token(email, expires_in=timedelta(hours=1)):
+    payload = {'id': email, 'exp': datetime.now(timezone.utc) + expires_in}
+    return jwt.encode(payload, settings.JWT_KEY, algorithm='HS256')
+
+
+@pytest.mark.django_db
+class TestJWTAuthentication:
+    """Test cases for the JWT cookie authentication classes"""
+    
+    def test_authenticates_user(self, user):
+        """Test that a valid token resolves to its user"""
+        authenticated, _ = JWTCookieAuthentication().authenticate(make_request(make_token(user.email)))
+        
+        assert authenticated.pk == user.pk
+    
+    def test_error_semantics(self, user):
+        """Test that each class keeps its own handling of bad tokens"""
+        expired = make_token(user.email, expires_in=timedelta(seconds=-1))
+        
+        assert JWTCookieAuthentication().authenticate(make_request()) is None
+        assert CheckAuthentication().authenticate(make_request(expired)) == (None, None)
+        with pytest.raises(exceptions.AuthenticationFailed, match='Token expired'):
+            JWTCookieAuthentication().authenticate(make_request(expired))
+        with pytest.raises(exceptions.AuthenticationFailed, match='Invalid token'):
+            JWTCookieAuthentication().authenticate(make_request('garbage'))
+        with pytest.raises(exceptions.AuthenticationFailed, match='User not found'):
+            JWTCookieAuthentication().authenticate(make_request(make_token('nobody@example.com')))
+        with pytest.raises(exceptions.AuthenticationFailed):
+            IsAuthenticated().authenticate(make_request())
+    
+    def test_user_cached_across_requests(self, user, django_assert_num_queries):
+        """Test that only the first request looks the user up"""
+        token = make_token(user.email)
+        JWTCookieAuthentication().authenticate(make_request(token))
+        
+        with django_assert_num_queries(0):
+            authenticated, _ = JWTCookieAuthentication().authenticate(make_request(token))
+        
+        assert authenticated.email == user.email
+    
+    def test_stacked_classes_resolve_once(self, user, django_assert_num_queries):
+        """Test that several classes on one request share the work"""
+        request = make_request(make_token(user.email))
+        
+        with django_assert_num_queries(1):
+            for auth in (JWTCookieAuthentication(), IsAuthenticated(), CheckAuthentication()):
+                assert auth.authenticate(request)[0].pk == user.pk
+    
+    def test_invalidated_on_save(self, user):
+        """Test that a saved user is reloaded"""
+        token = make_token(user.email)
+        JWTCookieAuthentication().authenticate(make_request(token))
+        
+        user.is_active = False
+        user.save()
+        authenticated, _ = JWTCookieAuthentication().authenticate(make_request(token))
+        
+        assert authenticated.is_active is False
+    
+    def test_invalidated_on_delete(self, user):
+        """Test that a deleted user no longer authenticates"""
+        token = make_token(user.email)
+        JWTCookieAuthentication().authenticate(make_request(token))
+        
+        user.delete()
+        
+        assert CheckAuthentication().authenticate(make_request(token)) == (None, None)
+    
+    def test_invalidated_by_other_process(self, user):
+        """Test that a save in another process reloads the user through the shared generation"""
+        token = make_token(user.email)
+        JWTCookieAuthentication().authenticate(make_request(token))
+        
+        # Another process saves the user: its signal only replaces the shared generation
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        cache.set(_generation_key(user.pk), 'changed elsewhere')
+        authenticated, _ = JWTCookieAuthentication().authenticate(make_request(token))
+        
+        assert authenticated.is_active is False
@@ -2,6 +2,8 @@
 Tests for authentication models
 """
 import pytest
+from io import StringIO
+from django.core.management import call_command
 from django.db import IntegrityError
 from django.contrib.auth.hashers import check_password
 from authentication.models import User, UserManager
@@ -172,6 +174,47 @@ class TestUserModel:
         assert user.group == group
         assert user.group.group_name == 'Test Group'
     
+    def test_user_code_unique(self, create_user):
+        """Test that two users cannot share a code"""
+        user = create_user()
+        
+        with pytest.raises(IntegrityError):
+            create_user(code=user.code)
+    
+    def test_user_code_retried_on_collision(self, create_user, monkeypatch):
+        """Test that a code taken concurrently is replaced by a fresh one"""
+        existing = create_user()
+        codes = iter([existing.code, 'FRESH1'])
+        monkeypatch.setattr(User, 'generate_user_code', lambda self: next(codes))
+        
+        user = create_user()
+        
+        assert user.code == 'FRESH1'
+    
+    def test_rekey_user_codes_command(self, create_user):
+        """Test that users without a code get one from the command"""
+        user = create_user()
+        User.objects.filter(pk=user.pk).update(code='')
+        
+        out = StringIO()
+        call_command('rekey_user_codes', stdout=out)
+        
+        user.refresh_from_db()
+        assert len(user.code) == 6
+        assert 'Rekeyed 1 users' in out.getvalue()
+    
+    def test_rekey_user_codes_dry_run(self, create_user):
+        """Test that a dry run changes nothing"""
+        user = create_user()
+        User.objects.filter(pk=user.pk).update(code='')
+        
+        out = StringIO()
+        call_command('rekey_user_codes', '--dry-run', stdout=out)
+        
+        user.refresh_from_db()
+        assert user.code == ''
+        assert '1 users would get a new code' in out.getvalue()
+    
     def test_send_user_code_method(self, user, mailoutbox):
         """Test sending user code via email"""
         user.send_user_code()
@@ -3,7 +3,9 @@ Pytest configuration and fixtures for the entire test suite
 """
 import pytest
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework.test import APIClient
+from authentication.authentication import clear_user_cache
 from authentication.models import User
 from organisation.models import Role, Department, Group
 from forms.models import Form, Questions, FormQuestion
@@ -13,6 +15,8 @@ import os
 settings.ENVIRONMENT = 'development'
 settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
 settings.DEBUG = False  # Disable debug mode in tests
+settings.FORM_TASKS_EAGER = True  # Run post-submission tasks inline
+settings.CACHES['shared'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}  # Keep the shared tier in memory
 
 # Disable Django Debug Toolbar in tests
 if 'debug_toolbar' in settings.INSTALLED_APPS:
@@ -147,3 +151,12 @@ def cleanup_media(settings):
     # Cleanup can be added here if needed
     pass
 
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start every test with an empty cache"""
+    cache.clear()
+    clear_user_cache()
+    yield
+    cache.clear()
+    clear_user_cache()
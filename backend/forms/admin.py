@@ -5,14 +5,65 @@ if settings.USE_UNFOLD:
 else:
     from django.contrib.admin import ModelAdmin, TabularInline
      
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from django.conf import settings
 
 from django.utils.html import format_html
-from django.utils.safestring import mark_safe
+from django.utils import timezone
+from django.urls import path, reverse
+from django.http import JsonResponse, Http404
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+
+from datetime import datetime
+import base64, binascii, uuid
 
 from .models import *
+from .aggregates import cached_form_statistics
+from .export import export_response
+from .encoding import ResponseDecoder
+from .storage import upload_url
+
+RESPONSES_PAGE_SIZE = 50
+RESPONSES_MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(response):
+    raw = f"{response.created_at.isoformat()}|{response.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, response_id = raw.split('|')
+        return datetime.fromisoformat(created_at), uuid.UUID(response_id)
+    except (ValueError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def answer_display(answer_data):
+    """JSON friendly form of a stored answer for the responses tab."""
+    if not answer_data:
+        return None
+    
+    answer_type = answer_data.get('answer_type')
+    value = answer_data.get('value')
+    
+    if answer_type == 'file':
+        if isinstance(value, dict) and value.get('file_path'):
+            return {
+                'type': 'file',
+                'url': upload_url(value['file_path']),
+                'name': (value.get('original_name') or value.get('name') or 'View File')[:30],
+            }
+        return {'type': 'file', 'url': None}
+    if answer_type == 'boolean':
+        return {'type': 'boolean', 'value': bool(value)}
+    if answer_type == 'checkbox' and isinstance(value, list):
+        return {'type': 'list', 'value': [str(item) for item in value]}
+    return {'type': 'text', 'value': str(value)[:150] if value not in (None, '') else None}
 
 # Register your models here.
 
@@ -32,15 +83,11 @@ class FormUserInline(TabularInline):
     autocomplete_fields = ['user']
     tab = True  # Create tab for users
 
-class FormResponseInline(TabularInline):
-    """Custom inline to display form responses as a tab"""
-    model = FormResponse
+class ReadOnlyTabInline(TabularInline):
+    """Inline tab that renders its own template and never saves anything"""
     extra = 0
     can_delete = False
-    tab = True  # Create tab for responses
-    verbose_name = "Response"
-    verbose_name_plural = "Form Responses"
-    template = "custom/forms/form_response_inline_tab.html"
+    tab = True
     
     # Make it completely read-only
     def has_add_permission(self, request, obj=None):
@@ -67,7 +114,6 @@ class FormResponseInline(TabularInline):
         def always_valid(self):
             return True
         
-        original_save = formset_class.save
         def no_save(self, commit=True):
             # Return empty lists for new_objects, changed_objects, deleted_objects
             self.new_objects = []
@@ -77,98 +123,53 @@ class FormResponseInline(TabularInline):
         
         formset_class.is_valid = always_valid
         formset_class.save = no_save
+        return formset_class
+
+class FormResponseInline(ReadOnlyTabInline):
+    """Custom inline to display form responses as a tab"""
+    model = FormResponse
+    verbose_name = "Response"
+    verbose_name_plural = "Form Responses"
+    template = "custom/forms/form_response_inline_tab.html"
+    
+    def get_formset(self, request, obj=None, **kwargs):
+        formset_class = super().get_formset(request, obj, **kwargs)
         
-        # Initialize defaults
-        formset_class.response_table_data = {'headers': [], 'rows': []}
+        # Rows are fetched page by page by the template from FormAdmin.responses_view
         formset_class.has_responses = False
+        formset_class.responses_url = None
+        formset_class.response_columns = []
         
-        # Prepare response table data for the template (only for existing forms)
         if obj and obj.pk:
-            # Get questions for this form
             form_questions = obj.formquestion_set.select_related('question').order_by('form_index')
-            questions = [fq.question for fq in form_questions]
-            
-            # Get responses
-            responses = obj.form_user_response.all().order_by('-created_at')
-            
-            # Prepare table data
-            from django.urls import reverse
-            
-            # Build headers
-            headers = ['#', 'Submitted At']
-            headers.extend([q.question[:50] for q in questions])
-            headers.append('Actions')
-            
-            # Build rows
-            rows = []
-            for idx, response in enumerate(responses, 1):
-                row = [str(idx), response.created_at.strftime("%b %d, %Y %H:%M")]
-                
-                # Add answer cells
-                for question in questions:
-                    question_id = str(question.id)
-                    answer_data = response.response.get(question_id, {})
-                    
-                    if answer_data:
-                        answer_type = answer_data.get('answer_type')
-                        value = answer_data.get('value')
-                        
-                        if answer_type == 'file' and value:
-                            file_path = value.get('file_path', '')
-                            file_name = value.get('file_name', 'View File')
-                            if file_path:
-                                cell = mark_safe(format_html(
-                                    '<a href="/media/{}" target="_blank" class="text-primary-600 hover:text-primary-700 dark:text-primary-500 underline">📎 {}</a>',
-                                    file_path, file_name[:30]
-                                ))
-                            else:
-                                cell = mark_safe('<span class="text-base-400 italic">No file</span>')
-                        elif answer_type == 'boolean':
-                            if value:
-                                cell = mark_safe('<span class="inline-flex items-center px-2.5 py-0.5 rounded-default text-xs font-medium bg-green-100 text-green-800 dark:bg-green-900/30 dark:text-green-400">✓ Yes</span>')
-                            else:
-                                cell = mark_safe('<span class="inline-flex items-center px-2.5 py-0.5 rounded-default text-xs font-medium bg-red-100 text-red-800 dark:bg-red-900/30 dark:text-red-400">✗ No</span>')
-                        elif answer_type == 'checkbox' and isinstance(value, list):
-                            badges = ''.join([
-                                format_html('<span class="inline-flex items-center px-2 py-1 rounded-default text-xs font-medium bg-primary-100 text-primary-800 dark:bg-primary-900/30 dark:text-primary-400 mr-1">{}</span>', item)
-                                for item in value
-                            ])
-                            cell = mark_safe(format_html('<div class="flex flex-wrap gap-1">{}</div>', mark_safe(badges))) if badges else '-'
-                        else:
-                            cell = str(value)[:150] if value else '-'
-                    else:
-                        cell = '-'
-                    
-                    row.append(cell)
-                
-                # Add actions column
-                change_url = reverse('admin:forms_formresponse_change', args=[response.id])
-                delete_url = reverse('admin:forms_formresponse_delete', args=[response.id])
-                actions = mark_safe(format_html(
-                    '<a href="{}" class="text-primary-600 hover:text-primary-700 dark:text-primary-500 font-medium">View</a> '
-                    '<span class="mx-1 text-base-300">|</span> '
-                    '<a href="{}" class="text-red-600 hover:text-red-700 dark:text-red-500 font-medium">Delete</a>',
-                    change_url, delete_url
-                ))
-                row.append(actions)
-                rows.append(row)
-            
-            # Attach to formset so template can access
-            formset_class.response_table_data = {
-                'headers': headers,
-                'rows': rows
-            }
-            formset_class.has_responses = responses.exists()
+            formset_class.response_columns = [
+                {'id': str(fq.question.id), 'label': fq.question.question[:50]}
+                for fq in form_questions
+            ]
+            formset_class.responses_url = reverse('admin:forms_form_responses', args=[obj.pk])
+            formset_class.has_responses = obj.form_user_response.exists()
         
         return formset_class
+
+class FormStatisticsInline(ReadOnlyTabInline):
+    """Answer statistics of the form, read from AnswerAggregate"""
+    model = AnswerAggregate
+    verbose_name = "Statistic"
+    verbose_name_plural = "Statistics"
+    template = "custom/forms/form_statistics_inline_tab.html"
+    
+    def get_formset(self, request, obj=None, **kwargs):
+        formset_class = super().get_formset(request, obj, **kwargs)
+        formset_class.statistics = cached_form_statistics(obj.pk) if obj and obj.pk else []
+        return formset_class
             
 @admin.register(Form)
 class FormAdmin(ModelAdmin):
     compressed_fields = True
-    list_display = ['name', 'form_link', 'submission_count']
+    list_display = ['name', 'form_link', 'submissions']
     search_fields = ['name',]
     list_filter = ['roles',]
-    inlines = [FormQuestionInline, FormUserInline, FormResponseInline]
+    inlines = [FormQuestionInline, FormUserInline, FormResponseInline, FormStatisticsInline]
     
     fieldsets = (
         ('Form Details', {'fields': ('id', 'name','enable')}),
@@ -176,23 +177,118 @@ class FormAdmin(ModelAdmin):
         ('Form Meta', {'fields': ('created_at', 'updated_at')}),
     )
     readonly_fields = ['created_at', 'updated_at', 'id']
+    actions = ['export_csv', 'export_ndjson', 'export_xlsx']
     
     def get_inlines(self, request, obj=None):
-        """Only show FormResponseInline when editing existing forms"""
+        """Only show responses and statistics when editing existing forms"""
         if obj and obj.pk:
             # Editing existing form - show all inlines including responses
-            return [FormQuestionInline, FormUserInline, FormResponseInline]
+            return [FormQuestionInline, FormUserInline, FormResponseInline, FormStatisticsInline]
         else:
             # Creating new form - don't show responses inline
             return [FormQuestionInline, FormUserInline]
 
+    def get_urls(self):
+        urls = [
+            path(
+                '<path:object_id>/responses/',
+                self.admin_site.admin_view(self.responses_view),
+                name='forms_form_responses',
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def responses_view(self, request, object_id):
+        """
+        One page of a form's responses as JSON, for the responses tab.
+        
+        Pages are ordered newest first and use keyset pagination on
+        (created_at, id): ``cursor`` is the ``next_cursor`` of the previous
+        page. ``limit`` sets the page size and ``columns`` (comma separated
+        question ids) restricts the answers returned; an empty ``columns``
+        means none are selected.
+        """
+        form = self.get_object(request, object_id)
+        if form is None:
+            raise Http404
+        if not self.has_view_permission(request, form):
+            raise PermissionDenied
+        
+        try:
+            limit = min(max(int(request.GET.get('limit', RESPONSES_PAGE_SIZE)), 1), RESPONSES_MAX_PAGE_SIZE)
+        except ValueError:
+            limit = RESPONSES_PAGE_SIZE
+        
+        form_questions = form.formquestion_set.select_related('question').order_by('form_index')
+        questions = [fq.question for fq in form_questions]
+        if 'columns' in request.GET:
+            columns = {c for c in request.GET['columns'].split(',') if c}
+            questions = [q for q in questions if str(q.id) in columns]
+        
+        responses = form.form_user_response.order_by('-created_at', '-id').only('id', 'created_at', 'response')
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                created_at, response_id = decode_cursor(cursor)
+            except ValueError:
+                return JsonResponse({'error': 'Invalid cursor'}, status=400)
+            responses = responses.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=response_id)
+            )
+        
+        page = list(responses[:limit + 1])
+        has_next = len(page) > limit
+        page = page[:limit]
+        
+        decoder = ResponseDecoder(form.pk)
+        rows = []
+        for response in page:
+            answers = decoder.expand(response.response)
+            rows.append({
+                'id': str(response.id),
+                'submitted_at': timezone.localtime(response.created_at).strftime("%b %d, %Y %H:%M"),
+                'answers': {
+                    str(q.id): answer_display(answers.get(str(q.id)))
+                    for q in questions
+                },
+                'change_url': reverse('admin:forms_formresponse_change', args=[response.id]),
+                'delete_url': reverse('admin:forms_formresponse_delete', args=[response.id]),
+            })
+        
+        return JsonResponse({
+            'columns': [{'id': str(q.id), 'label': q.question[:50]} for q in questions],
+            'rows': rows,
+            'next_cursor': encode_cursor(page[-1]) if has_next else None,
+        })
+    
+    def _export(self, request, queryset, export_format):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one form to export.", level=messages.WARNING)
+            return None
+        return export_response(queryset.get(), export_format)
+    
+    @admin.action(description="Export responses as CSV")
+    def export_csv(self, request, queryset):
+        return self._export(request, queryset, 'csv')
+    
+    @admin.action(description="Export responses as NDJSON")
+    def export_ndjson(self, request, queryset):
+        return self._export(request, queryset, 'ndjson')
+    
+    @admin.action(description="Export responses as XLSX")
+    def export_xlsx(self, request, queryset):
+        return self._export(request, queryset, 'xlsx')
+    
     def form_link(self, obj):
         return format_html(f"<a target='_' href='{settings.CLIENT_URL}/form/edit/{obj.id}'>View Form</a>")
     
-    def submission_count(self, obj):
-        count = FormUser.objects.filter(form=obj).count()
-        return count
-    submission_count.short_description = 'Submissions'
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_submission_count()
+    
+    def submissions(self, obj):
+        return obj.submissions
+    submissions.short_description = 'Submissions'
+    submissions.admin_order_field = 'submissions'
 
 @admin.register(Questions)
 class QuestionsAdmin(ModelAdmin):
@@ -257,4 +353,10 @@ class FormUserAdmin(ModelAdmin):
     # def user_code(self, obj):
     #     return obj.user.code if obj.user.code else 'N/A'
     # user_code.short_description = 'User Code'
-    
\ No newline at end of file
+    
+
+@admin.register(UploadedBlob)
+class UploadedBlobAdmin(ModelAdmin):
+    list_display = ['name', 'size', 'ref_count', 'created_at']
+    search_fields = ['name', 'digest']
+    readonly_fields = ['digest', 'name', 'size', 'ref_count', 'created_at', 'updated_at']
@@ -0,0 +1,285 @@
+"""
+Incrementally maintained answer statistics.
+
+Every stored response adds its answers to ``AnswerAggregate`` rows inside
+the submission transaction and ``FormResponse.delete`` takes them out
+again, so reading the statistics of a form costs one query per table
+instead of a scan over every response.
+
+The statistics of a form are also cached in the ``aggregates`` namespace
+until its next change.
+
+Only option questions (radio, select, checkbox), booleans and numbers are
+aggregated. Removing the current minimum or maximum of a number question
+is the one case that needs a scan, since the next extreme is not known
+from the running values.
+"""
+import math
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+
+from .cache import statistics_key, SCHEMA_CACHE_TIMEOUT
+from .encoding import ResponseDecoder
+from .models import AnswerAggregate, FormQuestion, FormResponse, Questions
+from .validation import get_validation_plan
+
+OPTION_TYPES = ('radio', 'select', 'checkbox')
+AGGREGATED_TYPES = OPTION_TYPES + ('boolean', 'number')
+OPTION_MAX_LENGTH = AnswerAggregate._meta.get_field('option').max_length
+
+
+class _Delta:
+    __slots__ = ('count', 'total', 'sum_squares', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.sum_squares = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, number=None):
+        self.count += 1
+        if number is None:
+            return
+        self.total += number
+        self.sum_squares += number * number
+        self.minimum = number if self.minimum is None else min(self.minimum, number)
+        self.maximum = number if self.maximum is None else max(self.maximum, number)
+
+
+def answer_entries(answer):
+    """Yield the ``(option, number)`` pairs an answer contributes to."""
+    if not isinstance(answer, dict):
+        return
+    answer_type = answer.get('answer_type')
+    value = answer.get('value')
+
+    if answer_type in ('radio', 'select') and isinstance(value, str):
+        yield value.strip()[:OPTION_MAX_LENGTH], None
+    elif answer_type == 'checkbox' and isinstance(value, list):
+        for item in dict.fromkeys(v.strip() for v in value if isinstance(v, str)):
+            yield item[:OPTION_MAX_LENGTH], None
+    elif answer_type == 'boolean' and isinstance(value, bool):
+        yield ('true' if value else 'false'), None
+    elif answer_type == 'number' and not isinstance(value, bool):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return
+        if math.isfinite(number):
+            yield '', number
+
+
+def collect_deltas(responses_list):
+    """Sum the contributions of an iterable of stored responses per ``(question, option)``."""
+    deltas = defaultdict(_Delta)
+    for responses in responses_list:
+        if not isinstance(responses, dict):
+            continue
+        for question_id, answer in responses.items():
+            for option, number in answer_entries(answer):
+                deltas[(question_id, option)].add(number)
+    return deltas
+
+
+def existing_question_deltas(deltas, question_ids=None):
+    """
+    The deltas whose question still exists; older responses can reference
+    deleted questions, or keys that are not question ids at all.
+
+    ``question_ids`` are the ids known to exist, e.g. the keys of the
+    validation plan; without them the questions are looked up.
+    """
+    if question_ids is None:
+        ids = set()
+        for question_id, _ in deltas:
+            try:
+                ids.add(uuid.UUID(str(question_id)))
+            except ValueError:
+                continue
+        question_ids = Questions.objects.filter(id__in=ids).values_list('id', flat=True)
+    existing = {str(pk) for pk in question_ids}
+    return {key: delta for key, delta in deltas.items() if str(key[0]) in existing}
+
+
+def _invalidate_statistics(form_id):
+    transaction.on_commit(lambda: cache.delete(statistics_key(form_id)))
+
+
+def add_responses(form_id, responses_list):
+    """Add stored responses to the aggregates of a form, one query per touched row."""
+    _invalidate_statistics(form_id)
+    plan = get_validation_plan(form_id)
+    deltas = existing_question_deltas(collect_deltas(responses_list), plan.keys() if plan is not None else None)
+    for (question_id, option), delta in deltas.items():
+        updates = {
+            'count': F('count') + delta.count,
+            'total': F('total') + delta.total,
+            'sum_squares': F('sum_squares') + delta.sum_squares,
+        }
+        if delta.minimum is not None:
+            updates['minimum'] = Least(F('minimum'), delta.minimum)
+            updates['maximum'] = Greatest(F('maximum'), delta.maximum)
+
+        rows = AnswerAggregate.objects.filter(form_id=form_id, question_id=question_id, option=option)
+        if rows.update(**updates):
+            continue
+        try:
+            with transaction.atomic():
+                AnswerAggregate.objects.create(
+                    form_id=form_id,
+                    question_id=question_id,
+                    option=option,
+                    count=delta.count,
+                    total=delta.total,
+                    sum_squares=delta.sum_squares,
+                    minimum=delta.minimum,
+                    maximum=delta.maximum,
+                )
+        except IntegrityError:
+            # Created by a concurrent submission in the meantime
+            rows.update(**updates)
+
+
+def remove_response(form_response):
+    """Take a stored response out of the aggregates of its form."""
+    form_id = form_response.form_id
+    deltas = collect_deltas([form_response.expanded_response()])
+    if not deltas:
+        return
+
+    _invalidate_statistics(form_id)
+    rescan = set()
+    for (question_id, option), delta in deltas.items():
+        rows = AnswerAggregate.objects.filter(form_id=form_id, question_id=question_id, option=option)
+        rows.update(
+            count=F('count') - delta.count,
+            total=F('total') - delta.total,
+            sum_squares=F('sum_squares') - delta.sum_squares,
+        )
+        if delta.minimum is not None:
+            extremes = rows.values_list('minimum', 'maximum').first()
+            if extremes and (delta.minimum <= extremes[0] or delta.maximum >= extremes[1]):
+                rescan.add(question_id)
+
+    AnswerAggregate.objects.filter(form_id=form_id, count__lte=0).delete()
+    if rescan:
+        _recompute_extremes(form_id, rescan, exclude=form_response.pk)
+
+
+def _recompute_extremes(form_id, question_ids, exclude=None):
+    """Recompute min and max of number questions from the stored responses."""
+    extremes = {}
+    decoder = ResponseDecoder(form_id)
+    responses = FormResponse.objects.filter(form_id=form_id).exclude(pk=exclude)
+    for response in responses.values_list('response', flat=True).iterator(chunk_size=500):
+        response = decoder.expand(response)
+        for question_id in question_ids:
+            for _, number in answer_entries(response.get(question_id)):
+                if number is None:
+                    continue
+                low, high = extremes.get(question_id, (number, number))
+                extremes[question_id] = (min(low, number), max(high, number))
+
+    for question_id in question_ids:
+        low, high = extremes.get(question_id, (None, None))
+        AnswerAggregate.objects.filter(form_id=form_id, question_id=question_id, option='').update(minimum=low, maximum=high)
+
+
+def rebuild_form_aggregates(form_id, chunk_size=500):
+    """Drop and rebuild the aggregates of a form from its stored responses."""
+    with transaction.atomic():
+        _invalidate_statistics(form_id)
+        AnswerAggregate.objects.filter(form_id=form_id).delete()
+        decoder = ResponseDecoder(form_id)
+        responses = FormResponse.objects.filter(form_id=form_id).values_list('response', flat=True)
+        deltas = collect_deltas(decoder.expand(response) for response in responses.iterator(chunk_size=chunk_size))
+        deltas = existing_question_deltas(deltas)
+
+        AnswerAggregate.objects.bulk_create([
+            AnswerAggregate(
+                form_id=form_id,
+                question_id=question_id,
+                option=option,
+                count=delta.count,
+                total=delta.total,
+                sum_squares=delta.sum_squares,
+                minimum=delta.minimum,
+                maximum=delta.maximum,
+            )
+            for (question_id, option), delta in deltas.items()
+        ], batch_size=chunk_size)
+    return len(deltas)
+
+
+def _ordered_options(options):
+    if not options:
+        return []
+    return list(dict.fromkeys(option.strip() for option in options.split('||')))
+
+
+def form_statistics(form_id):
+    """
+    Return the statistics of every aggregated question of a form in form order.
+
+    Option and boolean questions get an ``options`` list of counts, number
+    questions get count, sum, mean, standard deviation, min and max.
+    """
+    rows = defaultdict(dict)
+    for aggregate in AnswerAggregate.objects.filter(form_id=form_id):
+        rows[str(aggregate.question_id)][aggregate.option] = aggregate
+
+    statistics = []
+    form_questions = (
+        FormQuestion.objects.filter(form_id=form_id, question__answer_type__in=AGGREGATED_TYPES)
+        .select_related('question')
+        .order_by('form_index')
+    )
+    for fq in form_questions:
+        q = fq.question
+        aggregates = rows.get(str(q.id), {})
+        entry = {
+            'id': str(q.id),
+            'question': q.question,
+            'answer_type': q.answer_type,
+        }
+
+        if q.answer_type == 'number':
+            aggregate = aggregates.get('')
+            count = aggregate.count if aggregate else 0
+            mean = aggregate.total / count if count else None
+            entry.update({
+                'count': count,
+                'sum': aggregate.total if count else 0,
+                'mean': mean,
+                'stddev': math.sqrt(max(aggregate.sum_squares / count - mean * mean, 0)) if count else None,
+                'min': aggregate.minimum if count else None,
+                'max': aggregate.maximum if count else None,
+            })
+        else:
+            declared = ['true', 'false'] if q.answer_type == 'boolean' else _ordered_options(q.options)
+            # Options removed from the question since keep their counts
+            options = declared + [option for option in aggregates if option not in declared]
+            entry['options'] = [
+                {'option': option, 'count': aggregates[option].count if option in aggregates else 0}
+                for option in options
+            ]
+        statistics.append(entry)
+
+    return statistics
+
+
+def cached_form_statistics(form_id):
+    """``form_statistics`` cached until the next submission, deletion or form change."""
+    key = statistics_key(form_id)
+    statistics = cache.get(key)
+    if statistics is None:
+        statistics = form_statistics(form_id)
+        cache.set(key, statistics, SCHEMA_CACHE_TIMEOUT)
+    return statistics
@@ -0,0 +1,597 @@
+"""
+AI form filling.
+
+``fill_form`` asks a generative model to answer a form from a free text
+description. The expensive parts are shared:
+
+* the model client is created once per process (``get_model``) from the
+  factory at ``FORM_AI_CLIENT``, the Gemini SDK by default; tests point it
+  at a local fake;
+* the question block of the prompt is built once per form version and
+  cached, so a changed form gets a new block;
+* results are cached per form version and normalized input for
+  ``FORM_AI_CACHE_TIMEOUT`` seconds, so a repeated fill costs no model call,
+  and identical fills in flight at the same time share one call;
+* large forms are split into chunks of ``FORM_AI_CHUNK_SIZE`` questions
+  filled in parallel, each retried on its own when the model gets it wrong;
+* model output is read tolerantly and coerced onto the question types and
+  options (see ``forms.ai_output``), so a stray character costs one answer
+  rather than a repeated call.
+
+``stream_fill`` is the async variant behind the streaming endpoint: it
+awaits the model instead of blocking a worker, passes answers on as
+server-sent events while the JSON object is still being written, and runs
+at most ``FORM_AI_STREAM_CONCURRENCY`` fills per event loop (see
+``acquire_fill_slot``), each bounded by ``FORM_AI_STREAM_TIMEOUT`` seconds.
+It is only served by the ASGI server, whose single event loop makes that a
+per process limit.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from google.api_core import exceptions as google_exceptions
+
+from utils.cache import cache_key, FORMS
+from .ai_output import AIResponseError, JSONObjectExtractor, coerce_answer, coerce_answers, extract_object
+from .cache import get_form_version, SCHEMA_CACHE_TIMEOUT
+from .models import FormQuestion
+
+logger = logging.getLogger(__name__)
+
+COALESCE_POLL_INTERVAL = 0.1
+
+# Model call failures that are worth another attempt after a pause
+TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    TimeoutError,
+    ConnectionError,
+)
+
+_model = None
+_model_lock = threading.Lock()
+
+
+class FormUnavailable(Exception):
+    """Raised when the form does not exist or is disabled."""
+
+
+class NoQuestions(Exception):
+    """Raised when the form has no questions to fill."""
+
+
+def gemini_model(model_name):
+    import google.generativeai as genai
+
+    genai.configure(api_key=settings.GEMINI_API_KEY)
+    return genai.GenerativeModel(model_name)
+
+
+def get_model():
+    """The process-wide model client."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                factory = import_string(settings.FORM_AI_CLIENT)
+                _model = factory(settings.FORM_AI_MODEL)
+    return _model
+
+
+def reset_model():
+    """Forget the model client, e.g. after changing ``FORM_AI_CLIENT``."""
+    global _model
+    with _model_lock:
+        _model = None
+
+
+def build_questions(form_id):
+    """Question descriptions of a form for the prompt, in form order."""
+    questions = []
+    form_questions = FormQuestion.objects.filter(form_id=form_id).select_related('question').order_by('form_index')
+    for fq in form_questions:
+        q = fq.question
+        question_info = {
+            'id': str(q.id),
+            'question': q.question,
+            'answer_type': q.answer_type,
+            'required': q.required,
+        }
+        if q.options:
+            question_info['options'] = [opt.strip() for opt in q.options.split('||')]
+        questions.append(question_info)
+    return questions
+
+
+def chunked(items, size):
+    return [items[start:start + size] for start in range(0, len(items), size)] or [[]]
+
+
+def get_question_block(form_id, version):
+    """
+    Prompt material of a form at ``version``, cached.
+
+    A dict with the ``questions``, the ``block`` describing all of them and
+    ``chunks``: ``(questions, block)`` pairs of at most
+    ``FORM_AI_CHUNK_SIZE`` questions each.
+    """
+    key = cache_key(FORMS, 'ai-questions', form_id, version, settings.FORM_AI_CHUNK_SIZE)
+    prompt = cache.get(key)
+    if prompt is None:
+        questions = build_questions(form_id)
+        prompt = {
+            'questions': questions,
+            'block': json.dumps(questions, indent=2),
+            'chunks': [(chunk, json.dumps(chunk, indent=2)) for chunk in chunked(questions, settings.FORM_AI_CHUNK_SIZE)],
+        }
+        cache.set(key, prompt, SCHEMA_CACHE_TIMEOUT)
+    return prompt
+
+
+def normalize_input(user_input):
+    """The input with runs of whitespace collapsed; case is kept, since it can change an answer."""
+    return ' '.join(user_input.split())
+
+
+def build_prompt(question_block, user_input):
+    return f"""You are a helpful AI assistant that fills out forms based on user input.
+
+The user has provided the following input:
+"{user_input}"
+
+Based on this input, please fill out the following form. Return ONLY a valid JSON object with question IDs as keys and appropriate values.
+
+Form Questions:
+{question_block}
+
+Instructions:
+1. For 'text' type questions: provide a string value
+2. For 'number' type questions: provide a numeric value
+3. For 'boolean' type questions: provide true or false
+4. For 'radio' type questions: select ONE option EXACTLY as shown in the options array (including any spaces)
+5. For 'checkbox' type questions: provide an array with EXACT option values from the options array (including any spaces)
+6. For 'select' type questions: select ONE option EXACTLY as shown in the options array (including any spaces)
+7. For 'file' type questions: set the value to null (files cannot be auto-filled)
+8. If the user input doesn't provide information for a question, use null for non-required fields or make a reasonable inference for required fields
+9. Ensure all required fields have values (not null)
+10. IMPORTANT: For radio, checkbox, and select - copy the option values EXACTLY as they appear in the options array, do not trim spaces or modify them
+
+Return ONLY a JSON object in this exact format:
+{{
+  "question_id_1": "value1",
+  "question_id_2": 123,
+  "question_id_3": true,
+  "question_id_4": ["option1", "option2"],
+  ...
+}}
+
+Do not include any markdown, explanations, or additional text. Only return the raw JSON object."""
+
+
+def parse_model_output(text):
+    """The JSON object in the model output, read tolerantly (see ``forms.ai_output``)."""
+    return extract_object(text)
+
+
+def fill_cache_key(form_id, version, user_input):
+    digest = hashlib.sha256(normalize_input(user_input).encode()).hexdigest()
+    return cache_key(FORMS, 'ai-fill', form_id, version, digest)
+
+
+def prepare_fill(form_id, user_input):
+    """
+    Everything a fill needs before the model call.
+
+    Returns ``(cache key, cached answers, prompt)``: the answers when this
+    input was filled before for the current form version, the prompt
+    material (see ``get_question_block``) otherwise.
+    """
+    entry = get_form_version(form_id)
+    if entry is None:
+        raise FormUnavailable(f"Form {form_id} not found or disabled")
+
+    key = fill_cache_key(form_id, entry['version'], user_input)
+    responses = cache.get(key)
+    if responses is not None:
+        return key, responses, None
+
+    prompt = get_question_block(form_id, entry['version'])
+    if not prompt['questions']:
+        raise NoQuestions(f"Form {form_id} has no questions")
+    return key, None, prompt
+
+
+def unanswered(questions, answers):
+    """
+    The questions without a usable answer: missing from ``answers``, or
+    ``None`` although required. File questions are never filled.
+    """
+    return [
+        question for question in questions
+        if question['answer_type'] != 'file' and (
+            question['id'] not in answers or (question['required'] and answers[question['id']] is None)
+        )
+    ]
+
+
+def fill_chunk(questions, block, user_input):
+    """
+    Answers to one chunk of questions, coerced onto their types and options.
+
+    Returns ``(answers, complete)``. The chunk is asked again when a
+    required question got no answer, or one that cannot be coerced; other
+    unusable answers are just dropped. ``complete`` is false when answers
+    are missing or the output was cut off, so the fill is not cached.
+
+    Rate limits and timeouts of the model (``TRANSIENT_ERRORS``) are
+    retried after ``FORM_AI_RETRY_BACKOFF`` seconds, doubled per attempt;
+    once the attempts are used up they fail the chunk as an
+    ``AIResponseError``.
+    """
+    attempts = settings.FORM_AI_CHUNK_RETRIES + 1
+    for attempt in range(1, attempts + 1):
+        try:
+            output = get_model().generate_content(build_prompt(block, user_input))
+            extractor = JSONObjectExtractor()
+            members = extractor.feed(output.text) + extractor.close()
+            answers, invalid = coerce_answers(questions, dict(members))
+            missing = unanswered(questions, answers)
+            required = [question['id'] for question in missing if question['required']]
+            if required:
+                raise AIResponseError(f"Missing or invalid answers to required questions {', '.join(required)}")
+            return answers, not missing and extractor.complete
+        except AIResponseError as e:
+            if attempt == attempts:
+                raise
+            logger.warning(f"Retrying AI fill of a {len(questions)} question chunk after attempt {attempt}: {str(e)}")
+        except TRANSIENT_ERRORS as e:
+            if attempt == attempts:
+                raise AIResponseError(f"Model unavailable after {attempts} attempts: {str(e)}") from e
+            delay = settings.FORM_AI_RETRY_BACKOFF * 2 ** (attempt - 1)
+            logger.warning(f"Retrying AI fill of a {len(questions)} question chunk in {delay}s after attempt {attempt}: {str(e)}")
+            time.sleep(delay)
+
+
+_chunk_executor = None
+
+
+def get_chunk_executor():
+    global _chunk_executor
+    if _chunk_executor is None:
+        _chunk_executor = ThreadPoolExecutor(
+            max_workers=settings.FORM_AI_CHUNK_WORKERS,
+            thread_name_prefix='form-ai',
+        )
+    return _chunk_executor
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key, compute):
+    """
+    ``compute()``, run once for concurrent callers with the same ``key``.
+
+    Callers in this process wait for the first one and share its result or
+    exception. Across processes a lock in the cache marks a computation in
+    progress; other processes wait up to ``FORM_AI_COALESCE_TIMEOUT``
+    seconds for its result to show up under ``key`` and compute it
+    themselves if it does not.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        return future.result(timeout=settings.FORM_AI_COALESCE_TIMEOUT)
+
+    try:
+        result = _shared_flight(key, compute)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _shared_flight(key, compute):
+    lock = f'{key}:lock'
+    timeout = settings.FORM_AI_COALESCE_TIMEOUT
+    if cache.add(lock, True, timeout):
+        try:
+            return compute()
+        finally:
+            cache.delete(lock)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and cache.has_key(lock):
+        time.sleep(COALESCE_POLL_INTERVAL)
+        result = cache.get(key)
+        if result is not None:
+            return result
+    return compute()
+
+
+def fill_form(form_id, user_input):
+    """
+    Answers to the questions of an enabled form, keyed by question id.
+
+    Concurrent fills of the same input for the same form version share one
+    model call (see ``single_flight``). Forms with more than
+    ``FORM_AI_CHUNK_SIZE`` questions are filled chunk by chunk on a
+    bounded pool. A chunk that keeps failing leaves its questions
+    unanswered (``None``) and the result uncached; the fill only fails when
+    every chunk does.
+    """
+    key, responses, prompt = prepare_fill(form_id, user_input)
+    if responses is not None:
+        return responses
+    return single_flight(key, lambda: _fill(form_id, user_input, key, prompt))
+
+
+def _fill(form_id, user_input, key, prompt):
+    chunks = prompt['chunks']
+    if len(chunks) == 1:
+        responses, complete = fill_chunk(*chunks[0], user_input)
+    else:
+        futures = [get_chunk_executor().submit(fill_chunk, questions, block, user_input) for questions, block in chunks]
+        responses = {}
+        complete = True
+        failures = []
+        for (questions, _), future in zip(chunks, futures):
+            try:
+                answers, chunk_complete = future.result()
+            except AIResponseError as e:
+                failures.append(e)
+                responses.update((question['id'], None) for question in questions)
+                continue
+            responses.update(answers)
+            complete = complete and chunk_complete
+        if len(failures) == len(chunks):
+            raise failures[0]
+        if failures:
+            logger.warning(f"AI fill of form {form_id}: {len(failures)} of {len(chunks)} chunks failed")
+            complete = False
+
+    logger.info(f"AI generated responses for form {form_id}: {responses}")
+    if complete:
+        cache.set(key, responses, settings.FORM_AI_CACHE_TIMEOUT)
+    return responses
+
+
+_fill_slots = weakref.WeakKeyDictionary()
+
+
+def fill_slots():
+    """Semaphore bounding the streamed fills in progress on the running event loop."""
+    loop = asyncio.get_running_loop()
+    slots = _fill_slots.get(loop)
+    if slots is None:
+        slots = _fill_slots[loop] = asyncio.Semaphore(settings.FORM_AI_STREAM_CONCURRENCY)
+    return slots
+
+
+class FillSlot:
+    """
+    One of the ``fill_slots`` held by a streamed fill. ``release`` may be
+    called more than once and from any thread; only the first call counts.
+    """
+
+    def __init__(self, slots, loop):
+        self._slots = slots
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._held = True
+
+    def release(self):
+        with self._lock:
+            if not self._held:
+                return
+            self._held = False
+        try:
+            self._loop.call_soon_threadsafe(self._slots.release)
+        except RuntimeError:
+            # The loop is closed, and its semaphore with it
+            pass
+
+
+async def acquire_fill_slot(timeout):
+    """A ``FillSlot`` of the running loop, or ``None`` if none frees up within ``timeout`` seconds."""
+    slots = fill_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    return FillSlot(slots, asyncio.get_running_loop())
+
+
+class SlotStream:
+    """
+    The events of a streamed fill holding ``slot`` until they are consumed,
+    or until the response is closed if the client goes away before that.
+    """
+
+    def __init__(self, events, slot):
+        self.events = events
+        self.slot = slot
+
+    async def __aiter__(self):
+        try:
+            async for event in self.events:
+                yield event
+        finally:
+            self.slot.release()
+
+    def close(self):
+        self.slot.release()
+
+
+async def stream_answers(block, user_input, timeout, extractor):
+    """
+    Yield ``(question id, value)`` as the model writes them, within
+    ``timeout`` seconds, read by ``extractor``.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    model = get_model()
+    stream = await asyncio.wait_for(
+        model.generate_content_async(build_prompt(block, user_input), stream=True),
+        deadline - loop.time(),
+    )
+    chunks = stream.__aiter__()
+    while True:
+        try:
+            chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+        except StopAsyncIteration:
+            break
+        for member in extractor.feed(chunk.text):
+            yield member
+    for member in extractor.close():
+        yield member
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _replay(responses):
+    for question_id, value in responses.items():
+        yield server_sent_event('answer', {'id': question_id, 'value': value})
+    yield server_sent_event('done', {'responses': responses})
+
+
+def _error_event(error):
+    if isinstance(error, asyncio.TimeoutError):
+        return server_sent_event('error', {'error': 'AI fill timed out'})
+    if isinstance(error, AIResponseError):
+        return server_sent_event('error', {'error': 'Failed to parse AI response', 'details': str(error)})
+    return server_sent_event('error', {'error': 'An error occurred while processing your request'})
+
+
+_streams = {}
+
+
+async def stream_fill(form_id, user_input, key, cached, prompt):
+    """
+    Server-sent events of a fill: one ``answer`` event per question, then
+    ``done`` with all answers, or ``error``.
+
+    Like ``fill_form``, identical fills in flight share one model call: a
+    stream started while the same fill is running in this process replays
+    its answers once it is done, and one running in another process is
+    awaited through the cache lock of ``single_flight``.
+    """
+    if cached is not None:
+        for event in _replay(cached):
+            yield event
+        return
+
+    loop = asyncio.get_running_loop()
+    leader = _streams.get(key)
+    if leader is not None and leader.get_loop() is loop and not leader.done():
+        try:
+            responses = await asyncio.wait_for(asyncio.shield(leader), settings.FORM_AI_STREAM_TIMEOUT)
+        except Exception as e:
+            yield _error_event(e)
+            return
+        for event in _replay(responses):
+            yield event
+        return
+
+    lock = f'{key}:lock'
+    if not await sync_to_async(cache.add)(lock, True, settings.FORM_AI_COALESCE_TIMEOUT):
+        responses = await _await_shared(key, lock)
+        if responses is not None:
+            for event in _replay(responses):
+                yield event
+            return
+        lock = None
+
+    future = _streams[key] = loop.create_future()
+    try:
+        async for event in _lead(form_id, user_input, key, prompt, future):
+            yield event
+    finally:
+        if not future.done():
+            _fail(future, AIResponseError("The fill was abandoned"))
+        if _streams.get(key) is future:
+            del _streams[key]
+        if lock is not None:
+            await sync_to_async(cache.delete)(lock)
+
+
+def _fail(future, error):
+    future.set_exception(error)
+    # Nobody may be waiting; don't log the exception as never retrieved
+    future.exception()
+
+
+async def _await_shared(key, lock):
+    """The answers of a fill running in another process, or ``None`` if they don't arrive."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.FORM_AI_COALESCE_TIMEOUT
+    while loop.time() < deadline and await sync_to_async(cache.has_key)(lock):
+        await asyncio.sleep(COALESCE_POLL_INTERVAL)
+        responses = await sync_to_async(cache.get)(key)
+        if responses is not None:
+            return responses
+    return None
+
+
+async def _lead(form_id, user_input, key, prompt, future):
+    questions = {question['id']: question for question in prompt['questions']}
+    responses = {}
+    extractor = JSONObjectExtractor()
+    try:
+        async for question_id, value in stream_answers(prompt['block'], user_input, settings.FORM_AI_STREAM_TIMEOUT, extractor):
+            if question_id not in questions or question_id in responses:
+                continue
+            try:
+                value = coerce_answer(questions[question_id], value)
+            except (ValueError, TypeError):
+                continue
+            responses[question_id] = value
+            yield server_sent_event('answer', {'id': question_id, 'value': value})
+    except asyncio.TimeoutError as e:
+        logger.warning(f"AI fill of form {form_id} timed out")
+        _fail(future, e)
+        yield _error_event(e)
+        return
+    except AIResponseError as e:
+        logger.error(f"Failed to parse AI response: {str(e)}")
+        _fail(future, e)
+        yield _error_event(e)
+        return
+    except Exception as e:
+        logger.error(f"AI form fill error: {str(e)}", exc_info=True)
+        _fail(future, e)
+        yield _error_event(e)
+        return
+
+    logger.info(f"AI generated responses for form {form_id}: {responses}")
+    missing = unanswered(prompt['questions'], responses)
+    if missing or not extractor.complete:
+        logger.warning(f"AI fill of form {form_id} left {len(missing)} questions unanswered; not cached")
+    else:
+        await sync_to_async(cache.set)(key, responses, settings.FORM_AI_CACHE_TIMEOUT)
+    future.set_result(responses)
+    yield server_sent_event('done', {'responses': responses})
@@ -0,0 +1,335 @@
+"""
+Reading generative model output.
+
+``JSONObjectExtractor`` pulls the members of a JSON object out of model
+output, piece by piece as it streams in. It tolerates what models tend to
+get wrong: text or markdown fences around the object, braces in that
+text, trailing commas, single quotes, Python literals and output cut off
+before the end. A member that cannot be read is skipped instead of failing
+the whole object.
+
+``coerce_answers`` then maps each value onto the type of its question and
+the exact option strings of ``Questions.options``, dropping keys that are
+not questions of the form and values that cannot be mapped.
+"""
+import ast
+import json
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = ' \t\r\n'
+_LITERALS = {'true': True, 'false': False, 'null': None, 'True': True, 'False': False, 'None': None}
+_TRAILING_COMMA = re.compile(r',\s*([\]}])')
+_TRUE = {'true', 'yes', 'y', '1'}
+_FALSE = {'false', 'no', 'n', '0'}
+
+
+class AIResponseError(Exception):
+    """Raised when the model output cannot be used."""
+
+
+def _read_key(text):
+    text = text.strip()
+    if text[:1] == '"':
+        return json.loads(text)
+    if text[:1] == "'" and text[-1:] == "'" and len(text) > 1:
+        return text[1:-1]
+    if text:
+        return text
+    raise ValueError("Empty key")
+
+
+def _read_value(text):
+    text = text.strip()
+    if text in _LITERALS:
+        return _LITERALS[text]
+    for candidate in (text, _TRAILING_COMMA.sub(r'\1', text)):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError) as e:
+        raise ValueError(f"Unreadable value {text[:50]!r}") from e
+
+
+class JSONObjectExtractor:
+    """
+    Incremental, tolerant reader of the first JSON object in model output.
+
+    ``feed`` returns the ``(key, value)`` members completed by the new
+    text; a member is complete once the ``,`` or ``}`` after its value has
+    arrived. ``close`` returns what is left when the output has ended,
+    including a last value cut off without its closing brace, and raises
+    ``AIResponseError`` only when there was no object at all.
+
+    A ``{`` is only a candidate: one whose first key is malformed, or that
+    ends without a single readable member, is dropped and reading resumes
+    at the next ``{``, so braces in prose before the object are passed
+    over. ``complete`` tells whether the object was closed, i.e. whether
+    the output was cut off.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = None
+        self._start = -1
+        self._found = False
+        self._read = 0
+        self.complete = False
+        self.skipped = 0
+
+    def feed(self, text):
+        self._buffer += text
+        return list(self._members(final=False))
+
+    def close(self):
+        members = list(self._members(final=True))
+        if self._pos is None and not self._found:
+            raise AIResponseError("No JSON object in model output")
+        return members
+
+    def _skip(self, pos, chars=_WHITESPACE):
+        while pos < len(self._buffer) and self._buffer[pos] in chars:
+            pos += 1
+        return pos
+
+    def _string_end(self, pos):
+        """Index of the quote closing the string that starts at ``pos``, or ``None``."""
+        buffer, quote = self._buffer, self._buffer[pos]
+        i = pos + 1
+        while i < len(buffer):
+            if buffer[i] == '\\':
+                i += 2
+                continue
+            if buffer[i] == quote:
+                return i
+            i += 1
+        return None
+
+    def _value_end(self, pos):
+        """Index of the ``,`` or ``}`` ending the value at ``pos``, or ``None``."""
+        buffer = self._buffer
+        depth = 0
+        i = pos
+        while i < len(buffer):
+            char = buffer[i]
+            if char in '"\'':
+                end = self._string_end(i)
+                if end is None:
+                    return None
+                i = end
+            elif char in '[{':
+                depth += 1
+            elif char in ']}':
+                if depth == 0 and char == '}':
+                    return i
+                depth = max(depth - 1, 0)
+            elif char == ',' and depth == 0:
+                return i
+            i += 1
+        return None
+
+    def _key_end(self, pos):
+        """Index of the ``:`` after the key at ``pos``; ``None`` if not there yet, -1 if malformed."""
+        buffer = self._buffer
+        if buffer[pos] in '"\'':
+            end = self._string_end(pos)
+            if end is None:
+                return None
+            colon = self._skip(end + 1)
+            if colon >= len(buffer):
+                return None
+            return colon if buffer[colon] == ':' else -1
+        for i in range(pos, len(buffer)):
+            if buffer[i] == ':':
+                return i
+            if buffer[i] in ',{}[]"':
+                return -1
+        return None
+
+    def _candidate(self):
+        """Start reading the next ``{``; ``False`` when there is none (yet)."""
+        start = self._buffer.find('{', self._start + 1)
+        if start < 0:
+            return False
+        self._start = start
+        self._pos = start + 1
+        self._found = True
+        self._read = 0
+        self.skipped = 0
+        self.complete = False
+        return True
+
+    def _drop_candidate(self):
+        self._pos = None
+        return self._candidate()
+
+    def _members(self, final):
+        buffer = self._buffer
+        if self._pos is None and not self._candidate():
+            return
+
+        while not self.complete:
+            pos = self._skip(self._pos, _WHITESPACE + ',')
+            if pos >= len(buffer):
+                return
+            if buffer[pos] == '}':
+                self.complete = True
+                self._pos = pos + 1
+                if not self._read and self._drop_candidate():
+                    continue
+                return
+
+            colon = self._key_end(pos)
+            if colon is None:
+                return
+            if colon == -1 and not self._read and not self.skipped:
+                if self._drop_candidate():
+                    continue
+                return
+            end = self._value_end(pos if colon == -1 else colon + 1)
+            if end is None:
+                if not final:
+                    return
+                end = len(buffer)
+            if colon == -1:
+                self._pos = max(end, pos + 1)
+                self.skipped += 1
+                continue
+            self._pos = end
+
+            try:
+                key = _read_key(buffer[pos:colon])
+                value = _read_value(buffer[colon + 1:end])
+            except ValueError as e:
+                self.skipped += 1
+                logger.debug(f"Skipped model output member: {str(e)}")
+                continue
+            self._read += 1
+            yield key, value
+
+
+def extract_object(text):
+    """All members of the JSON object in ``text`` as a dict."""
+    extractor = JSONObjectExtractor()
+    members = extractor.feed(text)
+    members.extend(extractor.close())
+    return dict(members)
+
+
+def _normalize(text):
+    return ' '.join(text.split()).casefold()
+
+
+def _match_option(options, value):
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f"Not an option: {value!r}")
+    text = str(value).strip()
+    if text in options:
+        return text
+    normalized = _normalize(text)
+    for option in options:
+        if _normalize(option) == normalized:
+            return option
+    raise ValueError(f"Not an option: {value!r}")
+
+
+def _coerce_text(question, value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(f"Not text: {value!r}")
+
+
+def _coerce_number(question, value):
+    if isinstance(value, bool):
+        raise ValueError(f"Not a number: {value!r}")
+    if isinstance(value, str):
+        text = value.strip().replace(',', '').replace(' ', '')
+        value = int(text) if re.fullmatch(r'[+-]?\d+', text) else float(text)
+    if not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"Not a number: {value!r}")
+    return value
+
+
+def _coerce_boolean(question, value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().casefold()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"Not a boolean: {value!r}")
+
+
+def _coerce_choice(question, value):
+    if isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    return _match_option(question.get('options') or [], value)
+
+
+def _coerce_checkbox(question, value):
+    options = question.get('options') or []
+    items = value if isinstance(value, list) else [value]
+    chosen = []
+    for item in items:
+        try:
+            option = _match_option(options, item)
+        except ValueError:
+            continue
+        if option not in chosen:
+            chosen.append(option)
+    if not chosen:
+        raise ValueError(f"No option in {value!r}")
+    return chosen
+
+
+def _coerce_file(question, value):
+    return None
+
+
+_COERCERS = {
+    'text': _coerce_text,
+    'number': _coerce_number,
+    'boolean': _coerce_boolean,
+    'radio': _coerce_choice,
+    'select': _coerce_choice,
+    'checkbox': _coerce_checkbox,
+    'file': _coerce_file,
+}
+
+
+def coerce_answer(question, value):
+    """``value`` mapped onto the type and options of ``question``; ``ValueError`` if it cannot be."""
+    if value is None or value == '' or value == []:
+        return None
+    coercer = _COERCERS.get(question['answer_type'])
+    return coercer(question, value) if coercer else value
+
+
+def coerce_answers(questions, answers):
+    """
+    Coerce model answers onto ``questions`` (the prompt descriptions).
+
+    Returns ``(answers, invalid)``: the answers that could be mapped, keyed
+    by question id, and the ids of questions whose answer could not be.
+    Keys that are not question ids are dropped.
+    """
+    coerced = {}
+    invalid = []
+    for question in questions:
+        if question['id'] not in answers:
+            continue
+        try:
+            coerced[question['id']] = coerce_answer(question, answers[question['id']])
+        except (ValueError, TypeError) as e:
+            invalid.append(question['id'])
+            logger.debug(f"Dropped answer to question {question['id']}: {str(e)}")
+    return coerced, invalid
@@ -0,0 +1,142 @@
+"""
+Normalized answers.
+
+With ``FORM_STORE_ANSWERS`` on, every stored response is also written to the
+``Answer`` table with one typed row per answer (per option for checkboxes),
+in one bulk insert inside the submission transaction. Rows go away with
+their response through the foreign key cascade.
+
+``backfill_answers`` fills the table for responses stored before it was
+switched on. Answers keyed by something other than a question id, or by a
+question that has since been deleted, have nowhere to point and are
+skipped.
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .encoding import ResponseDecoder, is_compact
+from .models import Answer, FormResponse, Questions
+
+logger = logging.getLogger(__name__)
+
+ANSWER_BATCH_SIZE = 500
+
+
+def answers_enabled():
+    return getattr(settings, 'FORM_STORE_ANSWERS', False)
+
+
+def typed_value(answer_type, answer):
+    """Value of a stored answer coerced to the column type of its question."""
+    value = answer.get('value') if isinstance(answer, dict) else None
+    if value is None:
+        return None
+    if answer_type == 'number':
+        if isinstance(value, bool):
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if answer_type == 'boolean':
+        return value if isinstance(value, bool) else None
+    if answer_type == 'checkbox':
+        return [str(item).strip() for item in value] if isinstance(value, list) else None
+    if answer_type in ('radio', 'select'):
+        # Options are compared stripped, see forms.validation
+        return str(value).strip()
+    if answer_type == 'file':
+        return value.get('file_path') if isinstance(value, dict) else None
+    return str(value)
+
+
+def answer_rows(form_response, decoder):
+    """Unsaved ``Answer`` rows for a stored response."""
+    rows = []
+    for question_id, answer in decoder.expand(form_response.response).items():
+        if not isinstance(answer, dict):
+            continue
+        try:
+            question_id = uuid.UUID(str(question_id))
+        except ValueError:
+            continue
+        value = typed_value(answer.get('answer_type'), answer)
+        values = value if isinstance(value, list) else [value]
+        for value in values:
+            row = Answer(response_id=form_response.pk, question_id=question_id)
+            if isinstance(value, bool):
+                row.boolean_value = value
+            elif isinstance(value, float):
+                row.number_value = value
+            elif isinstance(value, str):
+                row.text_value = value.strip()[:Answer.TEXT_MAX_LENGTH]
+            else:
+                continue
+            rows.append(row)
+    return rows
+
+
+def store_answers(form_id, form_responses):
+    """Write the answers of freshly stored responses of a form if the table is enabled."""
+    if not answers_enabled():
+        return
+    decoder = ResponseDecoder(form_id)
+    rows = [row for form_response in form_responses for row in answer_rows(form_response, decoder)]
+    Answer.objects.bulk_create(existing_question_rows(rows), batch_size=ANSWER_BATCH_SIZE)
+
+
+def existing_question_rows(rows):
+    """The rows whose question still exists."""
+    question_ids = {row.question_id for row in rows}
+    existing = set(Questions.objects.filter(id__in=question_ids).values_list('id', flat=True))
+    return [row for row in rows if row.question_id in existing]
+
+
+def backfill_answers(form_ids=None, batch_size=ANSWER_BATCH_SIZE):
+    """Write answers for stored responses that have none yet; returns the number of responses."""
+    responses = FormResponse.objects.filter(~Exists(Answer.objects.filter(response=OuterRef('pk'))))
+    if form_ids:
+        responses = responses.filter(form_id__in=form_ids)
+
+    decoders = {}
+    done = 0
+    skipped = 0
+    batch = []
+    for form_response in responses.only('id', 'form_id', 'response').iterator(chunk_size=batch_size):
+        decoder = decoders.get(form_response.form_id)
+        if decoder is None:
+            decoder = decoders[form_response.form_id] = ResponseDecoder(form_response.form_id)
+        skipped += _non_question_keys(form_response.response)
+        batch.extend(answer_rows(form_response, decoder))
+        done += 1
+        if done % batch_size == 0:
+            skipped += _write_batch(batch)
+            batch = []
+    if batch:
+        skipped += _write_batch(batch)
+    if skipped:
+        logger.warning(f"Skipped {skipped} answers of unknown or deleted questions while backfilling")
+    return done
+
+
+def _non_question_keys(response):
+    answers = response.get('answers') if is_compact(response) else response
+    count = 0
+    for key in answers if isinstance(answers, dict) else ():
+        try:
+            uuid.UUID(str(key))
+        except ValueError:
+            count += 1
+    return count
+
+
+def _write_batch(rows):
+    """Insert the rows of existing questions; returns how many were dropped."""
+    kept = existing_question_rows(rows)
+    with transaction.atomic():
+        Answer.objects.bulk_create(kept, batch_size=ANSWER_BATCH_SIZE)
+    return len(rows) - len(kept)
@@ -0,0 +1,80 @@
+"""
+Deduplicated storage of uploaded files.
+
+Every upload is stored once per SHA-256 digest as a blob named
+``blobs/<aa>/<digest><ext>`` in the ``form_uploads`` storage, and an
+``UploadedBlob`` row counts how many responses point at it. Storing a
+content that already exists only bumps the count; releasing the last
+reference removes the row, with the row locked while deciding, and once
+the transaction commits the file, unless the content was stored again in
+the meantime.
+The digest is computed by ``FormUploadHandler`` while the upload streams
+in, so files are not read a second time.
+"""
+import hashlib
+import logging
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from .models import UploadedBlob
+from .storage import get_upload_storage, safe_extension, delete_upload
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(uploaded_file):
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def store_upload(uploaded_file, digest=None):
+    """Store an uploaded file, or reference the existing copy, and return its name."""
+    digest = digest or file_digest(uploaded_file)
+
+    if UploadedBlob.objects.filter(digest=digest).update(ref_count=F('ref_count') + 1):
+        return UploadedBlob.objects.filter(digest=digest).values_list('name', flat=True).get()
+
+    storage = get_upload_storage()
+    name = storage.save(f"blobs/{digest[:2]}/{digest}{safe_extension(uploaded_file.name)}", uploaded_file)
+    try:
+        with transaction.atomic():
+            UploadedBlob.objects.create(digest=digest, name=name, size=uploaded_file.size, ref_count=1)
+    except IntegrityError:
+        # Stored concurrently by another request; keep that copy
+        if storage.exists(name) and not UploadedBlob.objects.filter(name=name).exists():
+            storage.delete(name)
+        UploadedBlob.objects.filter(digest=digest).update(ref_count=F('ref_count') + 1)
+        return UploadedBlob.objects.filter(digest=digest).values_list('name', flat=True).get()
+    return name
+
+
+def release_upload(name):
+    """Drop one reference to a stored upload, removing it with the last one."""
+    with transaction.atomic():
+        blob = UploadedBlob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            # Uploads stored before deduplication have no blob row
+            transaction.on_commit(lambda: _delete_unreferenced(name))
+            return
+
+        if blob.ref_count > 1:
+            UploadedBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+
+        blob.delete()
+        transaction.on_commit(lambda: _delete_unreferenced(name))
+        logger.info(f"Released last reference to {name}")
+
+
+def _delete_unreferenced(name):
+    """Delete a released upload unless a blob row references it again."""
+    with transaction.atomic():
+        if UploadedBlob.objects.select_for_update().filter(name=name).exists():
+            logger.info(f"Keeping {name}, it was stored again")
+            return
+        delete_upload(name)
@@ -0,0 +1,112 @@
+"""
+Form schema cache.
+
+A form's serialized definition is cached under a key that includes its
+*version*: a digest of ``Form.updated_at`` and the ``FormQuestion`` /
+``Questions`` rows it is made of. The version itself is cached too, so a
+hot form is served without touching the database. Signals in
+``forms.signals`` drop the cached version whenever one of those rows is
+saved or deleted, which makes the next read rebuild it.
+"""
+import hashlib
+import logging
+
+from django.core.cache import cache
+
+from utils.cache import cache_key, FORMS, AGGREGATES
+from .models import Form, FormQuestion
+from .serializers import FormSerializer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(form_id):
+    return cache_key(FORMS, 'version', form_id)
+
+
+def _schema_key(form_id, version):
+    return cache_key(FORMS, 'schema', form_id, version)
+
+
+def statistics_key(form_id):
+    return cache_key(AGGREGATES, 'statistics', form_id)
+
+
+def compute_form_version(form_id):
+    """
+    Build the version entry of an enabled form from the database.
+
+    Returns a dict with ``version`` (hex digest) and ``last_modified``
+    (the most recent ``updated_at`` among the form, its form questions and
+    their questions), or ``None`` if the form is missing or disabled.
+    """
+    form_updated_at = Form.objects.filter(id=form_id, enable=True).values_list('updated_at', flat=True).first()
+    if form_updated_at is None:
+        return None
+
+    rows = FormQuestion.objects.filter(form_id=form_id).order_by('id').values_list(
+        'id', 'form_index', 'updated_at', 'question_id', 'question__updated_at'
+    )
+
+    digest = hashlib.sha256(f"{form_id}:{form_updated_at.isoformat()}".encode())
+    last_modified = form_updated_at
+    for fq_id, form_index, fq_updated_at, question_id, question_updated_at in rows:
+        digest.update(f"|{fq_id}:{form_index}:{fq_updated_at.isoformat()}:{question_id}:{question_updated_at.isoformat()}".encode())
+        last_modified = max(last_modified, fq_updated_at, question_updated_at)
+
+    return {
+        'version': digest.hexdigest()[:32],
+        'last_modified': last_modified,
+    }
+
+
+def get_form_version(form_id):
+    """Return the cached version entry of a form, computing it on a miss."""
+    key = _version_key(form_id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = compute_form_version(form_id)
+        if entry is not None:
+            cache.set(key, entry, SCHEMA_CACHE_TIMEOUT)
+    return entry
+
+
+def form_etag(request, form_id):
+    """``etag_func`` for ``django.views.decorators.http.condition``."""
+    entry = get_form_version(form_id)
+    return entry['version'] if entry else None
+
+
+def form_last_modified(request, form_id):
+    """``last_modified_func`` for ``django.views.decorators.http.condition``."""
+    entry = get_form_version(form_id)
+    return entry['last_modified'] if entry else None
+
+
+def get_form_schema(form_id):
+    """
+    Return the serialized definition of an enabled form, or ``None``.
+
+    Cached schemas are served without any database query.
+    """
+    entry = get_form_version(form_id)
+    if entry is None:
+        return None
+
+    key = _schema_key(form_id, entry['version'])
+    data = cache.get(key)
+    if data is None:
+        form = Form.objects.filter(id=form_id, enable=True).first()
+        if form is None:
+            return None
+        data = FormSerializer(form).data
+        cache.set(key, data, SCHEMA_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_form(form_id):
+    """Forget the cached version and statistics of a form so the next read rebuilds them."""
+    cache.delete_many([_version_key(form_id), statistics_key(form_id)])
+    logger.debug(f"Invalidated schema cache for form {form_id}")
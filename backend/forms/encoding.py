@@ -0,0 +1,129 @@
+"""
+Storage format of ``FormResponse.response``.
+
+Responses used to be stored *expanded*: every answer repeated the question
+text, answer type and required flag next to its value. New responses are
+stored *compact*, with the values keyed by question id only::
+
+    {"version": 2, "answers": {"<question id>": <value>, ...}}
+
+The rest is joined back at read time from the validation plan of the form,
+which is cached per form version (see ``forms.validation``), so the schema
+costs no query for a warm form. Readers go through ``ResponseDecoder`` and
+always see the expanded shape whatever the stored format;
+``compact_responses`` rewrites stored rows in either direction.
+"""
+import uuid
+
+from django.db import transaction
+
+from .models import FormResponse, Questions
+from .validation import compile_validation_plan, get_validation_plan
+
+COMPACT_VERSION = 2
+REWRITE_BATCH_SIZE = 500
+
+
+def is_compact(response):
+    return isinstance(response, dict) and response.get('version') == COMPACT_VERSION and isinstance(response.get('answers'), dict)
+
+
+def compact_response(response):
+    """Compact form of an expanded (or already compact) response."""
+    if is_compact(response):
+        return response
+    answers = {}
+    for question_id, answer in (response or {}).items():
+        answers[str(question_id)] = answer.get('value') if isinstance(answer, dict) else answer
+    return {'version': COMPACT_VERSION, 'answers': answers}
+
+
+class ResponseDecoder:
+    """
+    Expands stored responses of one form.
+
+    Expanded answers share their ``value`` with the stored response, so a
+    change made to a value through them is saved with the response.
+    """
+
+    def __init__(self, form_id):
+        # Disabled forms have no cached plan but still have responses to read
+        self.plan = get_validation_plan(form_id) or compile_validation_plan(form_id)
+        self._removed = {}
+
+    def expand(self, response):
+        if not is_compact(response):
+            return response if isinstance(response, dict) else {}
+
+        answers = response['answers']
+        self._load_removed(answers)
+        expanded = {}
+        for question_id, value in answers.items():
+            rule = self.plan.get(question_id) or self._removed.get(question_id)
+            expanded[question_id] = {
+                'question': rule.question if rule else None,
+                'answer_type': rule.answer_type if rule else None,
+                'value': value,
+                'required': rule.required if rule else False,
+            }
+        return expanded
+
+    def _load_removed(self, answers):
+        """Look up questions answered before they were taken off the form."""
+        missing = [q for q in answers if q not in self.plan and q not in self._removed]
+        if not missing:
+            return
+        ids = []
+        for q in missing:
+            self._removed[q] = None
+            try:
+                ids.append(uuid.UUID(q))
+            except ValueError:
+                continue
+        for question in Questions.objects.filter(id__in=ids):
+            self._removed[str(question.id)] = question
+
+
+def expand_response(form_id, response):
+    """Expanded shape of a single stored response."""
+    return ResponseDecoder(form_id).expand(response)
+
+
+def compact_responses(form_ids=None, expand=False, batch_size=REWRITE_BATCH_SIZE):
+    """
+    Rewrite stored responses to the compact format, or back with ``expand``.
+
+    Works in batches of ``batch_size`` rows, one transaction and one
+    ``bulk_update`` per batch, leaving ``updated_at`` untouched. Returns the
+    number of rewritten responses.
+    """
+    responses = FormResponse.objects.order_by('form_id', 'id').only('id', 'form_id', 'response')
+    if form_ids:
+        responses = responses.filter(form_id__in=form_ids)
+
+    decoders = {}
+    rewritten = 0
+    batch = []
+    for form_response in responses.iterator(chunk_size=batch_size):
+        if is_compact(form_response.response) != expand:
+            continue
+        if expand:
+            decoder = decoders.get(form_response.form_id)
+            if decoder is None:
+                decoder = decoders[form_response.form_id] = ResponseDecoder(form_response.form_id)
+            form_response.response = decoder.expand(form_response.response)
+        else:
+            form_response.response = compact_response(form_response.response)
+        batch.append(form_response)
+        if len(batch) == batch_size:
+            rewritten += _rewrite(batch)
+            batch = []
+    if batch:
+        rewritten += _rewrite(batch)
+    return rewritten
+
+
+def _rewrite(form_responses):
+    with transaction.atomic():
+        FormResponse.objects.bulk_update(form_responses, ['response'])
+    return len(form_responses)
@@ -0,0 +1,226 @@
+"""
+Streaming export of form responses.
+
+Responses are read with a server-side cursor (``iterator(chunk_size=...)``)
+and written out as they arrive, so memory stays flat however many responses
+a form has. Every format has one column per question, ordered by
+``FormQuestion.form_index`` and preceded by the response id and submission
+time:
+
+* ``csv`` with answers flattened to text, and text that a spreadsheet
+  would run as a formula prefixed with ``'``,
+* ``ndjson`` with one JSON object per response keyed by question id,
+* ``xlsx`` written as a zip stream of inline-string worksheet rows, so no
+  spreadsheet library and no temporary file is needed.
+"""
+import csv
+import io
+import json
+import math
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils.text import slugify
+
+from .encoding import ResponseDecoder
+from .models import FormQuestion, FormResponse
+from .storage import upload_url
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FORMATS = ('csv', 'ndjson', 'xlsx')
+
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def export_columns(form_id):
+    """Questions of a form in form order."""
+    form_questions = FormQuestion.objects.filter(form_id=form_id).select_related('question').order_by('form_index')
+    return [fq.question for fq in form_questions]
+
+
+def iter_responses(form_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield ``(id, created_at, response)`` of a form's expanded responses, oldest first."""
+    decoder = ResponseDecoder(form_id)
+    responses = FormResponse.objects.filter(form_id=form_id).order_by('created_at', 'id')
+    for response_id, created_at, response in responses.values_list('id', 'created_at', 'response').iterator(chunk_size=chunk_size):
+        yield response_id, created_at, decoder.expand(response)
+
+
+def answer_value(answer):
+    """JSON value of a stored answer, with files replaced by their name and URL."""
+    if not isinstance(answer, dict):
+        return None
+    value = answer.get('value')
+    if answer.get('answer_type') == 'file':
+        if isinstance(value, dict) and value.get('file_path'):
+            return {'name': value.get('original_name') or value.get('name'), 'url': upload_url(value['file_path'])}
+        return None
+    return value
+
+
+def answer_text(answer):
+    """Flat value of a stored answer for a spreadsheet cell."""
+    value = answer_value(answer)
+    if value is None:
+        return ''
+    if isinstance(value, dict):
+        return value.get('url') or ''
+    if isinstance(value, list):
+        return '; '.join(str(item) for item in value)
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    return value
+
+
+def _header(questions):
+    return ['Response ID', 'Submitted At'] + [q.question for q in questions]
+
+
+def _rows(form_id, questions, chunk_size):
+    keys = [str(q.id) for q in questions]
+    for response_id, created_at, response in iter_responses(form_id, chunk_size):
+        yield [str(response_id), created_at.isoformat()] + [answer_text(response.get(key)) for key in keys]
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the written data back."""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    """``value`` with a ``'`` in front if it is text a spreadsheet would read as a formula."""
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(form_id, questions, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([csv_cell(value) for value in _header(questions)])
+    for row in _rows(form_id, questions, chunk_size):
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+def stream_ndjson(form_id, questions, chunk_size=EXPORT_CHUNK_SIZE):
+    keys = [str(q.id) for q in questions]
+    for response_id, created_at, response in iter_responses(form_id, chunk_size):
+        line = {
+            'id': str(response_id),
+            'submitted_at': created_at.isoformat(),
+            'answers': {key: answer_value(response.get(key)) for key in keys},
+        }
+        yield json.dumps(line, default=str) + '\n'
+
+
+class _ZipStream(io.RawIOBase):
+    """Unseekable sink for ``zipfile`` that keeps written bytes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Responses" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    # NaN and infinities are not valid numeric cells; they fall through to text
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+        return f'<c t="n"><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(form_id, questions, chunk_size=EXPORT_CHUNK_SIZE):
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        yield sink.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(_header(questions)).encode())
+            for count, row in enumerate(_rows(form_id, questions, chunk_size), 1):
+                sheet.write(_xlsx_row(row).encode())
+                if count % chunk_size == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+_STREAMS = {
+    'csv': (stream_csv, 'text/csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def export_response(form, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """``StreamingHttpResponse`` with all responses of ``form`` as an attachment."""
+    if export_format not in _STREAMS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    stream, content_type = _STREAMS[export_format]
+    questions = export_columns(form.id)
+    response = StreamingHttpResponse(stream(form.id, questions, chunk_size), content_type=content_type)
+    filename = f"{slugify(form.name) or 'form'}-responses.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
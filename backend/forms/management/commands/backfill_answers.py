@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from forms.answers import backfill_answers, ANSWER_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Write Answer rows for stored responses that have none yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', action='append', dest='forms', help="Only backfill this form id (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=ANSWER_BATCH_SIZE, help="Responses written per transaction")
+
+    def handle(self, *args, **options):
+        done = backfill_answers(options['forms'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Backfilled answers of {done} responses"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from forms.encoding import compact_responses, REWRITE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Rewrite stored form responses to the compact format (or back with --expand)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', action='append', dest='forms', help="Only rewrite responses of this form id (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=REWRITE_BATCH_SIZE, help="Responses updated per transaction")
+        parser.add_argument('--expand', action='store_true', help="Rewrite compact responses back to the expanded format")
+
+    def handle(self, *args, **options):
+        rewritten = compact_responses(options['forms'], expand=options['expand'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rewrote {rewritten} responses"))
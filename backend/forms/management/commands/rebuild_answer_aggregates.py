@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from forms.aggregates import rebuild_form_aggregates
+from forms.models import Form
+
+
+class Command(BaseCommand):
+    help = "Rebuild the answer statistics of forms from their stored responses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', action='append', dest='forms', help="Only rebuild this form id (repeatable)")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Responses read per query")
+
+    def handle(self, *args, **options):
+        forms = Form.objects.all()
+        if options['forms']:
+            forms = forms.filter(id__in=options['forms'])
+
+        for form in forms.iterator():
+            rows = rebuild_form_aggregates(form.id, chunk_size=options['chunk_size'])
+            self.stdout.write(f"{form.name}: {rows} aggregate rows")
+
+        self.stdout.write(self.style.SUCCESS("Answer statistics rebuilt"))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from forms.models import Form
+from forms.snapshots import snapshot_form, SnapshotUnavailable, SNAPSHOT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Append new form responses to the columnar snapshots in FORM_SNAPSHOT_DIR"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', action='append', dest='forms', help="Only snapshot this form id (repeatable)")
+        parser.add_argument('--full', action='store_true', help="Discard existing snapshots and start over")
+        parser.add_argument('--chunk-size', type=int, default=SNAPSHOT_CHUNK_SIZE, help="Responses per query and row group")
+        parser.add_argument('--every', type=int, default=0, metavar='SECONDS', help="Keep running, taking a snapshot every SECONDS")
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            self.snapshot(options['forms'], full, options['chunk_size'])
+            if not options['every']:
+                break
+            # Only the first run of a scheduled job is a full rebuild
+            full = False
+            close_old_connections()
+            time.sleep(options['every'])
+
+    def snapshot(self, form_ids, full, chunk_size):
+        forms = Form.objects.all()
+        if form_ids:
+            forms = forms.filter(id__in=form_ids)
+
+        total = 0
+        for form in forms.iterator():
+            try:
+                rows = snapshot_form(form.id, full=full, chunk_size=chunk_size)
+            except SnapshotUnavailable as e:
+                raise CommandError(str(e)) from e
+            if rows:
+                self.stdout.write(f"{form.name}: {rows} responses")
+            total += rows
+
+        self.stdout.write(self.style.SUCCESS(f"Snapshotted {total} responses"))
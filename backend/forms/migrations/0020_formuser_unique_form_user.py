@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_form_users(apps, schema_editor):
+    # Keep the earliest FormUser per (user, form) so the constraint can be added
+    FormUser = apps.get_model('forms', 'FormUser')
+    duplicates = (
+        FormUser.objects.values('user_id', 'form_id')
+        .annotate(total=models.Count('id'), first_id=models.Min('id'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        FormUser.objects.filter(
+            user_id=duplicate['user_id'], form_id=duplicate['form_id']
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0019_alter_formresponse_form'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_form_users, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='formuser',
+            constraint=models.UniqueConstraint(fields=('user', 'form'), name='unique_form_user'),
+        ),
+    ]
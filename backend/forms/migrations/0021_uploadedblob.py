@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0020_formuser_unique_form_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadedBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Storage Name')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Size')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='References')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+        ),
+    ]
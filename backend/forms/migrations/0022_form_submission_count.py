@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:26
+
+from django.db import migrations, models
+
+
+def count_submissions(apps, schema_editor):
+    Form = apps.get_model('forms', 'Form')
+    FormUser = apps.get_model('forms', 'FormUser')
+    counts = FormUser.objects.values('form_id').annotate(total=models.Count('id'))
+    for row in counts:
+        Form.objects.filter(pk=row['form_id']).update(submission_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0021_uploadedblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='form',
+            name='submission_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Submission Count'),
+        ),
+        migrations.RunPython(count_submissions, migrations.RunPython.noop),
+    ]
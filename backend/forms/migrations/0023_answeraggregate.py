@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def aggregate_answers(apps, schema_editor):
+    from forms.aggregates import collect_deltas
+
+    AnswerAggregate = apps.get_model('forms', 'AnswerAggregate')
+    Form = apps.get_model('forms', 'Form')
+    FormResponse = apps.get_model('forms', 'FormResponse')
+    Questions = apps.get_model('forms', 'Questions')
+    question_ids = {str(pk) for pk in Questions.objects.values_list('id', flat=True)}
+
+    for form_id in Form.objects.values_list('id', flat=True):
+        responses = FormResponse.objects.filter(form_id=form_id).values_list('response', flat=True)
+        deltas = collect_deltas(responses.iterator(chunk_size=500))
+        AnswerAggregate.objects.bulk_create([
+            AnswerAggregate(
+                form_id=form_id,
+                question_id=question_id,
+                option=option,
+                count=delta.count,
+                total=delta.total,
+                sum_squares=delta.sum_squares,
+                minimum=delta.minimum,
+                maximum=delta.maximum,
+            )
+            for (question_id, option), delta in deltas.items()
+            if question_id in question_ids
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0022_form_submission_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('option', models.CharField(blank=True, default='', max_length=500, verbose_name='Option')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Count')),
+                ('total', models.FloatField(default=0, verbose_name='Sum')),
+                ('sum_squares', models.FloatField(default=0, verbose_name='Sum of Squares')),
+                ('minimum', models.FloatField(blank=True, null=True, verbose_name='Minimum')),
+                ('maximum', models.FloatField(blank=True, null=True, verbose_name='Maximum')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_aggregates', to='forms.form')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='forms.questions')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('form', 'question', 'option'), name='unique_answer_aggregate')],
+            },
+        ),
+        migrations.RunPython(aggregate_answers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0023_answeraggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Answer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_value', models.CharField(blank=True, max_length=500, null=True, verbose_name='Text')),
+                ('number_value', models.FloatField(blank=True, null=True, verbose_name='Number')),
+                ('boolean_value', models.BooleanField(blank=True, null=True, verbose_name='Boolean')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='forms.questions')),
+                ('response', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='forms.formresponse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['question', 'text_value'], name='answer_question_text'), models.Index(fields=['question', 'number_value'], name='answer_question_number'), models.Index(fields=['question', 'boolean_value'], name='answer_question_boolean')],
+            },
+        ),
+    ]
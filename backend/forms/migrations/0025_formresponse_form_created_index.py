@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0024_answer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='formresponse',
+            index=models.Index(fields=['form', 'created_at', 'id'], name='response_form_created'),
+        ),
+    ]
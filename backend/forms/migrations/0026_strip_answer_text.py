@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:52
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def strip_text_values(apps, schema_editor):
+    """Strip the text of Answer rows written before values were stored stripped."""
+    Answer = apps.get_model('forms', 'Answer')
+    padded = Answer.objects.filter(text_value__regex=r'^\s|\s$').only('id', 'text_value')
+    batch = []
+    for answer in padded.iterator(chunk_size=BATCH_SIZE):
+        answer.text_value = answer.text_value.strip()
+        batch.append(answer)
+        if len(batch) == BATCH_SIZE:
+            Answer.objects.bulk_update(batch, ['text_value'])
+            batch = []
+    Answer.objects.bulk_update(batch, ['text_value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0025_formresponse_form_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_text_values, migrations.RunPython.noop),
+    ]
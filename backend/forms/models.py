@@ -1,17 +1,21 @@
-from django.db import models
+from django.db import models, transaction
 from organisation.models import *
 
-from django.conf import settings
-
 from authentication.models import User
 
-import uuid, os
+import uuid
 import logging
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
 # Create your models here.
+class FormQuerySet(models.QuerySet):
+    def with_submission_count(self):
+        """Annotate each form with its exact number of submissions as ``submissions``"""
+        return self.annotate(submissions=models.Count('formuser'))
+
+
 class Form(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
     enable = models.BooleanField("Enable", default=False)
@@ -20,9 +24,23 @@ class Form(models.Model):
     department = models.ManyToManyField(Department)
     group = models.ManyToManyField(Group)
     
+    # Denormalized count of FormUser rows, kept in step by the submission path
+    submission_count = models.PositiveIntegerField("Submission Count", default=0, editable=False)
+    
     created_at = models.DateTimeField("Created At", auto_now_add=True)
     updated_at = models.DateTimeField("Updated At", auto_now=True)
     
+    objects = FormQuerySet.as_manager()
+    
+    def save(self, *args, **kwargs):
+        # Never write back a stale submission_count loaded before a submission
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'submission_count'
+            ]
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return self.name
     
@@ -98,9 +116,68 @@ class FormUser(models.Model):
     created_at = models.DateTimeField("Created At", auto_now_add=True)
     updated_at = models.DateTimeField("Updated At", auto_now=True)
     
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'form'], name='unique_form_user'),
+        ]
+    
     def __str__(self):
         return f"{self.user.get_name()} - {self.form.name}"
     
+class AnswerAggregate(models.Model):
+    """
+    Running statistics of the answers to one question of a form.
+    
+    Option questions (radio, select, checkbox) have one row per option and
+    booleans one row per value, holding a count. Number questions have a
+    single row with an empty option and count, sum, sum of squares, min
+    and max.
+    """
+    form = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='answer_aggregates')
+    question = models.ForeignKey(Questions, on_delete=models.CASCADE)
+    option = models.CharField("Option", max_length=500, blank=True, default='')
+    
+    count = models.BigIntegerField("Count", default=0)
+    total = models.FloatField("Sum", default=0)
+    sum_squares = models.FloatField("Sum of Squares", default=0)
+    minimum = models.FloatField("Minimum", null=True, blank=True)
+    maximum = models.FloatField("Maximum", null=True, blank=True)
+    
+    updated_at = models.DateTimeField("Updated At", auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['form', 'question', 'option'], name='unique_answer_aggregate'),
+        ]
+    
+    def __str__(self):
+        return f"{self.question} - {self.option}: {self.count}"
+    
+class UploadedBlob(models.Model):
+    """A stored upload, shared by every response that uploaded the same content"""
+    digest = models.CharField("SHA-256", max_length=64, unique=True)
+    name = models.CharField("Storage Name", max_length=255, unique=True)
+    size = models.BigIntegerField("Size", default=0)
+    ref_count = models.PositiveIntegerField("References", default=0)
+    
+    created_at = models.DateTimeField("Created At", auto_now_add=True)
+    updated_at = models.DateTimeField("Updated At", auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+    
+class FormResponseQuerySet(models.QuerySet):
+    def with_answer(self, question_id, value):
+        """Responses answering ``question_id`` with ``value``, looked up in the Answer table; text is compared stripped"""
+        if isinstance(value, bool):
+            lookup = {'boolean_value': value}
+        elif isinstance(value, (int, float)):
+            lookup = {'number_value': value}
+        else:
+            lookup = {'text_value': str(value).strip()[:Answer.TEXT_MAX_LENGTH]}
+        return self.filter(id__in=Answer.objects.filter(question_id=question_id, **lookup).values('response_id'))
+
+
 class FormResponse(models.Model):
     id = models.UUIDField(default=uuid.uuid1, editable=False, primary_key=True, unique=True)
     form = models.ForeignKey(Form, on_delete=models.CASCADE, related_name="form_user_response")
@@ -109,36 +186,78 @@ class FormResponse(models.Model):
     created_at = models.DateTimeField("Created At", auto_now_add=True)
     updated_at = models.DateTimeField("Updated At", auto_now=True)
     
+    objects = FormResponseQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Keyset pages of a form's responses, see FormAdmin.responses_view
+            models.Index(fields=['form', 'created_at', 'id'], name='response_form_created'),
+        ]
+    
     def __str__(self):
         return f"{id}-{self.form.name}"
     
+    def expanded_response(self):
+        """The response with question, answer type and required flag of every answer, see forms.encoding"""
+        from .encoding import expand_response
+        return expand_response(self.form_id, self.response)
+    
+    def uploaded_files(self):
+        """Storage names of the files uploaded with this response"""
+        names = []
+        for response in self.expanded_response().values():
+            if not isinstance(response, dict):
+                continue
+            # Answers of deleted questions decode without an answer type, so
+            # the shape of the value decides
+            value = response.get('value')
+            if isinstance(value, dict) and value.get('file_path'):
+                names.append(value['file_path'])
+            elif response.get('answer_type') == 'file':
+                logger.warning(f"Invalid file response structure: {response}")
+        return names
+    
     def delete(self, using=None, keep_parents=False):
-        try:
-            file_responses = []
-            for response in self.response.values():
-                if isinstance(response, dict) and response.get('answer_type') == 'file':
-                    file_responses.append(response)
-            
-            for file_response in file_responses:
-                try:
-                    file_value = file_response.get('value', {})
-                    if isinstance(file_value, dict) and 'file_path' in file_value:
-                        file_path = file_value['file_path']
-                        upload_path = os.path.join(settings.MEDIA_ROOT, file_path)
-                        
-                        if os.path.exists(upload_path):
-                            os.remove(upload_path)
-                            logger.info(f"Successfully deleted file: {upload_path}")
-                        else:
-                            logger.warning(f"File not found during deletion: {upload_path}")
-                    else:
-                        logger.warning(f"Invalid file response structure: {file_response}")
-                except (OSError, IOError) as e:
-                    logger.error(f"Error deleting file {upload_path}: {str(e)}")
-                except Exception as e:
-                    logger.error(f"Unexpected error processing file response: {str(e)}")
-                    
-        except Exception as e:
-            logger.error(f"Error in FormResponse delete method: {str(e)}")
+        from .aggregates import remove_response
+        from .blobs import release_upload
         
-        return super().delete(using=using, keep_parents=keep_parents)
\ No newline at end of file
+        # Uploads are released in the same transaction as the row, so a failed
+        # delete keeps its files; the files themselves go after commit
+        with transaction.atomic(using=using):
+            remove_response(self)
+            file_paths = self.uploaded_files()
+            deleted = super().delete(using=using, keep_parents=keep_parents)
+            for file_path in file_paths:
+                release_upload(file_path)
+            return deleted
+
+
+class Answer(models.Model):
+    """
+    One answer of a response in typed, indexed columns.
+    
+    Written next to ``FormResponse.response`` when ``FORM_STORE_ANSWERS`` is
+    on, so responses can be filtered by answer with B-tree indexes instead
+    of JSON scans. Checkbox answers get one row per selected option, file
+    answers store the upload name and long text is kept as a prefix; the
+    JSON stays the source of truth.
+    """
+    TEXT_MAX_LENGTH = 500
+    
+    response = models.ForeignKey(FormResponse, on_delete=models.CASCADE, related_name='answers')
+    question = models.ForeignKey(Questions, on_delete=models.CASCADE, related_name='answers')
+    
+    text_value = models.CharField("Text", max_length=TEXT_MAX_LENGTH, null=True, blank=True)
+    number_value = models.FloatField("Number", null=True, blank=True)
+    boolean_value = models.BooleanField("Boolean", null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['question', 'text_value'], name='answer_question_text'),
+            models.Index(fields=['question', 'number_value'], name='answer_question_number'),
+            models.Index(fields=['question', 'boolean_value'], name='answer_question_boolean'),
+        ]
+    
+    def __str__(self):
+        value = next((v for v in (self.text_value, self.number_value, self.boolean_value) if v is not None), None)
+        return f"{self.question_id}: {value}"
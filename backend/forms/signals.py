@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Form, Questions, FormQuestion, FormUser
+from .cache import invalidate_form
+
+
+def invalidate_form_after_commit(form_id):
+    # Now for reads inside the transaction, and again once it commits: a
+    # request racing the commit may have cached the old rows in between
+    invalidate_form(form_id)
+    transaction.on_commit(lambda: invalidate_form(form_id))
+
+
+@receiver([post_save, post_delete], sender=Form)
+def invalidate_form_on_change(sender, instance, **kwargs):
+    invalidate_form_after_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=FormQuestion)
+def invalidate_form_on_form_question_change(sender, instance, **kwargs):
+    invalidate_form_after_commit(instance.form_id)
+
+
+@receiver([post_save, post_delete], sender=Questions)
+def invalidate_forms_on_question_change(sender, instance, **kwargs):
+    # A question can be shared by several forms
+    form_ids = FormQuestion.objects.filter(question=instance).values_list('form_id', flat=True)
+    for form_id in form_ids:
+        invalidate_form_after_commit(form_id)
+
+
+# FormUser rows created with bulk_create send no signal; record_submissions
+# updates the counter itself
+@receiver(post_save, sender=FormUser)
+def count_submission(sender, instance, created, **kwargs):
+    if created:
+        Form.objects.filter(pk=instance.form_id).update(submission_count=F('submission_count') + 1)
+
+
+@receiver(post_delete, sender=FormUser)
+def uncount_submission(sender, instance, **kwargs):
+    Form.objects.filter(pk=instance.form_id, submission_count__gt=0).update(submission_count=F('submission_count') - 1)
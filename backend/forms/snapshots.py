@@ -0,0 +1,178 @@
+"""
+Columnar snapshots of form responses for analytics.
+
+Each form is materialised under ``FORM_SNAPSHOT_DIR/<form id>/`` as a
+Parquet dataset with one typed column per question, so analysts can read
+responses without scanning the ``FormResponse.response`` JSON in the
+primary database.
+
+Snapshots are incremental: ``_watermark.json`` records the
+``(created_at, id)`` of the last exported response and every run appends
+one ``part-NNNNNN.parquet`` file with the responses after it, written
+under a ``_``-prefixed name that dataset readers ignore until it is
+complete. Responses newer than ``SNAPSHOT_LAG`` are left for the next
+run, so rows committed late by slower transactions are not skipped.
+Deleted responses are only dropped by a full rebuild.
+
+The watermark also records the columns of the snapshot. When questions are
+added, removed or change type, the parts would no longer share one schema,
+so the next run rebuilds the snapshot in full instead of appending.
+
+Writing Parquet needs ``pyarrow``, which is imported lazily.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .answers import typed_value
+from .encoding import ResponseDecoder
+from .export import export_columns
+from .models import FormResponse
+
+SNAPSHOT_CHUNK_SIZE = 1000
+SNAPSHOT_LAG = timedelta(minutes=1)
+WATERMARK_FILE = '_watermark.json'
+
+
+class SnapshotUnavailable(Exception):
+    """Raised when pyarrow is not installed."""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise SnapshotUnavailable("Response snapshots require pyarrow to be installed") from e
+    return pyarrow
+
+
+def snapshot_dir(form_id):
+    return os.path.join(settings.FORM_SNAPSHOT_DIR, str(form_id))
+
+
+def read_watermark(form_id):
+    """Return the watermark of a form's snapshot, or ``None`` if there is none yet."""
+    try:
+        with open(os.path.join(snapshot_dir(form_id), WATERMARK_FILE)) as f:
+            watermark = json.load(f)
+    except FileNotFoundError:
+        return None
+    watermark['created_at'] = datetime.fromisoformat(watermark['created_at'])
+    return watermark
+
+
+def write_watermark(form_id, watermark):
+    path = os.path.join(snapshot_dir(form_id), WATERMARK_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({**watermark, 'created_at': watermark['created_at'].isoformat()}, f)
+    os.replace(path + '.tmp', path)
+
+
+def pending_responses(form_id, watermark=None, until=None, chunk_size=SNAPSHOT_CHUNK_SIZE):
+    """Yield ``(id, created_at, response)`` after ``watermark`` and up to ``until``, oldest first."""
+    responses = FormResponse.objects.filter(form_id=form_id)
+    if watermark:
+        responses = responses.filter(
+            Q(created_at__gt=watermark['created_at']) | Q(created_at=watermark['created_at'], id__gt=watermark['id'])
+        )
+    if until:
+        responses = responses.filter(created_at__lte=until)
+    responses = responses.order_by('created_at', 'id').values_list('id', 'created_at', 'response')
+    return responses.iterator(chunk_size=chunk_size)
+
+
+def snapshot_schema(questions):
+    pa = _pyarrow()
+    types = {
+        'number': pa.float64(),
+        'boolean': pa.bool_(),
+        'checkbox': pa.list_(pa.string()),
+    }
+    fields = [
+        pa.field('response_id', pa.string(), nullable=False),
+        pa.field('submitted_at', pa.timestamp('us', tz='UTC'), nullable=False),
+    ]
+    fields += [pa.field(str(q.id), types.get(q.answer_type, pa.string())) for q in questions]
+    labels = {str(q.id): q.question for q in questions}
+    return pa.schema(fields, metadata={'questions': json.dumps(labels)})
+
+
+def schema_columns(schema):
+    """Digest of the column names and types of ``schema``; labels do not count."""
+    columns = [(field.name, str(field.type)) for field in schema]
+    return hashlib.sha256(json.dumps(columns).encode()).hexdigest()
+
+
+def snapshot_form(form_id, full=False, chunk_size=SNAPSHOT_CHUNK_SIZE):
+    """
+    Append the responses of a form created since the last run to its snapshot.
+
+    With ``full``, or when the columns changed since the last run, the
+    existing snapshot is discarded first. Returns the number of responses
+    written.
+    """
+    pa = _pyarrow()
+    directory = snapshot_dir(form_id)
+    os.makedirs(directory, exist_ok=True)
+
+    questions = export_columns(form_id)
+    schema = snapshot_schema(questions)
+    columns_digest = schema_columns(schema)
+    watermark = read_watermark(form_id)
+
+    if full or (watermark and watermark.get('columns') != columns_digest):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        watermark = None
+
+    part = watermark['part'] + 1 if watermark else 0
+    path = os.path.join(directory, f'part-{part:06d}.parquet')
+    # Dataset readers skip '_'-prefixed files, so a partial part stays hidden
+    temp_path = os.path.join(directory, f'_part-{part:06d}.parquet.tmp')
+
+    decoder = ResponseDecoder(form_id)
+    rows = 0
+    writer = None
+    columns = {name: [] for name in schema.names}
+    last = None
+
+    def flush():
+        nonlocal writer
+        if writer is None:
+            writer = pa.parquet.ParquetWriter(temp_path, schema)
+        writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    try:
+        until = timezone.now() - SNAPSHOT_LAG
+        for response_id, created_at, response in pending_responses(form_id, watermark, until, chunk_size):
+            response = decoder.expand(response)
+            columns['response_id'].append(str(response_id))
+            columns['submitted_at'].append(created_at)
+            for q in questions:
+                columns[str(q.id)].append(typed_value(q.answer_type, response.get(str(q.id))))
+            rows += 1
+            last = (created_at, response_id)
+            if rows % chunk_size == 0:
+                flush()
+        if rows % chunk_size:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not rows:
+        return 0
+
+    # The part is only published together with its watermark; a crashed run
+    # is retried under the same part number.
+    os.replace(temp_path, path)
+    write_watermark(form_id, {'created_at': last[0], 'id': str(last[1]), 'part': part, 'columns': columns_digest})
+    return rows
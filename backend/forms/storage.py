@@ -0,0 +1,185 @@
+"""
+Storage for files uploaded with form responses.
+
+Uploads go through the ``form_uploads`` alias of Django's ``STORAGES``
+setting instead of the local disk, so app nodes behind a load balancer can
+share them. Two backends are available:
+
+* ``FileSystemStorage`` (default) stores files under ``MEDIA_ROOT``.
+* ``ObjectStoreStorage`` talks to an S3-compatible object store through a
+  boto3-style client. ``LocalObjectStoreClient`` implements the same calls
+  on a local directory and stands in for the real service in development
+  and tests.
+
+Files are deduplicated on top of either backend, see ``forms.blobs``.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, storages
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_STORAGE_ALIAS = 'form_uploads'
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx', '.txt', '.csv', '.xlsx', '.xls'}
+
+
+def get_upload_storage():
+    return storages[UPLOAD_STORAGE_ALIAS]
+
+
+def safe_extension(file_name):
+    """Return the extension of an uploaded file name if it is allowed, else ``.txt``."""
+    extension = os.path.splitext(os.path.basename(file_name or ''))[1].lower()
+    return extension if extension in ALLOWED_EXTENSIONS else '.txt'
+
+
+def delete_upload(name):
+    """Remove a stored upload. Missing files are only logged."""
+    storage = get_upload_storage()
+    if not storage.exists(name):
+        logger.warning(f"File not found during deletion: {name}")
+        return
+    storage.delete(name)
+    logger.info(f"Successfully deleted file: {name}")
+
+
+def upload_url(name):
+    return get_upload_storage().url(name)
+
+
+class LocalObjectStoreClient:
+    """
+    Local stand-in for an S3 client.
+
+    Implements the subset of the boto3 S3 client used by
+    ``ObjectStoreStorage`` on top of a directory, one sub-directory per
+    bucket.
+    """
+
+    class NoSuchKey(Exception):
+        pass
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(settings.MEDIA_ROOT, 'object-store')
+
+    def _path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.normpath(os.path.join(self.root, bucket))):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as destination:
+            if hasattr(Body, 'chunks'):
+                for chunk in Body.chunks():
+                    destination.write(chunk)
+            else:
+                destination.write(Body if isinstance(Body, bytes) else Body.read())
+        return {}
+
+    def get_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise self.NoSuchKey(Key)
+        return {'Body': open(path, 'rb'), 'ContentLength': os.path.getsize(path)}
+
+    def head_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise self.NoSuchKey(Key)
+        return {'ContentLength': os.path.getsize(path)}
+
+    def delete_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if os.path.exists(path):
+            os.remove(path)
+        return {}
+
+
+@deconstructible
+class ObjectStoreStorage(Storage):
+    """
+    Storage on an S3-compatible object store.
+
+    ``client`` is the dotted path of a client factory; by default a boto3 S3
+    client is built from ``endpoint_url`` and the credentials, which needs
+    boto3 to be installed. Set it to
+    ``forms.storage.LocalObjectStoreClient`` to use the local stand-in.
+    """
+
+    def __init__(self, bucket=None, endpoint_url=None, access_key=None, secret_key=None,
+                 region=None, base_url=None, client=None):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.base_url = base_url
+        self.client_path = client
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            if self.client_path:
+                self._client = import_string(self.client_path)()
+            else:
+                try:
+                    import boto3
+                except ImportError:
+                    raise ImproperlyConfigured("ObjectStoreStorage requires boto3 unless a client is configured")
+                self._client = boto3.client(
+                    's3',
+                    endpoint_url=self.endpoint_url,
+                    aws_access_key_id=self.access_key,
+                    aws_secret_access_key=self.secret_key,
+                    region_name=self.region,
+                )
+        return self._client
+
+    def _save(self, name, content):
+        content.seek(0)
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=name,
+            Body=content,
+            ContentType=getattr(content, 'content_type', None) or 'application/octet-stream',
+        )
+        return name
+
+    def _open(self, name, mode='rb'):
+        body = self.client.get_object(Bucket=self.bucket, Key=name)['Body']
+        try:
+            return ContentFile(body.read(), name=name)
+        finally:
+            body.close()
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=name)
+        except Exception:
+            return False
+        return True
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=name)['ContentLength']
+
+    def url(self, name):
+        if self.base_url:
+            return f"{self.base_url.rstrip('/')}/{name}"
+        return f"{(self.endpoint_url or '').rstrip('/')}/{self.bucket}/{name}"
+
+    def get_available_name(self, name, max_length=None):
+        # Upload names already embed a uuid4
+        return name
@@ -0,0 +1,101 @@
+"""
+Write path for form submissions.
+
+``record_submission`` stores a single response, ``record_submissions``
+stores many responses for one form with one insert per table. Responses
+are stored in the compact format of ``forms.encoding``. Both run in a
+single transaction so a response is never stored without its ``FormUser``
+row and vice versa.
+
+One submission per user and form is enforced by the ``unique_form_user``
+constraint rather than a prior lookup: the ``FormUser`` row is inserted
+first and a conflict on that constraint surfaces as ``DuplicateSubmission``;
+any other integrity error is raised as is. Answer statistics
+in ``forms.aggregates`` and the optional ``Answer`` rows are written in the
+same transaction.
+
+Anything else is queued with ``forms.tasks.enqueue`` and runs after commit.
+"""
+import logging
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from .aggregates import add_responses
+from .answers import store_answers
+from .encoding import compact_response
+from .models import Form, FormResponse, FormUser
+from .tasks import enqueue, process_submission
+
+logger = logging.getLogger(__name__)
+
+UNIQUE_FORM_USER = 'unique_form_user'
+
+
+class DuplicateSubmission(Exception):
+    """Raised when a user has already submitted the form."""
+
+
+def is_duplicate_submission(error):
+    """Whether an ``IntegrityError`` is a conflict on ``unique_form_user``."""
+    diag = getattr(error.__cause__, 'diag', None)
+    if getattr(diag, 'constraint_name', None):
+        return diag.constraint_name == UNIQUE_FORM_USER
+    # SQLite names the columns of the constraint rather than the constraint
+    table = FormUser._meta.db_table
+    message = str(error)
+    return UNIQUE_FORM_USER in message or f'{table}.user_id, {table}.form_id' in message
+
+
+def record_submission(form, user, responses):
+    """Store one response of ``user`` to ``form`` and return it."""
+    try:
+        with transaction.atomic():
+            FormUser.objects.create(
+                user=user,
+                form=form
+            )
+            
+            form_response = FormResponse.objects.create(
+                form=form,
+                response=compact_response(responses)
+            )
+            add_responses(form.pk, [responses])
+            store_answers(form.pk, [form_response])
+            
+            enqueue(process_submission, [form_response.id])
+    except IntegrityError as e:
+        if not is_duplicate_submission(e):
+            raise
+        raise DuplicateSubmission(f"User {user.pk} already submitted form {form.pk}") from e
+    return form_response
+
+
+def record_submissions(form, submissions):
+    """
+    Store several responses to ``form`` at once.
+
+    ``submissions`` is a list of ``(user, responses)`` pairs whose users have
+    not submitted the form yet. Returns the created ``FormResponse`` objects
+    in the same order. If any of the users submitted concurrently, nothing is
+    stored and ``DuplicateSubmission`` is raised.
+    """
+    form_responses = [FormResponse(form=form, response=compact_response(responses)) for _, responses in submissions]
+    form_users = [FormUser(user=user, form=form) for user, _ in submissions]
+
+    try:
+        with transaction.atomic():
+            FormUser.objects.bulk_create(form_users)
+            FormResponse.objects.bulk_create(form_responses)
+            Form.objects.filter(pk=form.pk).update(submission_count=F('submission_count') + len(form_users))
+            add_responses(form.pk, [responses for _, responses in submissions])
+            store_answers(form.pk, form_responses)
+            
+            enqueue(process_submission, [form_response.id for form_response in form_responses])
+    except IntegrityError as e:
+        if not is_duplicate_submission(e):
+            raise
+        raise DuplicateSubmission(f"Batch for form {form.pk} contains an existing submission") from e
+
+    logger.info(f"Stored {len(form_responses)} responses for form {form.id} in one batch")
+    return form_responses
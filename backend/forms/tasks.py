@@ -0,0 +1,117 @@
+"""
+Post-submission pipeline.
+
+Work that does not decide whether a submission is accepted (upload
+scanning, notification emails, ...) runs after the submission's
+transaction commits, on a small in-process thread pool, so a request only
+pays for its inserts. ``enqueue`` schedules a task with
+``transaction.on_commit``; a rolled back submission never runs its tasks.
+
+Tasks are plain functions taking primitive arguments and reloading what
+they need from the database. With ``FORM_TASKS_EAGER`` they run inline
+once the transaction commits, which is what tests use. Queued tasks live in
+memory only, so tasks still pending when a worker exits are lost; nothing
+in this pipeline must be required for a submission to be valid.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from utils.send_mail import send_email
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.FORM_TASK_WORKERS,
+            thread_name_prefix='form-tasks',
+        )
+    return _executor
+
+
+def run_task(func, *args):
+    try:
+        func(*args)
+    except Exception as e:
+        logger.error(f"Task {func.__name__}{args} failed: {str(e)}", exc_info=True)
+    finally:
+        if not settings.FORM_TASKS_EAGER:
+            # Worker threads keep their own connections
+            close_old_connections()
+
+
+def enqueue(func, *args):
+    """Run ``func(*args)`` once the current transaction commits."""
+    def submit():
+        if settings.FORM_TASKS_EAGER:
+            run_task(func, *args)
+        else:
+            get_executor().submit(run_task, func, *args)
+
+    transaction.on_commit(submit)
+
+
+def process_submission(response_ids):
+    """Everything that follows the storage of one or more responses."""
+    from .models import FormResponse
+
+    for form_response in FormResponse.objects.filter(id__in=response_ids).select_related('form'):
+        scan_uploads(form_response)
+        notify_submission(form_response)
+
+
+def scan_uploads(form_response):
+    """
+    Pass every uploaded file of a response to ``FORM_UPLOAD_SCAN_HOOK``.
+
+    The hook is the dotted path of a callable taking the storage name of
+    the file and returning ``False`` when it must be rejected (e.g. a virus
+    scanner). Rejected files are released and flagged on the answer.
+    """
+    from .blobs import release_upload
+
+    if not settings.FORM_UPLOAD_SCAN_HOOK:
+        return
+
+    scan = import_string(settings.FORM_UPLOAD_SCAN_HOOK)
+    changed = False
+    for answer in form_response.expanded_response().values():
+        if not isinstance(answer, dict) or answer.get('answer_type') != 'file':
+            continue
+        value = answer.get('value')
+        if not isinstance(value, dict) or not value.get('file_path'):
+            continue
+        if scan(value['file_path']):
+            continue
+
+        logger.warning(f"Upload {value['file_path']} of response {form_response.id} rejected by scan")
+        release_upload(value.pop('file_path'))
+        value['rejected'] = True
+        changed = True
+
+    if changed:
+        form_response.save(update_fields=['response', 'updated_at'])
+
+
+def notify_submission(form_response):
+    """Email ``FORM_NOTIFICATION_EMAILS`` about a new response."""
+    for email in settings.FORM_NOTIFICATION_EMAILS:
+        send_email(
+            subject=f"New response to {form_response.form.name}",
+            to_email=email,
+            context={
+                "form_name": form_response.form.name,
+                "response_id": str(form_response.id),
+                "submitted_at": form_response.created_at,
+                "app_name": "AnonyForm"
+            },
+            template_name="email/form_submission_email.html"
+        )
@@ -0,0 +1,146 @@
+"""
+Tests for forms admin
+"""
+import pytest
+from datetime import timedelta
+from django.utils import timezone
+from forms.models import Form, FormResponse, FormUser
+from forms.submission import record_submission
+
+
+@pytest.fixture
+def admin_client(client, admin_user):
+    client.force_login(admin_user)
+    return client
+
+
+@pytest.fixture
+def responses(form_with_questions, question_text, question_checkbox):
+    now = timezone.now()
+    created = []
+    for i in range(5):
+        response = FormResponse.objects.create(form=form_with_questions, response={
+            str(question_text.id): {'answer_type': 'text', 'value': f'Name {i}'},
+            str(question_checkbox.id): {'answer_type': 'checkbox', 'value': ['Music']},
+        })
+        # Same timestamp for some rows to exercise the id tie-breaker
+        FormResponse.objects.filter(id=response.id).update(created_at=now - timedelta(minutes=i // 2))
+        created.append(response)
+    return created
+
+
+@pytest.mark.django_db
+class TestFormResponsesView:
+    """Test cases for the paginated responses endpoint of FormAdmin"""
+    
+    def url(self, form):
+        return f'/admin-back-office/forms/form/{form.id}/responses/'
+    
+    def test_requires_staff(self, client, form):
+        """Test that anonymous users are sent to the login page"""
+        response = client.get(self.url(form))
+        
+        assert response.status_code == 302
+    
+    def test_keyset_pagination(self, admin_client, form_with_questions, responses):
+        """Test walking all pages with the cursor"""
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            page = admin_client.get(self.url(form_with_questions), params).json()
+            seen.extend(row['id'] for row in page['rows'])
+            pages += 1
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        
+        assert pages == 3
+        assert len(seen) == len(set(seen)) == 5
+    
+    def test_column_selection(self, admin_client, form_with_questions, question_checkbox, responses):
+        """Test that only the selected questions are returned"""
+        page = admin_client.get(self.url(form_with_questions), {'columns': str(question_checkbox.id)}).json()
+        
+        assert [c['id'] for c in page['columns']] == [str(question_checkbox.id)]
+        assert page['rows'][0]['answers'] == {str(question_checkbox.id): {'type': 'list', 'value': ['Music']}}
+    
+    def test_no_columns_selected(self, admin_client, form_with_questions, responses):
+        """Test that an empty column selection returns no answers"""
+        page = admin_client.get(self.url(form_with_questions), {'columns': ''}).json()
+        
+        assert page['columns'] == []
+        assert page['rows'][0]['answers'] == {}
+    
+    def test_invalid_cursor(self, admin_client, form_with_questions):
+        """Test that a malformed cursor is rejected"""
+        response = admin_client.get(self.url(form_with_questions), {'cursor': 'nope'})
+        
+        assert response.status_code == 400
+    
+    def test_change_page_does_not_render_responses(self, admin_client, form_with_questions, responses):
+        """Test that the change page only embeds the endpoint"""
+        response = admin_client.get(f'/admin-back-office/forms/form/{form_with_questions.id}/change/')
+        
+        assert response.status_code == 200
+        assert self.url(form_with_questions).encode() in response.content
+        assert b'Name 0' not in response.content
+
+
+@pytest.mark.django_db
+class TestFormStatisticsTab:
+    """Test cases for the statistics tab of FormAdmin"""
+    
+    def test_change_page_renders_statistics(self, admin_client, form_with_questions, create_user, question_radio):
+        """Test that option counts are shown on the change page"""
+        record_submission(form_with_questions, create_user(), {
+            str(question_radio.id): {'answer_type': 'radio', 'value': 'Female'},
+        })
+        
+        response = admin_client.get(f'/admin-back-office/forms/form/{form_with_questions.id}/change/')
+        content = response.content.decode()
+        
+        assert response.status_code == 200
+        assert 'Statistics' in content
+        assert question_radio.question in content
+
+
+@pytest.mark.django_db
+class TestFormAdminChangelist:
+    """Test cases for the forms changelist"""
+    
+    url = '/admin-back-office/forms/form/'
+    
+    def test_submission_counts_in_one_query(self, admin_client, create_user, django_assert_max_num_queries):
+        """Test that the changelist does not query per form"""
+        for i in range(3):
+            form = Form.objects.create(name=f'Form {i}', enable=True)
+            for _ in range(i):
+                FormUser.objects.create(user=create_user(), form=form)
+        admin_client.get(self.url)
+        
+        with django_assert_max_num_queries(12) as captured:
+            response = admin_client.get(self.url)
+        few = len(captured)
+        
+        for i in range(3, 10):
+            Form.objects.create(name=f'Form {i}', enable=True)
+        with django_assert_max_num_queries(few):
+            admin_client.get(self.url)
+        
+        assert response.status_code == 200
+    
+    def test_sort_by_submissions(self, admin_client, create_user):
+        """Test that the changelist can be ordered by submission count"""
+        busy = Form.objects.create(name='Busy', enable=True)
+        Form.objects.create(name='Quiet', enable=True)
+        FormUser.objects.create(user=create_user(), form=busy)
+        
+        response = admin_client.get(self.url, {'o': '-3'})
+        
+        content = response.content.decode()
+        assert response.status_code == 200
+        assert content.index('Busy') < content.index('Quiet')
@@ -0,0 +1,185 @@
+"""
+Tests for forms answer statistics
+"""
+import pytest
+from django.core.management import call_command
+from forms.aggregates import form_statistics
+from forms.models import AnswerAggregate, FormQuestion, FormResponse, Questions
+from forms.submission import record_submission, record_submissions
+
+
+@pytest.fixture
+def question_number(db):
+    """Create a number question"""
+    return Questions.objects.create(question='How old are you?', answer_type='number', required=False)
+
+
+@pytest.fixture
+def question_boolean(db):
+    """Create a boolean question"""
+    return Questions.objects.create(question='Do you agree?', answer_type='boolean', required=False)
+
+
+@pytest.fixture
+def stats_form(form_with_questions, question_number, question_boolean):
+    FormQuestion.objects.create(form=form_with_questions, question=question_number, form_index=4)
+    FormQuestion.objects.create(form=form_with_questions, question=question_boolean, form_index=5)
+    return form_with_questions
+
+
+@pytest.fixture
+def answer(question_radio, question_checkbox, question_number, question_boolean):
+    def make(gender, interests, age, agree):
+        return {
+            str(question_radio.id): {'answer_type': 'radio', 'value': gender},
+            str(question_checkbox.id): {'answer_type': 'checkbox', 'value': interests},
+            str(question_number.id): {'answer_type': 'number', 'value': age},
+            str(question_boolean.id): {'answer_type': 'boolean', 'value': agree},
+        }
+    return make
+
+
+def by_question(form):
+    return {stat['id']: stat for stat in form_statistics(form.id)}
+
+
+def counts(stat):
+    return {option['option']: option['count'] for option in stat['options']}
+
+
+@pytest.mark.django_db
+class TestAnswerAggregates:
+    """Test cases for maintaining answer statistics on submit and delete"""
+    
+    def test_submission_updates_counts(self, stats_form, create_user, answer, question_radio, question_checkbox, question_boolean):
+        """Test that option, checkbox and boolean answers are counted"""
+        record_submission(stats_form, create_user(), answer('Male', ['Music', 'Sports'], 20, True))
+        record_submission(stats_form, create_user(), answer('Male', ['Music'], 30, False))
+        
+        stats = by_question(stats_form)
+        
+        assert counts(stats[str(question_radio.id)]) == {'Male': 2, 'Female': 0, 'Other': 0}
+        assert counts(stats[str(question_checkbox.id)]) == {'Sports': 1, 'Music': 2, 'Reading': 0, 'Gaming': 0}
+        assert counts(stats[str(question_boolean.id)]) == {'true': 1, 'false': 1}
+    
+    def test_number_statistics(self, stats_form, create_user, answer, question_number):
+        """Test count, mean, standard deviation and extremes of numbers"""
+        for age in (20, 30, '40'):
+            record_submission(stats_form, create_user(), answer('Other', [], age, True))
+        
+        stat = by_question(stats_form)[str(question_number.id)]
+        
+        assert stat['count'] == 3
+        assert stat['sum'] == 90
+        assert stat['mean'] == 30
+        assert stat['stddev'] == pytest.approx(8.1649, rel=1e-3)
+        assert (stat['min'], stat['max']) == (20, 40)
+    
+    def test_batch_submission_updates_counts(self, stats_form, create_user, answer, question_radio):
+        """Test that a batch adds every response with one update per row"""
+        record_submissions(stats_form, [
+            (create_user(), answer('Female', [], 1, True)),
+            (create_user(), answer('Female', [], 2, True)),
+            (create_user(), answer('Male', [], 3, True)),
+        ])
+        
+        assert counts(by_question(stats_form)[str(question_radio.id)])['Female'] == 2
+    
+    def test_delete_takes_response_out(self, stats_form, create_user, answer, question_radio, question_number):
+        """Test that deleting a response decrements counts and drops empty rows"""
+        kept = record_submission(stats_form, create_user(), answer('Male', [], 25, True))
+        removed = record_submission(stats_form, create_user(), answer('Female', [], 35, True))
+        
+        FormResponse.objects.get(id=removed.id).delete()
+        stats = by_question(stats_form)
+        
+        assert counts(stats[str(question_radio.id)]) == {'Male': 1, 'Female': 0, 'Other': 0}
+        assert stats[str(question_number.id)]['count'] == 1
+        assert not AnswerAggregate.objects.filter(form=stats_form, option='Female').exists()
+        assert kept.id
+    
+    def test_delete_extreme_rescans(self, stats_form, create_user, answer, question_number):
+        """Test that removing the current maximum recomputes it"""
+        record_submission(stats_form, create_user(), answer('Male', [], 10, True))
+        record_submission(stats_form, create_user(), answer('Male', [], 20, True))
+        highest = record_submission(stats_form, create_user(), answer('Male', [], 90, True))
+        
+        FormResponse.objects.get(id=highest.id).delete()
+        stat = by_question(stats_form)[str(question_number.id)]
+        
+        assert (stat['min'], stat['max']) == (10, 20)
+        assert stat['mean'] == 15
+    
+    def test_read_costs_two_queries(self, stats_form, create_user, answer, django_assert_num_queries):
+        """Test that reading statistics does not depend on the number of responses"""
+        for gender in ('Male', 'Female', 'Other', 'Male'):
+            record_submission(stats_form, create_user(), answer(gender, ['Music'], 5, False))
+        
+        with django_assert_num_queries(2):
+            form_statistics(stats_form.id)
+    
+    def test_rebuild_command(self, stats_form, create_user, answer, question_radio):
+        """Test that the rebuild command restores drifted statistics"""
+        record_submission(stats_form, create_user(), answer('Male', [], 5, True))
+        record_submission(stats_form, create_user(), answer('Other', [], 7, False))
+        expected = form_statistics(stats_form.id)
+        AnswerAggregate.objects.filter(form=stats_form).update(count=99)
+        
+        call_command('rebuild_answer_aggregates', form=[str(stats_form.id)], stdout=open('/dev/null', 'w'))
+        
+        assert form_statistics(stats_form.id) == expected
+
+    
+    def test_rebuild_skips_deleted_questions(self, stats_form, question_radio):
+        """Test that answers of deleted questions or with odd keys do not break the rebuild"""
+        FormResponse.objects.create(form=stats_form, response={
+            str(question_radio.id): {'answer_type': 'radio', 'value': 'Male'},
+            '00000000-0000-0000-0000-000000000000': {'answer_type': 'radio', 'value': 'Gone'},
+            'q1': {'answer_type': 'boolean', 'value': True},
+        })
+        
+        call_command('rebuild_answer_aggregates', form=[str(stats_form.id)], stdout=open('/dev/null', 'w'))
+        
+        assert list(AnswerAggregate.objects.values_list('question_id', 'option', 'count')) == [(question_radio.id, 'Male', 1)]
+
+@pytest.mark.django_db
+class TestFormStatisticsAPI:
+    """Test cases for the form statistics endpoint"""
+    
+    def url(self, form):
+        return f'/api/forms/{form.id}/stats/'
+    
+    def test_requires_admin(self, api_client, user, stats_form):
+        """Test that regular users cannot read statistics"""
+        api_client.force_authenticate(user=user)
+        
+        response = api_client.get(self.url(stats_form))
+        
+        assert response.status_code == 403
+    
+    def test_returns_statistics(self, api_client, admin_user, stats_form, create_user, answer, question_radio):
+        """Test that admins get statistics in form order"""
+        record_submission(stats_form, create_user(), answer('Male', ['Music'], 5, True))
+        api_client.force_authenticate(user=admin_user)
+        
+        response = api_client.get(self.url(stats_form))
+        data = response.json()
+        
+        assert response.status_code == 200
+        assert data['submissions'] == 1
+        assert [q['answer_type'] for q in data['questions']] == ['radio', 'checkbox', 'number', 'boolean']
+        assert data['questions'][0]['options'][0] == {'option': 'Male', 'count': 1}
+    
+    def test_cached_until_next_submission(self, api_client, admin_user, stats_form, create_user, answer, django_capture_on_commit_callbacks, django_assert_num_queries):
+        """Test that statistics are cached and refreshed by a new submission"""
+        api_client.force_authenticate(user=admin_user)
+        api_client.get(self.url(stats_form))
+        
+        with django_assert_num_queries(1):
+            api_client.get(self.url(stats_form))
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            record_submission(stats_form, create_user(), answer('Female', [], 5, True))
+        data = api_client.get(self.url(stats_form)).json()
+        
+        assert data['questions'][0]['options'][1] == {'option': 'Female', 'count': 1}
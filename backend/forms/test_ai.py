@@ -0,0 +1,515 @@
+"""
+Tests for AI form filling
+"""
+import asyncio
+import json
+import threading
+import time
+import pytest
+from types import SimpleNamespace
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from google.api_core.exceptions import DeadlineExceeded, ResourceExhausted
+from rest_framework import status
+from forms import ai
+from forms.models import FormQuestion
+from django.core.cache import cache
+from forms.ai import AIResponseError, fill_form, fill_cache_key, get_model, parse_model_output, prepare_fill
+from forms.cache import get_form_version
+
+
+class FakeModel:
+    """Stands in for the Gemini client: answers every question with a canned value"""
+
+    instances = []
+    delay = 0
+    invalid = {}
+    missing = {}
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.prompts = []
+        FakeModel.instances.append(self)
+
+    def answer(self, prompt):
+        self.prompts.append(prompt)
+        block = prompt.split('Form Questions:\n', 1)[1].split('\n\nInstructions:', 1)[0]
+        answers = {}
+        for question in json.loads(block):
+            answers[question['id']] = question['options'][0] if question.get('options') else 'filled'
+            if question['answer_type'] == 'checkbox':
+                answers[question['id']] = [answers[question['id']]]
+            if self.invalid.get(question['id']):
+                self.invalid[question['id']] -= 1
+                answers[question['id']] = 'Not an option'
+            if self.missing.get(question['id']):
+                self.missing[question['id']] -= 1
+                del answers[question['id']]
+        return '```json\n' + json.dumps(answers) + '\n```'
+
+    def generate_content(self, prompt):
+        return SimpleNamespace(text=self.answer(prompt))
+
+    async def generate_content_async(self, prompt, stream=False):
+        text = self.answer(prompt)
+
+        async def chunks():
+            for start in range(0, len(text), 7):
+                await asyncio.sleep(self.delay)
+                yield SimpleNamespace(text=text[start:start + 7])
+
+        return chunks()
+
+
+@pytest.fixture
+def fake_model(settings):
+    settings.FORM_AI_CLIENT = 'forms.test_ai.FakeModel'
+    settings.FORM_AI_MODEL = 'fake-model'
+    FakeModel.instances = []
+    FakeModel.delay = 0
+    FakeModel.invalid = {}
+    FakeModel.missing = {}
+    ai.reset_model()
+    yield FakeModel
+    ai.reset_model()
+
+
+@pytest.mark.django_db
+class TestFillForm:
+    """Test cases for the shared model, question block and result cache"""
+
+    def test_model_created_once(self, fake_model):
+        """Test that the model client is a process-wide singleton"""
+        assert get_model() is get_model()
+        assert len(fake_model.instances) == 1
+        assert fake_model.instances[0].model_name == 'fake-model'
+
+    def test_fill_form(self, fake_model, form_with_questions, question_text, question_radio):
+        """Test that answers come back keyed by question id"""
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+
+        assert responses[str(question_text.id)] == 'filled'
+        assert responses[str(question_radio.id)] == 'Male'
+
+    def test_repeated_input_is_cached(self, fake_model, form_with_questions):
+        """Test that the same input, modulo spacing, costs one model call, and a change of case does not"""
+        first = fill_form(form_with_questions.id, 'I am  Ada')
+        second = fill_form(form_with_questions.id, ' I am Ada ')
+
+        assert first == second
+        assert len(get_model().prompts) == 1
+
+        fill_form(form_with_questions.id, 'i am ada')
+        assert len(get_model().prompts) == 2
+
+    def test_form_change_invalidates(self, fake_model, form_with_questions, question_text):
+        """Test that editing a question rebuilds the question block and the answer"""
+        fill_form(form_with_questions.id, 'I am Ada')
+        question_text.question = 'Nickname'
+        question_text.save()
+        fill_form(form_with_questions.id, 'I am Ada')
+
+        prompts = get_model().prompts
+        assert len(prompts) == 2
+        assert 'Nickname' in prompts[1]
+
+    def test_parse_model_output(self):
+        """Test that fenced and bare JSON are both accepted"""
+        assert parse_model_output('{"a": 1}') == {'a': 1}
+        assert parse_model_output('```json\n{"a": 1}\n```') == {'a': 1}
+        with pytest.raises(AIResponseError):
+            parse_model_output('not json')
+
+    def test_answers_are_coerced(self, fake_model, form_with_questions, question_text, question_radio, question_checkbox, monkeypatch):
+        """Test that sloppy output is mapped onto the questions instead of asked again"""
+        text = (
+            f"Sure! {{'{question_text.id}': 42, \"{question_radio.id}\": \" female \", "
+            f"\"{question_checkbox.id}\": \"music\", \"unknown\": 1,}}"
+        )
+        monkeypatch.setattr(FakeModel, 'generate_content', lambda self, prompt: self.prompts.append(prompt) or SimpleNamespace(text=text))
+
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+
+        assert responses == {
+            str(question_text.id): '42',
+            str(question_radio.id): 'Female',
+            str(question_checkbox.id): ['Music'],
+        }
+        assert len(get_model().prompts) == 1
+
+
+@pytest.mark.django_db
+class TestChunkedFill:
+    """Test cases for filling a form chunk by chunk"""
+
+    @pytest.fixture(autouse=True)
+    def small_chunks(self, settings):
+        settings.FORM_AI_CHUNK_SIZE = 1
+
+    def test_chunks_are_merged(self, fake_model, form_with_questions, question_text, question_radio, question_checkbox):
+        """Test that every chunk gets its own prompt and the answers are merged"""
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+
+        assert responses == {
+            str(question_text.id): 'filled',
+            str(question_radio.id): 'Male',
+            str(question_checkbox.id): ['Sports'],
+        }
+        assert len(get_model().prompts) == 3
+
+    def test_bad_chunk_is_retried_alone(self, fake_model, form_with_questions, question_radio):
+        """Test that an answer outside the options only repeats its own chunk"""
+        fake_model.invalid = {str(question_radio.id): 1}
+
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+
+        assert responses[str(question_radio.id)] == 'Male'
+        prompts = get_model().prompts
+        assert len(prompts) == 4
+        assert sum(question_radio.question in prompt for prompt in prompts) == 2
+
+    def test_failing_chunk_is_left_unanswered(self, fake_model, form_with_questions, question_text, question_radio, settings):
+        """Test that a chunk failing every attempt does not fail the fill, and is not cached"""
+        settings.FORM_AI_CHUNK_RETRIES = 1
+        fake_model.invalid = {str(question_radio.id): 2}
+
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+
+        assert responses[str(question_radio.id)] is None
+        assert responses[str(question_text.id)] == 'filled'
+        fill_form(form_with_questions.id, 'I am Ada')
+        assert len(get_model().prompts) == 7
+
+    def test_missing_required_answer_is_retried(self, fake_model, form_with_questions, question_radio):
+        """Test that a required question left out of the output repeats its chunk"""
+        fake_model.missing = {str(question_radio.id): 1}
+
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+
+        assert responses[str(question_radio.id)] == 'Male'
+        assert len(get_model().prompts) == 4
+
+    def test_missing_optional_answer_is_not_cached(self, fake_model, form_with_questions, question_checkbox):
+        """Test that a fill with an optional question left out is returned but not cached"""
+        fake_model.missing = {str(question_checkbox.id): 1}
+
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+        fill_form(form_with_questions.id, 'I am Ada')
+
+        assert str(question_checkbox.id) not in responses
+        assert len(get_model().prompts) == 6
+
+    def test_transient_errors_are_retried(self, fake_model, form_with_questions, question_radio, settings, monkeypatch):
+        """Test that a rate limited chunk is asked again after a pause, and fails alone once out of attempts"""
+        settings.FORM_AI_CHUNK_RETRIES = 1
+        settings.FORM_AI_RETRY_BACKOFF = 0.01
+        errors = {str(question_radio.id): [ResourceExhausted('Quota exceeded')] * 2}
+        generate_content = FakeModel.generate_content
+
+        def flaky(self, prompt):
+            for question_id, pending in errors.items():
+                if question_id in prompt and pending:
+                    self.prompts.append(prompt)
+                    raise pending.pop()
+            return generate_content(self, prompt)
+
+        monkeypatch.setattr(FakeModel, 'generate_content', flaky)
+
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+        assert responses[str(question_radio.id)] is None
+
+        errors[str(question_radio.id)] = [DeadlineExceeded('Timed out')]
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+        assert responses[str(question_radio.id)] == 'Male'
+
+    def test_every_chunk_failing(self, fake_model, form, question_radio, settings):
+        """Test that the fill fails when no chunk succeeds"""
+        settings.FORM_AI_CHUNK_RETRIES = 0
+        FormQuestion.objects.create(form=form, question=question_radio, form_index=1)
+        fake_model.invalid = {str(question_radio.id): 1}
+
+        with pytest.raises(AIResponseError):
+            fill_form(form.id, 'I am Ada')
+
+
+@pytest.mark.django_db
+class TestSingleFlight:
+    """Test cases for coalescing identical fills in flight"""
+
+    def test_concurrent_fills_share_a_call(self, fake_model, form_with_questions, monkeypatch):
+        """Test that a fill arriving while the same one is running waits for it"""
+        started, release = threading.Event(), threading.Event()
+        answer = FakeModel.answer
+
+        def slow_answer(self, prompt):
+            started.set()
+            release.wait(5)
+            return answer(self, prompt)
+
+        monkeypatch.setattr(FakeModel, 'answer', slow_answer)
+        # Warm the form caches so the threads need no database
+        prepare_fill(form_with_questions.id, 'I am Ada')
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(fill_form(form_with_questions.id, 'I am Ada'))) for _ in range(2)]
+        threads[0].start()
+        started.wait(5)
+        threads[1].start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert len(results) == 2
+        assert results[0] == results[1]
+        assert len(get_model().prompts) == 1
+
+    def test_waits_for_another_process(self, fake_model, form_with_questions, settings):
+        """Test that a fill locked by another process is read from the cache once done"""
+        version = get_form_version(form_with_questions.id)['version']
+        key = fill_cache_key(form_with_questions.id, version, 'I am Ada')
+        cache.add(f'{key}:lock', True, 60)
+        threading.Timer(0.05, cache.set, args=(key, {'done': 'elsewhere'})).start()
+
+        assert fill_form(form_with_questions.id, 'I am Ada') == {'done': 'elsewhere'}
+        assert fake_model.instances == []
+
+    def test_stale_lock(self, fake_model, form_with_questions, settings):
+        """Test that a fill computes the answers itself when the other process never delivers"""
+        settings.FORM_AI_COALESCE_TIMEOUT = 0.2
+        version = get_form_version(form_with_questions.id)['version']
+        key = fill_cache_key(form_with_questions.id, version, 'I am Ada')
+        cache.add(f'{key}:lock', True, 60)
+
+        responses = fill_form(form_with_questions.id, 'I am Ada')
+
+        assert len(responses) == 3
+        assert len(get_model().prompts) == 1
+
+
+@pytest.mark.django_db
+class TestAIFillFormAPIWithModel:
+    """Test cases for AIFillFormAPI backed by the fake model"""
+
+    url = '/api/forms/ai-fill/'
+
+    def test_success(self, api_client, fake_model, form_with_questions, question_radio):
+        """Test a successful fill"""
+        data = {'formId': str(form_with_questions.id), 'userInput': 'Fill this form'}
+
+        response = api_client.post(self.url, data, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['success'] is True
+        assert response.data['responses'][str(question_radio.id)] == 'Male'
+
+    def test_unparseable_output(self, api_client, fake_model, form_with_questions, monkeypatch):
+        """Test that output that is not JSON is reported as a server error"""
+        monkeypatch.setattr(FakeModel, 'generate_content', lambda self, prompt: SimpleNamespace(text='sorry'))
+        data = {'formId': str(form_with_questions.id), 'userInput': 'Fill this form'}
+
+        response = api_client.post(self.url, data, format='json')
+
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        assert response.data['error'] == 'Failed to parse AI response'
+
+    def test_ip_rate_limit(self, api_client, fake_model, form_with_questions, settings):
+        """Test that a client over its token bucket gets 429 with Retry-After"""
+        settings.FORM_AI_IP_RATE = '2/min'
+        data = {'formId': str(form_with_questions.id), 'userInput': 'Fill this form'}
+
+        statuses = [api_client.post(self.url, data, format='json').status_code for _ in range(3)]
+
+        assert statuses == [status.HTTP_200_OK, status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS]
+        response = api_client.post(self.url, data, format='json')
+        assert int(response['Retry-After']) > 0
+
+    def test_user_rate_limit(self, api_client, fake_model, form_with_questions, create_user, settings):
+        """Test that each user has a bucket of their own"""
+        settings.FORM_AI_USER_RATE = '1/min'
+        data = {'formId': str(form_with_questions.id), 'userInput': 'Fill this form'}
+        first, second = create_user(), create_user()
+
+        api_client.force_authenticate(first)
+        assert api_client.post(self.url, data, format='json').status_code == status.HTTP_200_OK
+        assert api_client.post(self.url, data, format='json').status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        api_client.force_authenticate(second)
+        assert api_client.post(self.url, data, format='json').status_code == status.HTTP_200_OK
+
+
+def read_events(body):
+    events = []
+    for block in body.decode().strip().split('\n\n'):
+        event, data = block.split('\n', 1)
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+@pytest.mark.django_db
+class TestAIFillFormStreamView:
+    """Test cases for the streaming AI fill endpoint"""
+
+    url = '/api/forms/ai-fill/stream/'
+
+    def post(self, data):
+        async def request():
+            response = await AsyncClient().post(self.url, data, content_type='application/json')
+            body = b''
+            if response.streaming:
+                body = b''.join([chunk async for chunk in response.streaming_content])
+            return response, body
+        return async_to_sync(request)()
+
+    def test_streams_answers(self, fake_model, form_with_questions, question_text, question_radio, question_checkbox):
+        """Test that there is one answer event per question, then a done event"""
+        response, body = self.post({'formId': str(form_with_questions.id), 'userInput': 'I am Ada'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'text/event-stream'
+        events = read_events(body)
+        assert [event for event, _ in events] == ['answer', 'answer', 'answer', 'done']
+        assert events[1][1] == {'id': str(question_radio.id), 'value': 'Male'}
+        assert events[-1][1]['responses'][str(question_text.id)] == 'filled'
+
+    def test_result_is_cached(self, fake_model, form_with_questions):
+        """Test that a streamed fill is reused by the next request"""
+        data = {'formId': str(form_with_questions.id), 'userInput': 'I am Ada'}
+        self.post(data)
+        _, body = self.post(data)
+
+        assert read_events(body)[-1][0] == 'done'
+        assert len(get_model().prompts) == 1
+        assert fill_form(form_with_questions.id, 'I am  Ada') == read_events(body)[-1][1]['responses']
+
+    def test_incomplete_result_is_not_cached(self, fake_model, form_with_questions, question_radio):
+        """Test that a stream missing a required answer is not reused"""
+        fake_model.missing = {str(question_radio.id): 1}
+        data = {'formId': str(form_with_questions.id), 'userInput': 'I am Ada'}
+        _, body = self.post(data)
+        self.post(data)
+
+        assert str(question_radio.id) not in read_events(body)[-1][1]['responses']
+        assert len(get_model().prompts) == 2
+
+    def test_timeout(self, fake_model, form_with_questions, settings):
+        """Test that a slow model ends the stream with an error event"""
+        settings.FORM_AI_STREAM_TIMEOUT = 0.05
+        fake_model.delay = 0.02
+
+        _, body = self.post({'formId': str(form_with_questions.id), 'userInput': 'I am Ada'})
+
+        assert read_events(body)[-1] == ('error', {'error': 'AI fill timed out'})
+
+    def test_concurrency_limit(self, fake_model, form_with_questions, settings):
+        """Test that requests beyond the limit are turned away once no slot frees up in time"""
+        settings.FORM_AI_STREAM_CONCURRENCY = 1
+        settings.FORM_AI_STREAM_QUEUE_TIMEOUT = 0.05
+
+        async def requests():
+            client = AsyncClient()
+            data = {'formId': str(form_with_questions.id), 'userInput': 'I am Ada'}
+            first = await client.post(self.url, data, content_type='application/json')
+            chunks = first.streaming_content.__aiter__()
+            await chunks.__anext__()
+            data['userInput'] = 'Someone else'
+            second = await client.post(self.url, data, content_type='application/json')
+            [chunk async for chunk in chunks]
+            return second
+
+        response = async_to_sync(requests)()
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    def test_slot_released_when_closed_unread(self, fake_model, form_with_questions, settings):
+        """Test that a stream closed before it was read gives its slot back"""
+        settings.FORM_AI_STREAM_CONCURRENCY = 1
+        settings.FORM_AI_STREAM_QUEUE_TIMEOUT = 0.05
+
+        async def requests():
+            client = AsyncClient()
+            data = {'formId': str(form_with_questions.id), 'userInput': 'I am Ada'}
+            first = await client.post(self.url, data, content_type='application/json')
+            first.close()
+            await asyncio.sleep(0)
+            data['userInput'] = 'Someone else'
+            second = await client.post(self.url, data, content_type='application/json')
+            [chunk async for chunk in second.streaming_content]
+            return second
+
+        assert async_to_sync(requests)().status_code == status.HTTP_200_OK
+
+    def test_form_not_found(self, fake_model):
+        """Test that an unknown form is reported before streaming"""
+        response, _ = self.post({'formId': '00000000-0000-0000-0000-000000000000', 'userInput': 'Fill this form'})
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_missing_user_input(self, fake_model, form):
+        """Test that the input is required"""
+        response, _ = self.post({'formId': str(form.id)})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'User input is required' in json.loads(response.content)['error']
+
+    def test_rate_limit(self, fake_model, form_with_questions, settings):
+        """Test that the stream shares the token buckets of AIFillFormAPI"""
+        settings.FORM_AI_IP_RATE = '1/min'
+        data = {'formId': str(form_with_questions.id), 'userInput': 'I am Ada'}
+
+        first, _ = self.post(data)
+        second, _ = self.post(data)
+
+        assert first.status_code == status.HTTP_200_OK
+        assert second.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(second['Retry-After']) > 0
+
+    def test_identical_streams_share_a_call(self, fake_model, form_with_questions):
+        """Test that a stream started while the same fill is running waits for it"""
+        fake_model.delay = 0.01
+        data = {'formId': str(form_with_questions.id), 'userInput': 'I am Ada'}
+
+        async def requests():
+            client = AsyncClient()
+
+            async def stream():
+                response = await client.post(self.url, data, content_type='application/json')
+                return b''.join([chunk async for chunk in response.streaming_content])
+
+            return await asyncio.gather(stream(), stream())
+
+        bodies = async_to_sync(requests)()
+
+        assert read_events(bodies[0])[-1] == read_events(bodies[1])[-1]
+        assert read_events(bodies[1])[-1][0] == 'done'
+        assert len(get_model().prompts) == 1
+
+
+class TestASGIApplication:
+    """Test cases for the ASGI entry point"""
+
+    def test_only_async_endpoints(self):
+        """Test that the ASGI server turns away everything but the streaming fill"""
+        from AppName.asgi import application
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            sent.append(message)
+
+        async_to_sync(application)({'type': 'http', 'path': '/api/forms/submit/', 'method': 'POST', 'headers': []}, receive, send)
+
+        assert sent[0]['status'] == 404
+
+    def test_wsgi_turns_away_async_endpoints(self):
+        """Test that the WSGI workers do not serve the streaming fill"""
+        from AppName.wsgi import application
+        statuses = []
+
+        body = application(
+            {'PATH_INFO': '/api/forms/ai-fill/stream/', 'REQUEST_METHOD': 'POST'},
+            lambda status_line, headers: statuses.append(status_line),
+        )
+
+        assert statuses == ['404 Not Found']
+        assert b'ASGI' in b''.join(body)
@@ -0,0 +1,108 @@
+"""
+Tests for reading model output
+"""
+import pytest
+from forms.ai_output import AIResponseError, JSONObjectExtractor, coerce_answers, extract_object
+
+
+class TestJSONObjectExtractor:
+    """Test cases for the tolerant incremental JSON object reader"""
+    
+    def test_members_as_they_complete(self):
+        """Test that each member is returned once its value is complete"""
+        extractor = JSONObjectExtractor()
+        
+        assert extractor.feed('```json\n{"a": "x", "b": 1') == [('a', 'x')]
+        assert extractor.feed('2, "c": [1, 2]') == [('b', 12)]
+        assert extractor.feed('}\n```') == [('c', [1, 2])]
+        assert extractor.close() == []
+        assert extractor.complete
+    
+    def test_tolerates_common_mistakes(self):
+        """Test trailing commas, single quotes, Python literals and bare keys"""
+        text = "Here you go: {'a': 'x', \"b\": [1, 2,], c: True, \"d\": None, \"e\": \"a, b}\",}"
+        
+        assert extract_object(text) == {'a': 'x', 'b': [1, 2], 'c': True, 'd': None, 'e': 'a, b}'}
+    
+    def test_skips_unreadable_members(self):
+        """Test that one bad value costs only its own member"""
+        extractor = JSONObjectExtractor()
+        members = extractor.feed('{"a": nope nope, "b": 2}')
+        
+        assert members == [('b', 2)]
+        assert extractor.skipped == 1
+    
+    def test_truncated_output(self):
+        """Test that the members before a cut-off are kept"""
+        assert extract_object('{"a": "x", "b": 3') == {'a': 'x', 'b': 3}
+        assert extract_object('{"a": "x", "b": "unfinish') == {'a': 'x'}
+    
+    def test_braces_in_prose(self):
+        """Test that braces before the object do not hide it"""
+        assert extract_object('Here is the answer for {form}:\n```json\n{"a": "x"}\n```') == {'a': 'x'}
+        assert extract_object('Fill {see below: the JSON} then {"a": 1}') == {'a': 1}
+        
+        extractor = JSONObjectExtractor()
+        members = [member for char in 'For {form}: {"a": "x", "b": 2}' for member in extractor.feed(char)]
+        
+        assert members == [('a', 'x'), ('b', 2)]
+        assert extractor.complete
+    
+    def test_truncation_is_reported(self):
+        """Test that output cut off before the closing brace is not complete"""
+        extractor = JSONObjectExtractor()
+        extractor.feed('{"a": "x", "b": 3')
+        extractor.close()
+        
+        assert not extractor.complete
+    
+    def test_no_object(self):
+        """Test that output without any object is an error"""
+        with pytest.raises(AIResponseError):
+            extract_object('I cannot help with that.')
+
+
+class TestCoerceAnswers:
+    """Test cases for mapping model answers onto questions"""
+    
+    questions = [
+        {'id': 'text', 'answer_type': 'text', 'required': True},
+        {'id': 'number', 'answer_type': 'number', 'required': False},
+        {'id': 'boolean', 'answer_type': 'boolean', 'required': False},
+        {'id': 'radio', 'answer_type': 'radio', 'required': True, 'options': ['Male', 'Female', 'Other']},
+        {'id': 'checkbox', 'answer_type': 'checkbox', 'required': False, 'options': ['Sports', 'Music']},
+        {'id': 'file', 'answer_type': 'file', 'required': False},
+    ]
+    
+    def test_values_are_coerced(self):
+        """Test that values are mapped onto the type and exact options of their question"""
+        answers = {
+            'text': 7,
+            'number': '1,200',
+            'boolean': 'Yes',
+            'radio': ['  other '],
+            'checkbox': ['MUSIC', 'Chess', 'music'],
+            'file': 'cv.pdf',
+            'extra': 'dropped',
+        }
+        
+        coerced, invalid = coerce_answers(self.questions, answers)
+        
+        assert coerced == {
+            'text': '7',
+            'number': 1200,
+            'boolean': True,
+            'radio': 'Other',
+            'checkbox': ['Music'],
+            'file': None,
+        }
+        assert invalid == []
+    
+    def test_invalid_values_are_dropped(self):
+        """Test that values that cannot be mapped are reported and left out"""
+        answers = {'number': 'many', 'boolean': 'maybe', 'radio': 'Unknown', 'checkbox': ['Chess'], 'text': None}
+        
+        coerced, invalid = coerce_answers(self.questions, answers)
+        
+        assert coerced == {'text': None}
+        assert invalid == ['number', 'boolean', 'radio', 'checkbox']
@@ -0,0 +1,108 @@
+"""
+Tests for forms normalized answers
+"""
+import pytest
+from django.core.management import call_command
+from forms.models import Answer, FormQuestion, FormResponse, Questions
+from forms.submission import record_submission, record_submissions
+
+
+@pytest.fixture
+def store_answers(settings):
+    settings.FORM_STORE_ANSWERS = True
+
+
+@pytest.fixture
+def question_number(db):
+    """Create a number question"""
+    return Questions.objects.create(question='How old are you?', answer_type='number', required=False)
+
+
+@pytest.fixture
+def answers_form(form_with_questions, question_number):
+    FormQuestion.objects.create(form=form_with_questions, question=question_number, form_index=4)
+    return form_with_questions
+
+
+@pytest.fixture
+def answer(question_text, question_radio, question_checkbox, question_number):
+    def make(name, gender, interests, age):
+        return {
+            str(question_text.id): {'answer_type': 'text', 'value': name},
+            str(question_radio.id): {'answer_type': 'radio', 'value': gender},
+            str(question_checkbox.id): {'answer_type': 'checkbox', 'value': interests},
+            str(question_number.id): {'answer_type': 'number', 'value': age},
+        }
+    return make
+
+
+@pytest.mark.django_db
+class TestAnswers:
+    """Test cases for writing and querying the Answer table"""
+    
+    def test_disabled_by_default(self, answers_form, create_user, answer):
+        """Test that no rows are written unless FORM_STORE_ANSWERS is on"""
+        record_submission(answers_form, create_user(), answer('Ada', 'Female', ['Music'], 36))
+        
+        assert not Answer.objects.exists()
+    
+    def test_typed_rows(self, store_answers, answers_form, create_user, answer, question_checkbox, question_number):
+        """Test that answers are split into typed rows, one per checkbox option"""
+        response = record_submission(answers_form, create_user(), answer('Ada', 'Female', ['Music', 'Reading'], '36'))
+        
+        rows = Answer.objects.filter(response=response)
+        
+        assert rows.count() == 5
+        assert set(rows.filter(question=question_checkbox).values_list('text_value', flat=True)) == {'Music', 'Reading'}
+        assert rows.get(question=question_number).number_value == 36.0
+    
+    def test_filter_by_answer(self, store_answers, answers_form, create_user, answer, question_radio, question_checkbox, question_number):
+        """Test filtering responses by answer value"""
+        record_submissions(answers_form, [
+            (create_user(), answer('Ada', 'Female', ['Music'], 36)),
+            (create_user(), answer('Alan', 'Male', ['Reading'], 41)),
+            (create_user(), answer('Grace', 'Female', ['Music', 'Gaming'], 85)),
+        ])
+        
+        assert FormResponse.objects.with_answer(question_radio.id, 'Female').count() == 2
+        assert FormResponse.objects.with_answer(question_checkbox.id, 'Gaming').count() == 1
+        assert FormResponse.objects.with_answer(question_number.id, 41).count() == 1
+    
+    def test_padded_options_are_found(self, store_answers, answers_form, create_user, answer, question_radio, question_checkbox):
+        """Test that option values are stored and looked up stripped"""
+        record_submission(answers_form, create_user(), answer('Ada', 'Female ', [' Music'], 36))
+        
+        assert FormResponse.objects.with_answer(question_radio.id, 'Female').count() == 1
+        assert FormResponse.objects.with_answer(question_radio.id, ' Female ').count() == 1
+        assert FormResponse.objects.with_answer(question_checkbox.id, 'Music').count() == 1
+    
+    def test_deleted_with_response(self, store_answers, answers_form, create_user, answer):
+        """Test that rows are removed with their response"""
+        response = record_submission(answers_form, create_user(), answer('Ada', 'Female', [], 36))
+        
+        FormResponse.objects.get(id=response.id).delete()
+        
+        assert not Answer.objects.exists()
+    
+    def test_backfill_command(self, answers_form, create_user, answer, question_radio):
+        """Test that the backfill writes rows once for older responses"""
+        record_submission(answers_form, create_user(), answer('Ada', 'Female', ['Music'], 36))
+        record_submission(answers_form, create_user(), answer('Alan', 'Male', [], 41))
+        
+        call_command('backfill_answers', batch_size=1, stdout=open('/dev/null', 'w'))
+        call_command('backfill_answers', stdout=open('/dev/null', 'w'))
+        
+        assert Answer.objects.count() == 7
+        assert FormResponse.objects.with_answer(question_radio.id, 'Male').count() == 1
+    
+    def test_backfill_skips_unknown_questions(self, answers_form, create_user, question_text):
+        """Test that legacy answers of deleted questions or with odd keys do not abort the backfill"""
+        FormResponse.objects.create(form=answers_form, response={
+            str(question_text.id): {'answer_type': 'text', 'value': 'Ada'},
+            '00000000-0000-0000-0000-000000000000': {'answer_type': 'text', 'value': 'gone'},
+            'q1': {'answer_type': 'text', 'value': 'legacy'},
+        })
+        
+        call_command('backfill_answers', stdout=open('/dev/null', 'w'))
+        
+        assert list(Answer.objects.values_list('question_id', 'text_value')) == [(question_text.id, 'Ada')]
@@ -0,0 +1,70 @@
+"""
+Tests for the compact response format
+"""
+import json
+import pytest
+from django.core.management import call_command
+from forms.encoding import ResponseDecoder, compact_response, is_compact
+from forms.models import FormQuestion, FormResponse
+
+
+@pytest.fixture
+def expanded(question_text, question_radio):
+    return {
+        str(question_text.id): {'question': question_text.question, 'answer_type': 'text', 'value': 'Ada', 'required': True},
+        str(question_radio.id): {'question': question_radio.question, 'answer_type': 'radio', 'value': 'Female', 'required': True},
+    }
+
+
+@pytest.mark.django_db
+class TestResponseDecoder:
+    """Test cases for compacting and expanding responses"""
+    
+    def test_round_trip(self, form_with_questions, expanded):
+        """Test that a compact response expands to the original"""
+        compact = compact_response(expanded)
+        
+        assert is_compact(compact)
+        assert len(json.dumps(compact)) < len(json.dumps(expanded))
+        assert ResponseDecoder(form_with_questions.id).expand(compact) == expanded
+    
+    def test_legacy_passthrough(self, form_with_questions, expanded):
+        """Test that expanded responses are read as they are"""
+        assert ResponseDecoder(form_with_questions.id).expand(expanded) is expanded
+    
+    def test_removed_question(self, form_with_questions, question_radio, expanded):
+        """Test that questions taken off the form are still described"""
+        compact = compact_response(expanded)
+        FormQuestion.objects.filter(question=question_radio).delete()
+        
+        answer = ResponseDecoder(form_with_questions.id).expand(compact)[str(question_radio.id)]
+        
+        assert answer['answer_type'] == 'radio'
+        assert answer['question'] == question_radio.question
+    
+    def test_warm_form_costs_no_query(self, form_with_questions, expanded, django_assert_num_queries):
+        """Test that the schema comes from the cached plan"""
+        ResponseDecoder(form_with_questions.id)
+        
+        with django_assert_num_queries(0):
+            ResponseDecoder(form_with_questions.id).expand(compact_response(expanded))
+
+
+@pytest.mark.django_db
+class TestCompactResponsesCommand:
+    """Test cases for the compact_responses command"""
+    
+    def test_rewrite_and_back(self, form_with_questions, expanded):
+        """Test rewriting legacy rows in batches and expanding them again"""
+        ids = [FormResponse.objects.create(form=form_with_questions, response=expanded).id for _ in range(3)]
+        updated_at = FormResponse.objects.get(id=ids[0]).updated_at
+        
+        call_command('compact_responses', batch_size=2, stdout=open('/dev/null', 'w'))
+        
+        assert all(is_compact(r.response) for r in FormResponse.objects.all())
+        assert FormResponse.objects.get(id=ids[0]).updated_at == updated_at
+        assert FormResponse.objects.get(id=ids[0]).expanded_response() == expanded
+        
+        call_command('compact_responses', expand=True, stdout=open('/dev/null', 'w'))
+        
+        assert all(r.response == expanded for r in FormResponse.objects.all())
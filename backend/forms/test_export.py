@@ -0,0 +1,136 @@
+"""
+Tests for forms response export
+"""
+import csv
+import io
+import json
+import zipfile
+import pytest
+from forms.export import _xlsx_cell, export_response
+from forms.models import FormQuestion, FormResponse
+
+
+@pytest.fixture
+def exported_form(form_with_questions, question_text, question_radio, question_checkbox):
+    # Put the radio question first to check that columns follow form_index
+    FormQuestion.objects.filter(form=form_with_questions, question=question_radio).update(form_index=0)
+    for name, interests in (('Ada', ['Music', 'Reading']), ('Linus', [])):
+        FormResponse.objects.create(form=form_with_questions, response={
+            str(question_text.id): {'answer_type': 'text', 'value': name},
+            str(question_radio.id): {'answer_type': 'radio', 'value': 'Other'},
+            str(question_checkbox.id): {'answer_type': 'checkbox', 'value': interests},
+        })
+    return form_with_questions
+
+
+def content(response):
+    return b''.join(response.streaming_content)
+
+
+@pytest.mark.django_db
+class TestExport:
+    """Test cases for the streaming export formats"""
+    
+    def test_csv(self, exported_form, question_text, question_radio, question_checkbox):
+        """Test that CSV has one column per question in form order"""
+        response = export_response(exported_form, 'csv')
+        rows = list(csv.reader(io.StringIO(content(response).decode())))
+        
+        assert response.streaming
+        assert rows[0] == ['Response ID', 'Submitted At', question_radio.question, question_text.question, question_checkbox.question]
+        assert rows[1][2:] == ['Other', 'Ada', 'Music; Reading']
+        assert rows[2][2:] == ['Other', 'Linus', '']
+    
+    def test_csv_formulas_are_escaped(self, exported_form, question_text):
+        """Test that answers a spreadsheet would evaluate are written as text"""
+        FormResponse.objects.create(form=exported_form, response={
+            str(question_text.id): {'answer_type': 'text', 'value': '=HYPERLINK("http://evil.example")'},
+        })
+        FormResponse.objects.create(form=exported_form, response={
+            str(question_text.id): {'answer_type': 'text', 'value': '-1+2'},
+        })
+        
+        rows = list(csv.reader(io.StringIO(content(export_response(exported_form, 'csv')).decode())))
+        
+        assert rows[3][3] == '\'=HYPERLINK("http://evil.example")'
+        assert rows[4][3] == "'-1+2"
+        assert rows[1][3] == 'Ada'
+    
+    def test_ndjson(self, exported_form, question_text, question_checkbox):
+        """Test that NDJSON keeps answers as JSON values"""
+        response = export_response(exported_form, 'ndjson', chunk_size=1)
+        lines = [json.loads(line) for line in content(response).decode().splitlines()]
+        
+        assert len(lines) == 2
+        assert lines[0]['answers'][str(question_text.id)] == 'Ada'
+        assert lines[0]['answers'][str(question_checkbox.id)] == ['Music', 'Reading']
+    
+    def test_xlsx(self, exported_form):
+        """Test that the XLSX stream is a readable workbook"""
+        response = export_response(exported_form, 'xlsx', chunk_size=1)
+        
+        with zipfile.ZipFile(io.BytesIO(content(response))) as archive:
+            assert archive.testzip() is None
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        
+        assert sheet.count('<row>') == 3
+        assert 'Music; Reading' in sheet
+    
+    def test_xlsx_non_finite_numbers(self):
+        """Test that NaN and infinities are written as text instead of numeric cells"""
+        assert _xlsx_cell(1.5) == '<c t="n"><v>1.5</v></c>'
+        for value in (float('nan'), float('inf'), float('-inf')):
+            cell = _xlsx_cell(value)
+            
+            assert '<v>' not in cell
+            assert cell.startswith('<c t="inlineStr">')
+    
+    def test_unknown_format(self, exported_form):
+        """Test that unknown formats are rejected"""
+        with pytest.raises(ValueError):
+            export_response(exported_form, 'pdf')
+
+
+@pytest.mark.django_db
+class TestExportAPI:
+    """Test cases for the export endpoint and admin action"""
+    
+    def test_requires_admin(self, api_client, user, exported_form):
+        """Test that regular users cannot export"""
+        api_client.force_authenticate(user=user)
+        
+        response = api_client.get(f'/api/forms/{exported_form.id}/export/csv/')
+        
+        assert response.status_code == 403
+    
+    def test_export_as_admin(self, api_client, admin_user, exported_form):
+        """Test that admins get the file as an attachment"""
+        api_client.force_authenticate(user=admin_user)
+        
+        response = api_client.get(f'/api/forms/{exported_form.id}/export/ndjson/')
+        
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert 'attachment; filename="test-form-responses.ndjson"' == response['Content-Disposition']
+        assert len(content(response).splitlines()) == 2
+    
+    def test_unsupported_format(self, api_client, admin_user, exported_form):
+        """Test that unsupported formats return 400"""
+        api_client.force_authenticate(user=admin_user)
+        
+        response = api_client.get(f'/api/forms/{exported_form.id}/export/pdf/')
+        
+        assert response.status_code == 400
+    
+    def test_admin_action(self, client, admin_user, exported_form):
+        """Test exporting a form from the changelist action"""
+        client.force_login(admin_user)
+        
+        response = client.post('/admin-back-office/forms/form/', {
+            'action': 'export_csv',
+            '_selected_action': [str(exported_form.id)],
+        })
+        
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'text/csv'
+        assert len(content(response).decode().splitlines()) == 3
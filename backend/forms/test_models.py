@@ -3,8 +3,10 @@ Tests for forms models
 """
 import pytest
 import json
+from django.db import IntegrityError, transaction
 from django.core.files.uploadedfile import SimpleUploadedFile
 from forms.models import Form, Questions, FormQuestion, FormResponse, FormUser
+from forms.submission import record_submission, record_submissions
 
 
 @pytest.mark.django_db
@@ -192,6 +194,46 @@ class TestFormUserModel:
         # Should be able to query it
         exists = FormUser.objects.filter(user=user, form=form).exists()
         assert exists
+    
+    def test_submission_count_maintained(self, create_user, form):
+        """Test that the denormalized counter follows FormUser rows"""
+        users = [create_user() for _ in range(3)]
+        record_submission(form, users[0], {})
+        record_submissions(form, [(users[1], {}), (users[2], {})])
+        
+        form.refresh_from_db()
+        assert form.submission_count == 3
+        
+        FormUser.objects.get(user=users[0], form=form).delete()
+        form.refresh_from_db()
+        assert form.submission_count == 2
+    
+    def test_stale_form_save_keeps_count(self, user, form):
+        """Test that saving a form loaded before a submission keeps the count"""
+        stale = Form.objects.get(pk=form.pk)
+        record_submission(form, user, {})
+        
+        stale.name = 'Renamed'
+        stale.save()
+        
+        form.refresh_from_db()
+        assert form.name == 'Renamed'
+        assert form.submission_count == 1
+    
+    def test_with_submission_count(self, create_user, form):
+        """Test the annotated submission count"""
+        FormUser.objects.create(user=create_user(), form=form)
+        FormUser.objects.create(user=create_user(), form=form)
+        
+        assert Form.objects.with_submission_count().get(pk=form.pk).submissions == 2
+    
+    def test_form_user_unique_per_form(self, user, form):
+        """Test that the database rejects a second submission"""
+        FormUser.objects.create(user=user, form=form)
+        
+        with pytest.raises(IntegrityError):
+            with transaction.atomic():
+                FormUser.objects.create(user=user, form=form)
 
 
 @pytest.mark.django_db
@@ -0,0 +1,139 @@
+"""
+Tests for forms columnar snapshots
+"""
+import pytest
+from datetime import timedelta
+from django.core.management import call_command, CommandError
+from django.utils import timezone
+from forms import snapshots
+from forms.models import FormQuestion, FormResponse
+from forms.answers import typed_value
+from forms.snapshots import pending_responses, read_watermark, snapshot_form
+
+
+@pytest.fixture
+def snapshot_settings(settings, tmp_path):
+    settings.FORM_SNAPSHOT_DIR = str(tmp_path)
+    return settings
+
+
+@pytest.fixture
+def make_response(form_with_questions, question_text, question_checkbox):
+    def make(name, minutes_ago=10):
+        response = FormResponse.objects.create(form=form_with_questions, response={
+            str(question_text.id): {'answer_type': 'text', 'value': name},
+            str(question_checkbox.id): {'answer_type': 'checkbox', 'value': ['Music']},
+        })
+        FormResponse.objects.filter(id=response.id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return response
+    return make
+
+
+class TestTypedValue:
+    """Test cases for coercing answers to column types"""
+    
+    @pytest.mark.parametrize('answer_type, value, expected', [
+        ('number', '4.5', 4.5),
+        ('number', True, None),
+        ('number', 'abc', None),
+        ('boolean', False, False),
+        ('boolean', 'yes', None),
+        ('checkbox', ['A', 2], ['A', '2']),
+        ('file', {'file_path': 'blobs/ab/abc.pdf'}, 'blobs/ab/abc.pdf'),
+        ('radio', 'Male', 'Male'),
+    ])
+    def test_coercion(self, answer_type, value, expected):
+        """Test that values are coerced or dropped per answer type"""
+        assert typed_value(answer_type, {'answer_type': answer_type, 'value': value}) == expected
+    
+    def test_missing_answer(self):
+        """Test that unanswered questions are null"""
+        assert typed_value('text', None) is None
+
+
+@pytest.mark.django_db
+class TestPendingResponses:
+    """Test cases for selecting the responses of the next snapshot"""
+    
+    def test_after_watermark(self, form_with_questions, make_response):
+        """Test that only responses after the watermark are returned"""
+        older = make_response('A', minutes_ago=30)
+        newer = make_response('B', minutes_ago=20)
+        watermark = {'created_at': FormResponse.objects.get(id=older.id).created_at, 'id': str(older.id)}
+        
+        ids = [row[0] for row in pending_responses(form_with_questions.id, watermark)]
+        
+        assert ids == [newer.id]
+    
+    def test_until(self, form_with_questions, make_response):
+        """Test that responses newer than the lag are left for the next run"""
+        make_response('A', minutes_ago=30)
+        make_response('B', minutes_ago=0)
+        
+        rows = list(pending_responses(form_with_questions.id, until=timezone.now() - timedelta(minutes=1)))
+        
+        assert len(rows) == 1
+
+
+@pytest.mark.django_db
+class TestSnapshotCommand:
+    """Test cases for the snapshot_form_responses command"""
+    
+    def test_requires_pyarrow(self, snapshot_settings, form_with_questions, make_response, monkeypatch):
+        """Test that a missing pyarrow is reported as a command error"""
+        def unavailable():
+            raise snapshots.SnapshotUnavailable("Response snapshots require pyarrow to be installed")
+        monkeypatch.setattr(snapshots, '_pyarrow', unavailable)
+        
+        with pytest.raises(CommandError):
+            call_command('snapshot_form_responses', stdout=open('/dev/null', 'w'))
+    
+    def test_incremental_parts(self, snapshot_settings, form_with_questions, make_response, question_text, question_checkbox):
+        """Test that each run appends a typed part with only the new responses"""
+        pq = pytest.importorskip('pyarrow.parquet')
+        make_response('A', minutes_ago=30)
+        make_response('B', minutes_ago=20)
+        
+        assert snapshot_form(form_with_questions.id) == 2
+        assert snapshot_form(form_with_questions.id) == 0
+        make_response('C', minutes_ago=5)
+        assert snapshot_form(form_with_questions.id) == 1
+        
+        table = pq.read_table(snapshot_settings.FORM_SNAPSHOT_DIR + f'/{form_with_questions.id}')
+        
+        assert table.num_rows == 3
+        assert table.column(str(question_text.id)).to_pylist() == ['A', 'B', 'C']
+        assert table.schema.field(str(question_checkbox.id)).type.value_type == 'string'
+        assert read_watermark(form_with_questions.id)['part'] == 1
+    
+    def test_rebuild_when_columns_change(self, snapshot_settings, form_with_questions, make_response, question_text, question_radio):
+        """Test that a changed question list rebuilds the snapshot instead of mixing schemas"""
+        pq = pytest.importorskip('pyarrow.parquet')
+        make_response('A', minutes_ago=30)
+        snapshot_form(form_with_questions.id)
+        FormQuestion.objects.filter(form=form_with_questions, question=question_radio).delete()
+        make_response('B', minutes_ago=20)
+        
+        assert snapshot_form(form_with_questions.id) == 2
+        
+        table = pq.read_table(snapshot_settings.FORM_SNAPSHOT_DIR + f'/{form_with_questions.id}')
+        
+        assert table.num_rows == 2
+        assert str(question_radio.id) not in table.schema.names
+        assert read_watermark(form_with_questions.id)['part'] == 0
+    
+    def test_partial_part_is_hidden(self, snapshot_settings, form_with_questions, make_response, monkeypatch):
+        """Test that a run failing before publishing leaves nothing a dataset reader would pick up"""
+        ds = pytest.importorskip('pyarrow.dataset')
+        make_response('A', minutes_ago=30)
+        snapshot_form(form_with_questions.id)
+        make_response('B', minutes_ago=20)
+        
+        def crash(src, dst):
+            raise OSError("disk full")
+        monkeypatch.setattr(snapshots.os, 'replace', crash)
+        with pytest.raises(OSError):
+            snapshot_form(form_with_questions.id)
+        
+        directory = snapshot_settings.FORM_SNAPSHOT_DIR + f'/{form_with_questions.id}'
+        assert ds.dataset(directory).to_table().num_rows == 1
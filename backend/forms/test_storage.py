@@ -0,0 +1,174 @@
+"""
+Tests for form upload storage backends and blob deduplication
+"""
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from forms.encoding import compact_response
+from forms.models import FormQuestion, FormResponse, Questions, UploadedBlob
+from forms.storage import get_upload_storage, delete_upload, safe_extension
+from forms.blobs import store_upload, release_upload
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def object_store(settings, media_root):
+    settings.STORAGES = {
+        **settings.STORAGES,
+        'form_uploads': {
+            'BACKEND': 'forms.storage.ObjectStoreStorage',
+            'OPTIONS': {
+                'bucket': 'uploads',
+                'client': 'forms.storage.LocalObjectStoreClient',
+                'base_url': 'https://files.example.com',
+            },
+        },
+    }
+
+
+def pdf(content=b'%PDF-1.4 data', name='doc.pdf'):
+    return SimpleUploadedFile(name, content, content_type='application/pdf')
+
+
+class TestSafeExtension:
+    """Test cases for upload extension filtering"""
+    
+    def test_allowed_extension(self):
+        assert safe_extension('Report.PDF') == '.pdf'
+    
+    def test_disallowed_extension(self):
+        assert safe_extension('../../evil.sh') == '.txt'
+
+
+@pytest.mark.django_db
+class TestBlobStorage:
+    """Test cases for deduplicated uploads on the default backend"""
+    
+    def test_identical_uploads_stored_once(self, media_root):
+        first = store_upload(pdf())
+        second = store_upload(pdf())
+        
+        assert first == second
+        assert first.startswith('blobs/')
+        assert (media_root / first).read_bytes() == b'%PDF-1.4 data'
+        assert len(list((media_root / 'blobs').rglob('*.pdf'))) == 1
+        assert UploadedBlob.objects.get(name=first).ref_count == 2
+    
+    def test_different_uploads_stored_apart(self, media_root):
+        assert store_upload(pdf(b'a')) != store_upload(pdf(b'b'))
+    
+    def test_blob_removed_with_last_reference(self, media_root, django_capture_on_commit_callbacks):
+        name = store_upload(pdf())
+        store_upload(pdf())
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            release_upload(name)
+        assert (media_root / name).exists()
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            release_upload(name)
+        assert not (media_root / name).exists()
+        assert not UploadedBlob.objects.filter(name=name).exists()
+    
+    def test_release_legacy_upload(self, media_root, django_capture_on_commit_callbacks):
+        legacy = media_root / 'form_uploads' / 'old.pdf'
+        legacy.parent.mkdir()
+        legacy.write_bytes(b'old')
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            release_upload('form_uploads/old.pdf')
+        
+        assert not legacy.exists()
+    
+    def test_blob_stored_again_before_commit_is_kept(self, media_root, django_capture_on_commit_callbacks):
+        name = store_upload(pdf())
+        
+        blob = UploadedBlob.objects.get(name=name)
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            release_upload(name)
+            # Another request stores the same content before the commit
+            UploadedBlob.objects.create(digest=blob.digest, name=name, size=blob.size, ref_count=1)
+        
+        assert (media_root / name).exists()
+    
+    def test_failed_response_delete_keeps_blob(self, media_root, form, django_capture_on_commit_callbacks, monkeypatch):
+        name = store_upload(pdf())
+        form_response = FormResponse.objects.create(form=form, response={
+            'q': {'answer_type': 'file', 'value': {'file_path': name}}
+        })
+        
+        def fail(*args, **kwargs):
+            raise RuntimeError("delete failed")
+        monkeypatch.setattr('django.db.models.Model.delete', fail)
+        
+        with django_capture_on_commit_callbacks(execute=True), pytest.raises(RuntimeError):
+            form_response.delete()
+        
+        assert (media_root / name).exists()
+        assert UploadedBlob.objects.get(name=name).ref_count == 1
+    
+    def test_response_delete_after_question_delete(self, media_root, form, django_capture_on_commit_callbacks):
+        question = Questions.objects.create(question='Upload your ID', answer_type='file', required=False, file_type='application/pdf')
+        FormQuestion.objects.create(form=form, question=question, form_index=1)
+        name = store_upload(pdf())
+        form_response = FormResponse.objects.create(form=form, response=compact_response({
+            str(question.id): {'answer_type': 'file', 'value': {'file_path': name}}
+        }))
+        question.delete()
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            form_response.delete()
+        
+        assert not (media_root / name).exists()
+        assert not UploadedBlob.objects.filter(name=name).exists()
+    
+    def test_response_delete_keeps_shared_blob(self, media_root, form, django_capture_on_commit_callbacks):
+        name = store_upload(pdf())
+        store_upload(pdf())
+        responses = [
+            FormResponse.objects.create(form=form, response={
+                'q': {'answer_type': 'file', 'value': {'file_path': name}}
+            })
+            for _ in range(2)
+        ]
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            responses[0].delete()
+        assert (media_root / name).exists()
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            responses[1].delete()
+        assert not (media_root / name).exists()
+
+
+class TestObjectStoreStorage:
+    """Test cases for the object store backend against the local stand-in"""
+    
+    def test_save_open_delete(self, object_store, media_root):
+        storage = get_upload_storage()
+        name = storage.save('form_uploads/doc.pdf', pdf())
+        
+        assert (media_root / 'object-store' / 'uploads' / name).exists()
+        assert storage.exists(name)
+        assert storage.open(name).read() == b'%PDF-1.4 data'
+        assert storage.url(name) == f'https://files.example.com/{name}'
+        
+        delete_upload(name)
+        assert not storage.exists(name)
+    
+    @pytest.mark.django_db
+    def test_response_delete_removes_object(self, object_store, form, django_capture_on_commit_callbacks):
+        name = store_upload(pdf())
+        form_response = FormResponse.objects.create(form=form, response={
+            'q': {'answer_type': 'file', 'value': {'file_path': name}}
+        })
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            form_response.delete()
+        
+        assert not get_upload_storage().exists(name)
@@ -0,0 +1,90 @@
+"""
+Tests for the post-submission task pipeline
+"""
+import threading
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from forms.models import FormQuestion, Questions, UploadedBlob
+from forms.blobs import store_upload
+from forms.submission import record_submission
+from forms.tasks import enqueue
+
+
+def reject_all(name):
+    """Scan hook used by the tests"""
+    return False
+
+
+@pytest.mark.django_db
+class TestTaskPipeline:
+    """Test cases for forms.tasks"""
+    
+    def test_tasks_run_after_commit(self, django_capture_on_commit_callbacks):
+        """Test that enqueued tasks wait for the commit"""
+        calls = []
+        
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            enqueue(calls.append, 'done')
+            assert calls == []
+        
+        assert len(callbacks) == 1
+        assert calls == ['done']
+    
+    def test_tasks_run_on_executor(self, settings, django_capture_on_commit_callbacks):
+        """Test that without FORM_TASKS_EAGER tasks run on the worker pool"""
+        settings.FORM_TASKS_EAGER = False
+        done = threading.Event()
+        threads = []
+        
+        def task(value):
+            threads.append((value, threading.current_thread().name))
+            done.set()
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            enqueue(task, 'done')
+        
+        assert done.wait(timeout=5)
+        assert threads[0][0] == 'done'
+        assert threads[0][1].startswith('form-tasks')
+    
+    def test_failing_task_is_contained(self, django_capture_on_commit_callbacks):
+        """Test that a failing task does not propagate"""
+        with django_capture_on_commit_callbacks(execute=True):
+            enqueue(lambda: 1 / 0)
+    
+    def test_notification_email(self, settings, user, form, mailoutbox, django_capture_on_commit_callbacks):
+        """Test that configured recipients are notified of a submission"""
+        settings.FORM_NOTIFICATION_EMAILS = ['owner@example.com']
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            record_submission(form, user, {})
+        
+        assert len(mailoutbox) == 1
+        assert mailoutbox[0].to == ['owner@example.com']
+        assert form.name in mailoutbox[0].subject
+    
+    def test_no_notification_by_default(self, user, form, mailoutbox, django_capture_on_commit_callbacks):
+        """Test that nothing is sent without recipients"""
+        with django_capture_on_commit_callbacks(execute=True):
+            record_submission(form, user, {})
+        
+        assert mailoutbox == []
+    
+    def test_scan_hook_rejects_upload(self, settings, tmp_path, user, form, django_capture_on_commit_callbacks):
+        """Test that a file refused by the scan hook is released and flagged"""
+        settings.MEDIA_ROOT = str(tmp_path)
+        settings.FORM_UPLOAD_SCAN_HOOK = 'forms.test_tasks.reject_all'
+        question = Questions.objects.create(question='Upload', answer_type='file', file_type='application/pdf')
+        FormQuestion.objects.create(form=form, question=question, form_index=1)
+        name = store_upload(SimpleUploadedFile('doc.pdf', b'%PDF', content_type='application/pdf'))
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            form_response = record_submission(form, user, {
+                str(question.id): {'answer_type': 'file', 'value': {'name': 'doc.pdf', 'file_path': name}}
+            })
+        
+        form_response.refresh_from_db()
+        value = form_response.expanded_response()[str(question.id)]['value']
+        assert value['rejected'] is True
+        assert 'file_path' not in value
+        assert not UploadedBlob.objects.filter(name=name).exists()
@@ -0,0 +1,71 @@
+"""
+Tests for form submission validation plans
+"""
+import pytest
+from forms.validation import get_validation_plan, validate_responses, parse_options
+
+
+class TestParseOptions:
+    """Test cases for parse_options"""
+    
+    def test_parse_options(self):
+        """Test splitting options on ||"""
+        assert parse_options('Veg ||Non-Veg') == frozenset({'Veg', 'Non-Veg'})
+    
+    def test_parse_empty_options(self):
+        """Test that missing options give an empty set"""
+        assert parse_options(None) == frozenset()
+        assert parse_options('') == frozenset()
+
+
+@pytest.mark.django_db
+class TestValidationPlan:
+    """Test cases for compiled validation plans"""
+    
+    def test_plan_compiled_from_questions(self, form_with_questions, question_radio):
+        """Test that the plan has a rule per question"""
+        plan = get_validation_plan(form_with_questions.id)
+        
+        assert len(plan) == 3
+        rule = plan[str(question_radio.id)]
+        assert rule.answer_type == 'radio'
+        assert rule.options == frozenset({'Male', 'Female', 'Other'})
+    
+    def test_plan_is_cached(self, form_with_questions, django_assert_num_queries):
+        """Test that a warm plan costs no queries"""
+        get_validation_plan(form_with_questions.id)
+        
+        with django_assert_num_queries(0):
+            get_validation_plan(form_with_questions.id)
+    
+    def test_plan_rebuilt_after_question_change(self, form_with_questions, question_radio):
+        """Test that editing options is picked up"""
+        get_validation_plan(form_with_questions.id)
+        
+        question_radio.options = 'Yes||No'
+        question_radio.save()
+        
+        plan = get_validation_plan(form_with_questions.id)
+        assert plan[str(question_radio.id)].options == frozenset({'Yes', 'No'})
+    
+    def test_plan_for_disabled_form(self, form):
+        """Test that disabled forms have no plan"""
+        form.enable = False
+        form.save()
+        
+        assert get_validation_plan(form.id) is None
+    
+    def test_validate_responses(self, form_with_questions, question_text, question_radio, question_checkbox):
+        """Test validating a complete submission"""
+        plan = get_validation_plan(form_with_questions.id)
+        responses = {
+            str(question_text.id): {'value': 'John'},
+            str(question_radio.id): {'value': 'Male '},
+            str(question_checkbox.id): {'value': []},
+        }
+        
+        cleaned, errors = validate_responses(plan, responses)
+        
+        assert errors == {}
+        assert set(cleaned) == {str(question_text.id), str(question_radio.id)}
+        assert cleaned[str(question_radio.id)]['answer_type'] == 'radio'
@@ -3,9 +3,16 @@ Tests for forms views and APIs
 """
 import pytest
 import json
+import hashlib
 from django.urls import reverse
+from django.core.cache import cache
+from django.db import IntegrityError
 from rest_framework import status
-from forms.models import FormResponse, FormUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from forms.models import FormResponse, FormUser, FormQuestion, Questions, UploadedBlob
+from forms.uploads import file_type_allowed
+from utils.cache import cache_key, FORMS
+from forms.submission import record_submission, DuplicateSubmission
 
 
 @pytest.mark.django_db
@@ -49,6 +56,106 @@ class TestGetFormByIdAPI:
         indices = [q['form_index'] for q in questions]
         
         assert indices == sorted(indices)
+    
+    def test_cached_form_served_without_queries(self, api_client, form_with_questions, django_assert_num_queries):
+        """Test that a hot form is served from the schema cache"""
+        url = f'/api/forms/{form_with_questions.id}/'
+        first = api_client.get(url)
+        
+        with django_assert_num_queries(0):
+            second = api_client.get(url)
+        
+        assert second.status_code == status.HTTP_200_OK
+        assert second.data == first.data
+    
+    def test_question_change_invalidates_cache(self, api_client, form_with_questions, question_text):
+        """Test that editing a question is visible on the next load"""
+        url = f'/api/forms/{form_with_questions.id}/'
+        api_client.get(url)
+        
+        question_text.question = 'What is your full name?'
+        question_text.save()
+        
+        response = api_client.get(url)
+        texts = [q['question']['question'] for q in response.data['form_questions']]
+        assert 'What is your full name?' in texts
+    
+    def test_removed_question_invalidates_cache(self, api_client, form_with_questions):
+        """Test that removing a question from the form is visible on the next load"""
+        url = f'/api/forms/{form_with_questions.id}/'
+        api_client.get(url)
+        
+        form_with_questions.formquestion_set.order_by('form_index').first().delete()
+        
+        response = api_client.get(url)
+        assert len(response.data['form_questions']) == 2
+    
+    def test_schema_cached_before_commit_is_dropped(self, api_client, form_with_questions, question_text, django_capture_on_commit_callbacks):
+        """Test that a schema cached while the change was uncommitted is forgotten on commit"""
+        url = f'/api/forms/{form_with_questions.id}/'
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            question_text.question = 'What is your full name?'
+            question_text.save()
+            # Stands in for a request that read the old rows before the commit
+            cache.set(cache_key(FORMS, 'version', form_with_questions.id), {'version': 'stale', 'last_modified': question_text.updated_at}, 60)
+            cache.set(cache_key(FORMS, 'schema', form_with_questions.id, 'stale'), {'form_questions': []}, 60)
+        
+        response = api_client.get(url)
+        texts = [q['question']['question'] for q in response.data['form_questions']]
+        assert 'What is your full name?' in texts
+    
+    def test_disabling_form_invalidates_cache(self, api_client, form_with_questions):
+        """Test that a cached form stops being served once disabled"""
+        url = f'/api/forms/{form_with_questions.id}/'
+        api_client.get(url)
+        
+        form_with_questions.enable = False
+        form_with_questions.save()
+        
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+    
+    def test_etag_and_last_modified_headers(self, api_client, form_with_questions):
+        """Test that form definitions carry validators"""
+        url = f'/api/forms/{form_with_questions.id}/'
+        response = api_client.get(url)
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'].startswith('"')
+        assert not response['ETag'].startswith('W/')
+        assert response['Last-Modified']
+    
+    def test_if_none_match_returns_304(self, api_client, form_with_questions, django_assert_num_queries):
+        """Test that an unchanged form is not sent again"""
+        url = f'/api/forms/{form_with_questions.id}/'
+        etag = api_client.get(url)['ETag']
+        
+        with django_assert_num_queries(0):
+            response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert not response.content
+    
+    def test_if_none_match_after_change(self, api_client, form_with_questions, question_radio):
+        """Test that a stale ETag gets the new definition"""
+        url = f'/api/forms/{form_with_questions.id}/'
+        etag = api_client.get(url)['ETag']
+        
+        question_radio.options = 'Male||Female||Other||Prefer not to say'
+        question_radio.save()
+        
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+    
+    def test_if_modified_since_returns_304(self, api_client, form_with_questions):
+        """Test conditional GET on Last-Modified"""
+        url = f'/api/forms/{form_with_questions.id}/'
+        last_modified = api_client.get(url)['Last-Modified']
+        
+        response = api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
 
 
 @pytest.mark.django_db
@@ -170,12 +277,16 @@ class TestSubmitFormResponse:
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert 'Form not found or disabled' in response.data['message']
     
-    def test_submit_form_twice(self, api_client, user, form_with_questions):
+    def test_submit_form_twice(self, api_client, user, form_with_questions, question_text, question_radio):
         """Test that user cannot submit same form twice"""
         responses = {
-            str(form_with_questions.formquestion_set.all()[0].question.id): {
+            str(question_text.id): {
                 'answer_type': 'text',
                 'value': 'Answer'
+            },
+            str(question_radio.id): {
+                'answer_type': 'radio',
+                'value': 'Female'
             }
         }
         
@@ -195,6 +306,28 @@ class TestSubmitFormResponse:
         response2 = api_client.post(url, data, format='multipart')
         assert response2.status_code == status.HTTP_400_BAD_REQUEST
         assert 'already submitted' in response2.data['message']
+        assert FormResponse.objects.filter(form=form_with_questions).count() == 1
+    
+    def test_duplicate_rejected_without_precheck(self, user, form_with_questions):
+        """Test that the write path relies on the unique constraint"""
+        record_submission(form_with_questions, user, {})
+        
+        with pytest.raises(DuplicateSubmission):
+            record_submission(form_with_questions, user, {})
+        
+        assert FormUser.objects.filter(user=user, form=form_with_questions).count() == 1
+        assert FormResponse.objects.filter(form=form_with_questions).count() == 1
+    
+    def test_other_integrity_errors_are_not_duplicates(self, user, form_with_questions, monkeypatch):
+        """Test that only the unique_form_user conflict means an existing submission"""
+        def fail(form_id, responses_list):
+            raise IntegrityError('FOREIGN KEY constraint failed')
+        monkeypatch.setattr('forms.submission.add_responses', fail)
+        
+        with pytest.raises(IntegrityError):
+            record_submission(form_with_questions, user, {})
+        
+        assert not FormUser.objects.filter(user=user, form=form_with_questions).exists()
     
     def test_submit_form_without_responses(self, api_client, user, form_with_questions):
         """Test submitting form without responses"""
@@ -210,6 +343,331 @@ class TestSubmitFormResponse:
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert 'Form responses are required' in response.data['message']
 
+    
+    def _submit(self, api_client, user, form, responses):
+        data = {
+            'user_code': user.code,
+            'formId': str(form.id),
+            'responses': json.dumps(responses)
+        }
+        return api_client.post('/api/forms/submit/', data, format='multipart')
+    
+    def test_submit_form_missing_required_answer(self, api_client, user, form_with_questions, question_text):
+        """Test that required questions must be answered"""
+        responses = {
+            str(question_text.id): {'answer_type': 'text', 'value': 'John'}
+        }
+        
+        response = self._submit(api_client, user, form_with_questions, responses)
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['message'] == 'Some answers are invalid!'
+        assert len(response.data['errors']) == 1
+        assert not FormUser.objects.filter(user=user).exists()
+    
+    def test_submit_form_invalid_option(self, api_client, user, form_with_questions, question_text, question_radio, question_checkbox):
+        """Test that option answers must come from the question's options"""
+        responses = {
+            str(question_text.id): {'answer_type': 'text', 'value': 'John'},
+            str(question_radio.id): {'answer_type': 'radio', 'value': 'Unknown'},
+            str(question_checkbox.id): {'answer_type': 'checkbox', 'value': ['Music', 'Cooking']},
+        }
+        
+        response = self._submit(api_client, user, form_with_questions, responses)
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data['errors']) == {str(question_radio.id), str(question_checkbox.id)}
+    
+    def test_submit_form_text_too_long(self, api_client, user, form_with_questions, question_text, question_radio):
+        """Test that text answers respect max_len"""
+        responses = {
+            str(question_text.id): {'answer_type': 'text', 'value': 'x' * 101},
+            str(question_radio.id): {'answer_type': 'radio', 'value': 'Male'},
+        }
+        
+        response = self._submit(api_client, user, form_with_questions, responses)
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert str(question_text.id) in response.data['errors']
+    
+    def test_submit_form_unknown_question(self, api_client, user, form_with_questions, question_text, question_radio):
+        """Test that answers to questions outside the form are rejected"""
+        responses = {
+            str(question_text.id): {'answer_type': 'text', 'value': 'John'},
+            str(question_radio.id): {'answer_type': 'radio', 'value': 'Male'},
+            'not-a-question': {'answer_type': 'text', 'value': 'x'},
+        }
+        
+        response = self._submit(api_client, user, form_with_questions, responses)
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'not-a-question' in response.data['errors']
+    
+    def test_submit_form_stores_schema_fields(self, api_client, user, form_with_questions, question_text, question_radio):
+        """Test that question metadata is taken from the form, not the client"""
+        responses = {
+            str(question_text.id): {'question': 'Forged', 'answer_type': 'file', 'required': False, 'value': 'John'},
+            str(question_radio.id): {'answer_type': 'radio', 'value': 'Male'},
+        }
+        
+        response = self._submit(api_client, user, form_with_questions, responses)
+        
+        assert response.status_code == status.HTTP_201_CREATED
+        form_response = FormResponse.objects.get(id=response.data['response_id'])
+        stored = form_response.expanded_response()[str(question_text.id)]
+        assert form_response.response['answers'][str(question_text.id)] == 'John'
+        assert stored['question'] == question_text.question
+        assert stored['answer_type'] == 'text'
+        assert stored['required'] is True
+
+
+
+
+@pytest.mark.django_db
+class TestSubmitFormUploads:
+    """Test cases for file uploads on SubmitFormResponse"""
+    
+    @pytest.fixture
+    def question_file(self, db):
+        return Questions.objects.create(
+            question='Upload your ID',
+            answer_type='file',
+            required=False,
+            min_len=0,
+            max_len=1,
+            file_type='application/pdf'
+        )
+    
+    @pytest.fixture
+    def file_form(self, form, question_file):
+        FormQuestion.objects.create(form=form, question=question_file, form_index=1)
+        return form
+    
+    @pytest.fixture(autouse=True)
+    def media_root(self, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+        return tmp_path
+    
+    def _submit(self, api_client, user, form, question, upload, query=True):
+        data = {
+            'user_code': user.code,
+            'formId': str(form.id),
+            f'file_{question.id}': upload,
+            'responses': json.dumps({
+                str(question.id): {'answer_type': 'file', 'value': {'name': upload.name}}
+            })
+        }
+        url = f'/api/forms/submit/?formId={form.id}' if query else '/api/forms/submit/'
+        return api_client.post(url, data, format='multipart')
+    
+    def test_upload_success(self, api_client, user, file_form, question_file, media_root):
+        """Test storing a valid upload"""
+        upload = SimpleUploadedFile('id.pdf', b'%PDF-1.4 data', content_type='application/pdf')
+        
+        response = self._submit(api_client, user, file_form, question_file, upload)
+        
+        assert response.status_code == status.HTTP_201_CREATED
+        stored = FormResponse.objects.get(id=response.data['response_id']).expanded_response()[str(question_file.id)]
+        assert (media_root / stored['value']['file_path']).exists()
+    
+    def test_upload_deduplicated(self, api_client, create_user, file_form, question_file):
+        """Test that the same file uploaded twice is stored once"""
+        paths = []
+        for _ in range(2):
+            upload = SimpleUploadedFile('id.pdf', b'%PDF-1.4 same', content_type='application/pdf')
+            response = self._submit(api_client, create_user(), file_form, question_file, upload)
+            stored = FormResponse.objects.get(id=response.data['response_id']).expanded_response()[str(question_file.id)]
+            paths.append(stored['value']['file_path'])
+        
+        assert paths[0] == paths[1]
+        blob = UploadedBlob.objects.get(name=paths[0])
+        assert blob.ref_count == 2
+        assert blob.digest == hashlib.sha256(b'%PDF-1.4 same').hexdigest()
+    
+    def test_failed_submission_releases_uploads(self, api_client, user, file_form, question_file, media_root, monkeypatch, django_capture_on_commit_callbacks):
+        """Test that uploads are released when storing the response fails for any reason"""
+        def fail(form, user, responses):
+            raise IntegrityError('FOREIGN KEY constraint failed')
+        monkeypatch.setattr('forms.views.record_submission', fail)
+        upload = SimpleUploadedFile('id.pdf', b'%PDF-1.4 data', content_type='application/pdf')
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            response = self._submit(api_client, user, file_form, question_file, upload)
+        
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        assert not UploadedBlob.objects.exists()
+        assert not list(media_root.rglob('*.pdf'))
+    
+    def test_oversized_upload_stopped_while_streaming(self, api_client, user, file_form, question_file, media_root, monkeypatch):
+        """Test that an upload over max_len is aborted by the upload handler"""
+        # Leave the handler as the only check
+        monkeypatch.setattr('forms.views.check_uploaded_file', lambda *args: None)
+        upload = SimpleUploadedFile('big.pdf', b'x' * (1024 * 1024 + 1), content_type='application/pdf')
+        
+        response = self._submit(api_client, user, file_form, question_file, upload)
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['message'] == 'Some files were rejected!'
+        assert str(question_file.id) in response.data['errors']
+        assert not FormResponse.objects.exists()
+        assert not any(media_root.iterdir())
+    
+    def test_wrong_type_stopped_while_streaming(self, api_client, user, file_form, question_file, monkeypatch):
+        """Test that a file of the wrong MIME type is rejected"""
+        monkeypatch.setattr('forms.views.check_uploaded_file', lambda *args: None)
+        upload = SimpleUploadedFile('photo.png', b'\x89PNG', content_type='image/png')
+        
+        response = self._submit(api_client, user, file_form, question_file, upload)
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'application/pdf' in response.data['errors'][str(question_file.id)]
+    
+    def test_oversized_upload_without_form_in_query(self, api_client, user, file_form, question_file, media_root):
+        """Test that limits still apply when the handler could not know the form"""
+        upload = SimpleUploadedFile('big.pdf', b'x' * (1024 * 1024 + 1), content_type='application/pdf')
+        
+        response = self._submit(api_client, user, file_form, question_file, upload, query=False)
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert str(question_file.id) in response.data['errors']
+        assert not any(media_root.iterdir())
+
+
+class TestFileTypeAllowed:
+    """Test cases for MIME type matching"""
+    
+    def test_wildcards(self):
+        assert file_type_allowed('none', 'application/zip')
+        assert file_type_allowed('*/*', 'application/zip')
+        assert file_type_allowed('image/*', 'image/jpeg')
+        assert not file_type_allowed('image/*', 'application/pdf')
+    
+    def test_exact_type(self):
+        assert file_type_allowed('application/pdf', 'application/pdf; charset=binary')
+        assert not file_type_allowed('application/pdf', 'text/plain')
+
+
+@pytest.mark.django_db
+class TestBatchSubmitFormResponse:
+    """Test cases for BatchSubmitFormResponse API"""
+    
+    url = '/api/forms/submit/batch/'
+    
+    @pytest.fixture(autouse=True)
+    def staff(self, api_client, admin_user):
+        api_client.force_authenticate(user=admin_user)
+    
+    def _responses(self, question_text, question_radio, name='John'):
+        return {
+            str(question_text.id): {'answer_type': 'text', 'value': name},
+            str(question_radio.id): {'answer_type': 'radio', 'value': 'Male'},
+        }
+    
+    def test_batch_submit_success(self, api_client, create_user, form_with_questions, question_text, question_radio):
+        """Test storing several submissions at once"""
+        users = [create_user() for _ in range(3)]
+        data = {
+            'formId': str(form_with_questions.id),
+            'submissions': [
+                {'user_code': u.code, 'responses': self._responses(question_text, question_radio)}
+                for u in users
+            ]
+        }
+        
+        response = api_client.post(self.url, data, format='json')
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['created'] == 3
+        assert response.data['failed'] == 0
+        assert all(r['status'] == 'created' for r in response.data['results'])
+        assert FormResponse.objects.filter(form=form_with_questions).count() == 3
+        assert FormUser.objects.filter(form=form_with_questions).count() == 3
+    
+    def test_batch_submit_query_count(self, api_client, create_user, form_with_questions, question_text, question_radio, django_assert_max_num_queries):
+        """Test that the batch cost does not grow with its size"""
+        users = [create_user() for _ in range(20)]
+        data = {
+            'formId': str(form_with_questions.id),
+            'submissions': [
+                {'user_code': u.code, 'responses': self._responses(question_text, question_radio)}
+                for u in users
+            ]
+        }
+        api_client.get(f'/api/forms/{form_with_questions.id}/')
+        
+        # Answer statistics add a few queries per distinct answer, not per submission
+        with django_assert_max_num_queries(13):
+            response = api_client.post(self.url, data, format='json')
+        
+        assert response.data['created'] == 20
+    
+    def test_batch_submit_per_item_results(self, api_client, create_user, form_with_questions, question_text, question_radio):
+        """Test that invalid items are reported without blocking the others"""
+        done, fresh = create_user(), create_user()
+        FormUser.objects.create(user=done, form=form_with_questions)
+        data = {
+            'formId': str(form_with_questions.id),
+            'submissions': [
+                {'user_code': fresh.code, 'responses': self._responses(question_text, question_radio)},
+                {'user_code': 'INVALID', 'responses': self._responses(question_text, question_radio)},
+                {'user_code': done.code, 'responses': self._responses(question_text, question_radio)},
+                {'user_code': fresh.code, 'responses': self._responses(question_text, question_radio)},
+                {'user_code': create_user().code, 'responses': {str(question_text.id): {'value': 'John'}}},
+            ]
+        }
+        
+        response = api_client.post(self.url, data, format='json')
+        results = response.data['results']
+        
+        assert response.data['created'] == 1
+        assert results[0]['status'] == 'created'
+        assert results[1]['message'] == 'Invalid user code!'
+        assert results[2]['message'] == 'You have already submitted this form!'
+        assert results[3]['message'] == 'You have already submitted this form!'
+        assert str(question_radio.id) in results[4]['errors']
+    
+    def test_batch_submit_disabled_form(self, api_client, user, form):
+        """Test batch submission to a disabled form"""
+        form.enable = False
+        form.save()
+        
+        data = {'formId': str(form.id), 'submissions': [{'user_code': user.code, 'responses': {}}]}
+        response = api_client.post(self.url, data, format='json')
+        
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+    
+    def test_batch_submit_without_submissions(self, api_client, form):
+        """Test batch submission without any item"""
+        response = api_client.post(self.url, {'formId': str(form.id), 'submissions': []}, format='json')
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+    
+    def test_batch_submit_requires_staff(self, api_client, user, form_with_questions, question_text, question_radio):
+        """Test that user codes cannot be probed without staff access"""
+        data = {
+            'formId': str(form_with_questions.id),
+            'submissions': [{'user_code': user.code, 'responses': self._responses(question_text, question_radio)}]
+        }
+        
+        api_client.force_authenticate(user=None)
+        anonymous = api_client.post(self.url, data, format='json')
+        api_client.force_authenticate(user=user)
+        regular = api_client.post(self.url, data, format='json')
+        
+        assert anonymous.status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+        assert regular.status_code == status.HTTP_403_FORBIDDEN
+        assert not FormResponse.objects.filter(form=form_with_questions).exists()
+    
+    def test_batch_submit_rate_limit(self, api_client, form, settings):
+        """Test that batches are throttled per staff user"""
+        settings.FORM_BATCH_SUBMIT_RATE = '1/min'
+        
+        first = api_client.post(self.url, {'formId': str(form.id), 'submissions': []}, format='json')
+        second = api_client.post(self.url, {'formId': str(form.id), 'submissions': []}, format='json')
+        
+        assert first.status_code == status.HTTP_400_BAD_REQUEST
+        assert second.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
 
 @pytest.mark.django_db
 class TestAIFillFormAPI:
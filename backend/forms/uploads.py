@@ -0,0 +1,138 @@
+"""
+Upload handling for form submissions.
+
+``FormUploadHandler`` sits in front of Django's default upload handlers and
+checks every file against the question it answers while the request body
+is still being read: a file whose declared MIME type does not match the
+question's ``file_type``, or whose size goes over the question's ``max_len``
+(in MB), stops the upload right away instead of being spooled to memory or
+disk first.
+
+The form is taken from the ``formId`` query parameter, since upload
+handlers only see the request before its body is parsed. Without it the
+handler lets every file through and ``check_uploaded_file`` is applied to
+the parsed files instead.
+
+The handler also hashes every file as it streams in; the digests, keyed by
+field name, let ``forms.blobs`` deduplicate uploads without reading them
+again.
+"""
+import hashlib
+import logging
+import uuid
+
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from .validation import get_validation_plan
+
+logger = logging.getLogger(__name__)
+
+FILE_FIELD_PREFIX = 'file_'
+MEGABYTE = 1024 * 1024
+
+
+def file_type_allowed(file_type, content_type):
+    """Return whether a declared ``content_type`` matches a question's ``file_type``."""
+    if not file_type or file_type in ('none', '*/*'):
+        return True
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if file_type.endswith('/*'):
+        return content_type.startswith(file_type[:-1])
+    return content_type == file_type
+
+
+def max_upload_size(rule):
+    """Return the largest accepted size in bytes for a file question, or ``None``."""
+    return rule.max_len * MEGABYTE if rule.max_len > 0 else None
+
+
+def check_uploaded_file(rule, content_type, size):
+    """Return an error message for an uploaded file, or ``None`` if it is acceptable."""
+    if rule.answer_type != 'file':
+        return 'This question does not accept files.'
+    if not file_type_allowed(rule.file_type, content_type):
+        return f'Only {rule.file_type} files are accepted.'
+    limit = max_upload_size(rule)
+    if limit is not None and size > limit:
+        return f'File size must be less than {rule.max_len} MB.'
+    if rule.min_len > 0 and size < rule.min_len * MEGABYTE:
+        return f'File size must be at least {rule.min_len} MB.'
+    return None
+
+
+class FormUploadHandler(FileUploadHandler):
+    """
+    Enforce a form's file rules while the upload streams in.
+
+    Rejections are collected in ``errors`` (question id to message) for the
+    view to report, SHA-256 digests of accepted files in ``digests``.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = {}
+        self.digests = {}
+        self.hasher = None
+        self._plan = None
+        self._plan_loaded = False
+        self.rule = None
+        self.question_id = None
+        self.limit = None
+        self.received = 0
+
+    @property
+    def plan(self):
+        if not self._plan_loaded:
+            self._plan_loaded = True
+            form_id = self.request.GET.get('formId') if self.request is not None else None
+            try:
+                form_id = uuid.UUID(str(form_id))
+            except ValueError:
+                return None
+            self._plan = get_validation_plan(form_id)
+        return self._plan
+
+    def reject(self, message):
+        self.errors[self.question_id or self.field_name] = message
+        logger.warning(f"Upload rejected for {self.field_name}: {message}")
+        # Stop reading the request body right away
+        raise StopUpload(connection_reset=True)
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.received = 0
+        self.hasher = hashlib.sha256()
+        self.rule = None
+        self.limit = None
+        self.question_id = None
+
+        plan = self.plan
+        if plan is None:
+            return
+
+        if field_name.startswith(FILE_FIELD_PREFIX):
+            self.question_id = field_name[len(FILE_FIELD_PREFIX):]
+        self.rule = plan.get(self.question_id)
+
+        if self.rule is None or self.rule.answer_type != 'file':
+            self.reject('This question does not accept files.')
+        if not file_type_allowed(self.rule.file_type, content_type):
+            self.reject(f'Only {self.rule.file_type} files are accepted.')
+
+        self.limit = max_upload_size(self.rule)
+        if self.limit is not None and content_length is not None and content_length > self.limit:
+            self.reject(f'File size must be less than {self.rule.max_len} MB.')
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.limit is not None and self.received > self.limit:
+            self.reject(f'File size must be less than {self.rule.max_len} MB.')
+        self.hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        # The actual file object is built by the next handler
+        self.digests[self.field_name] = self.hasher.hexdigest()
+        if self.rule is not None and self.rule.min_len > 0 and file_size < self.rule.min_len * MEGABYTE:
+            self.errors[self.question_id] = f'File size must be at least {self.rule.min_len} MB.'
+        return None
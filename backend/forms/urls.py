@@ -1,9 +1,13 @@
 from django.urls import path
-from .views import GetFormByIdAPI, SubmitFormResponse, GetCSRFToken, AIFillFormAPI
+from .views import GetFormByIdAPI, FormStatisticsAPI, ExportFormResponsesAPI, SubmitFormResponse, BatchSubmitFormResponse, GetCSRFToken, AIFillFormAPI, AIFillFormStreamView
 
 urlpatterns = [
     path('forms/<uuid:form_id>/', GetFormByIdAPI.as_view(), name='get-form-by-id'),
+    path('forms/<uuid:form_id>/stats/', FormStatisticsAPI.as_view(), name='form-statistics'),
+    path('forms/<uuid:form_id>/export/<str:export_format>/', ExportFormResponsesAPI.as_view(), name='export-form-responses'),
     path('forms/submit/', SubmitFormResponse.as_view(), name='submit-form'),
+    path('forms/submit/batch/', BatchSubmitFormResponse.as_view(), name='submit-form-batch'),
     path('forms/ai-fill/', AIFillFormAPI.as_view(), name='ai-fill-form'),
+    path('forms/ai-fill/stream/', AIFillFormStreamView.as_view(), name='ai-fill-form-stream'),
     path('csrf-token/', GetCSRFToken.as_view(), name='get-csrf-token'),
 ]
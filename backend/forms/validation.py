@@ -0,0 +1,169 @@
+"""
+Server-side validation of form submissions.
+
+Each form is compiled once into a *validation plan*: a mapping of question
+id to a ``QuestionRule`` holding everything needed to check an answer
+(type, required flag, length bounds and the option set parsed from
+``Questions.options``). Plans are cached under the form version from
+``forms.cache``, so validating a submission costs no extra queries once the
+form is warm and is rebuilt automatically when the form changes.
+"""
+from dataclasses import dataclass
+from numbers import Number
+
+from django.core.cache import cache
+
+from utils.cache import cache_key, FORMS
+from .cache import get_form_version, SCHEMA_CACHE_TIMEOUT
+from .models import FormQuestion
+
+
+@dataclass(frozen=True)
+class QuestionRule:
+    question: str
+    answer_type: str
+    required: bool
+    min_len: int
+    max_len: int
+    options: frozenset
+    file_type: str
+
+    def check(self, value):
+        """Return an error message for ``value``, or ``None`` if it is valid."""
+        if is_empty(value):
+            return 'This question is required.' if self.required else None
+
+        checker = getattr(self, f'_check_{self.answer_type}', None)
+        if checker is None:
+            return f'Unsupported answer type: {self.answer_type}'
+        return checker(value)
+
+    def _check_text(self, value):
+        if not isinstance(value, str):
+            return 'Expected a text answer.'
+        if self.min_len > 0 and len(value) < self.min_len:
+            return f'Minimum {self.min_len} characters required.'
+        if self.max_len > 0 and len(value) > self.max_len:
+            return f'Maximum {self.max_len} characters allowed.'
+        return None
+
+    def _check_number(self, value):
+        if isinstance(value, bool):
+            return 'Expected a number.'
+        if isinstance(value, Number):
+            return None
+        try:
+            float(value)
+        except (TypeError, ValueError):
+            return 'Expected a number.'
+        return None
+
+    def _check_boolean(self, value):
+        if not isinstance(value, bool):
+            return 'Expected true or false.'
+        return None
+
+    def _check_option(self, value):
+        if not isinstance(value, str) or value.strip() not in self.options:
+            return 'Select one of the available options.'
+        return None
+
+    _check_radio = _check_option
+    _check_select = _check_option
+
+    def _check_checkbox(self, value):
+        if not isinstance(value, list):
+            return 'Expected a list of options.'
+        for item in value:
+            if not isinstance(item, str) or item.strip() not in self.options:
+                return 'Select only the available options.'
+        return None
+
+    def _check_file(self, value):
+        if not isinstance(value, dict):
+            return 'Expected a file.'
+        return None
+
+
+def is_empty(value):
+    return value is None or value == '' or value == [] or value == {}
+
+
+def parse_options(options):
+    """Split ``Questions.options`` on ``||`` into a frozenset of trimmed options."""
+    if not options:
+        return frozenset()
+    return frozenset(option.strip() for option in options.split('||'))
+
+
+def compile_validation_plan(form_id):
+    """Build the validation plan of a form from its questions."""
+    form_questions = FormQuestion.objects.filter(form_id=form_id).select_related('question')
+    plan = {}
+    for fq in form_questions:
+        q = fq.question
+        plan[str(q.id)] = QuestionRule(
+            question=q.question,
+            answer_type=q.answer_type,
+            required=q.required,
+            min_len=q.min_len,
+            max_len=q.max_len,
+            options=parse_options(q.options),
+            file_type=q.file_type,
+        )
+    return plan
+
+
+def get_validation_plan(form_id):
+    """Return the cached validation plan of an enabled form, or ``None``."""
+    entry = get_form_version(form_id)
+    if entry is None:
+        return None
+
+    key = cache_key(FORMS, 'plan', form_id, entry['version'])
+    plan = cache.get(key)
+    if plan is None:
+        plan = compile_validation_plan(form_id)
+        cache.set(key, plan, SCHEMA_CACHE_TIMEOUT)
+    return plan
+
+
+def validate_responses(plan, responses):
+    """
+    Check submitted ``responses`` against a validation plan.
+
+    Returns ``(cleaned, errors)``. ``cleaned`` holds one entry per answered
+    question with ``question``, ``answer_type`` and ``required`` taken from
+    the plan rather than from the client; ``errors`` maps question ids to
+    messages and is empty when the submission is valid.
+    """
+    cleaned = {}
+    errors = {}
+
+    for question_id, answer in responses.items():
+        rule = plan.get(str(question_id))
+        if rule is None:
+            errors[str(question_id)] = 'Unknown question.'
+            continue
+
+        value = answer.get('value') if isinstance(answer, dict) else answer
+        error = rule.check(value)
+        if error:
+            errors[str(question_id)] = error
+            continue
+
+        if is_empty(value):
+            continue
+
+        cleaned[str(question_id)] = {
+            'question': rule.question,
+            'answer_type': rule.answer_type,
+            'value': value,
+            'required': rule.required,
+        }
+
+    for question_id, rule in plan.items():
+        if rule.required and question_id not in responses and question_id not in errors:
+            errors[question_id] = 'This question is required.'
+
+    return cleaned, errors
@@ -1,34 +1,50 @@
 import logging
-import os
-import uuid
+import math
 from django.shortcuts import render, get_object_or_404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework import status
 from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
-from django.db import transaction
+from django.core.exceptions import ValidationError
 from django.middleware.csrf import get_token
-from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from django.views.decorators.http import condition
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
 from django.conf import settings
 import json
-import google.generativeai as genai
-from decouple import config
+from asgiref.sync import sync_to_async
 
-from .models import Form, FormResponse, FormUser, FormQuestion
-from .serializers import FormSerializer
+from .models import Form, FormUser
+from .cache import get_form_schema, form_etag, form_last_modified
+from .aggregates import cached_form_statistics
+from .export import export_response, EXPORT_FORMATS
+from .ai import fill_form, prepare_fill, stream_fill, acquire_fill_slot, SlotStream, FormUnavailable, NoQuestions, AIResponseError
+from .validation import get_validation_plan, validate_responses
+from .submission import record_submission, record_submissions, DuplicateSubmission
+from .uploads import FormUploadHandler, FILE_FIELD_PREFIX, check_uploaded_file
+from .blobs import store_upload, release_upload
 from authentication.models import User
+from utils.throttling import UserTokenBucketThrottle, IPTokenBucketThrottle
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 # Create your views here.
 class GetFormByIdAPI(APIView):
+    @method_decorator(condition(etag_func=form_etag, last_modified_func=form_last_modified))
     def get(self, request, form_id):
         try:
-            form = get_object_or_404(Form, id=form_id, enable=True)
-            serializer = FormSerializer(form)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            data = get_form_schema(form_id)
+            if data is None:
+                raise Http404
+            response = Response(data, status=status.HTTP_200_OK)
+            # Let browsers and proxies keep the payload but revalidate it
+            patch_cache_control(response, public=True, no_cache=True)
+            return response
         except Exception as e:
             logger.error(f"Error fetching form {form_id}: {str(e)}")
             return Response(
@@ -36,6 +52,31 @@ class GetFormByIdAPI(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+class FormStatisticsAPI(APIView):
+    """Answer statistics of a form, read from the maintained aggregates."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, form_id):
+        form = get_object_or_404(Form, id=form_id)
+        return Response({
+            'form': str(form.id),
+            'submissions': form.submission_count,
+            'questions': cached_form_statistics(form.id),
+        }, status=status.HTTP_200_OK)
+
+class ExportFormResponsesAPI(APIView):
+    """Stream all responses of a form as CSV, NDJSON or XLSX."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, form_id, export_format):
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        form = get_object_or_404(Form, id=form_id)
+        return export_response(form, export_format)
+
 @method_decorator(ensure_csrf_cookie, name='dispatch')
 class GetCSRFToken(APIView):
     def get(self, request):
@@ -45,13 +86,29 @@ class GetCSRFToken(APIView):
         }, status=status.HTTP_200_OK)
 
 class SubmitFormResponse(APIView):
+    def initial(self, request, *args, **kwargs):
+        # Must be installed before the body is parsed
+        self.upload_handler = FormUploadHandler(request._request)
+        request.upload_handlers.insert(0, self.upload_handler)
+        super().initial(request, *args, **kwargs)
+    
     def post(self, request):
         try:
-            print("files", request.FILES)
             user_code = request.data.get('user_code')
             form_id = request.data.get('formId')
             responses_data = request.data.get('responses', '{}')
             
+            # Files rejected while the upload was streaming in
+            if self.upload_handler.errors:
+                logger.warning(f"Form submission failed - Rejected uploads: {self.upload_handler.errors}")
+                return Response(
+                    {
+                        "message": "Some files were rejected!",
+                        "errors": self.upload_handler.errors
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
             # Parse responses JSON
             try:
                 responses = json.loads(responses_data) if isinstance(responses_data, str) else responses_data
@@ -117,80 +174,75 @@ class SubmitFormResponse(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Check if user has already submitted this form using FormUser
-            existing_form_user = FormUser.objects.filter(
-                user=user,
-                form=form
-            ).first()
+            if not isinstance(responses, dict):
+                logger.warning(f"Form submission failed - Responses are not an object for form {form_id}")
+                return Response(
+                    {"message": "Invalid form data format!"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            if existing_form_user:
-                logger.warning(f"Form submission failed - User {user_code} already submitted form {form_id}")
+            # Validate answers against the form's questions
+            plan = get_validation_plan(form.id)
+            responses, errors = validate_responses(plan, responses)
+            if errors:
+                logger.warning(f"Form submission failed - Invalid answers for form {form_id}: {errors}")
                 return Response(
                     {
-                        "message": "You have already submitted this form!"
+                        "message": "Some answers are invalid!",
+                        "errors": errors
                     },
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Process file uploads
-            for question_id, response_data in responses.items():
-                if response_data.get('answer_type') == 'file' and response_data.get('value'):
-                    file_key = f'file_{question_id}'
-                    if file_key in request.FILES:
-                        uploaded_file = request.FILES[file_key]
-                        
-                        # Create upload directory if it doesn't exist
-                        upload_dir = os.path.join(settings.MEDIA_ROOT, 'form_uploads', str(form_id), str(user.id))
-                        os.makedirs(upload_dir, exist_ok=True)
-                        
-                        # Generate unique filename with secure extension validation
-                        original_filename = uploaded_file.name
-                        # Secure the filename by removing path separators and dangerous characters
-                        secure_filename = os.path.basename(original_filename)
-                        # Extract extension safely
-                        file_extension = os.path.splitext(secure_filename)[1]
-                        # Validate extension against allowed list
-                        allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx', '.txt', '.csv', '.xlsx', '.xls'}
-                        if file_extension.lower() not in allowed_extensions:
-                            file_extension = '.txt'  # Default safe extension
-                        unique_filename = f"{uuid.uuid4()}{file_extension}"
-                        file_path = os.path.join(upload_dir, unique_filename)
-                        
-                        # Additional security: Ensure the constructed path is within the expected directory
-                        normalized_path = os.path.normpath(file_path)
-                        normalized_upload_dir = os.path.normpath(upload_dir)
-                        if not normalized_path.startswith(normalized_upload_dir):
-                            logger.error(f"Path injection attempt detected: {original_filename}")
-                            return Response(
-                                {"message": "Invalid file path detected"},
-                                status=status.HTTP_400_BAD_REQUEST
-                            )
-                        
-                        # Save the file
-                        with open(file_path, 'wb+') as destination:
-                            for chunk in uploaded_file.chunks():
-                                destination.write(chunk)
-                        
-                        # Update response with file path
-                        relative_path = os.path.join('form_uploads', str(form_id), str(user.id), unique_filename)
-                        response_data['value']['file_path'] = relative_path
-                        response_data['value']['original_name'] = uploaded_file.name
-            
-            # Store the form response and create FormUser entry
-            print(responses)
-            with transaction.atomic():
-                
-                form_response = FormResponse.objects.create(
-                    form=form,
-                    response=responses
+            # Check the parsed files too, in case the form was not known while streaming
+            for file_key, uploaded_file in request.FILES.items():
+                question_id = file_key[len(FILE_FIELD_PREFIX):] if file_key.startswith(FILE_FIELD_PREFIX) else file_key
+                rule = plan.get(question_id)
+                error = check_uploaded_file(rule, uploaded_file.content_type, uploaded_file.size) if rule else 'This question does not accept files.'
+                if error:
+                    errors[question_id] = error
+            if errors:
+                logger.warning(f"Form submission failed - Invalid files for form {form_id}: {errors}")
+                return Response(
+                    {
+                        "message": "Some files were rejected!",
+                        "errors": errors
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
                 )
+            
+            # Store the uploads, then the form response and its FormUser entry.
+            # One submission per user is enforced by the FormUser constraint.
+            saved_files = []
+            try:
+                for question_id, response_data in responses.items():
+                    if response_data.get('answer_type') == 'file' and response_data.get('value'):
+                        file_key = f'file_{question_id}'
+                        if file_key in request.FILES:
+                            uploaded_file = request.FILES[file_key]
+                            
+                            file_path = store_upload(uploaded_file, self.upload_handler.digests.get(file_key))
+                            saved_files.append(file_path)
+                            
+                            # Update response with file path
+                            response_data['value']['file_path'] = file_path
+                            response_data['value']['original_name'] = uploaded_file.name
                 
-                FormUser.objects.create(
-                    user=user,
-                    form=form
+                form_response = record_submission(form, user, responses)
+            except Exception as e:
+                # No response references the stored uploads
+                for file_path in saved_files:
+                    release_upload(file_path)
+                if not isinstance(e, DuplicateSubmission):
+                    raise
+                logger.warning(f"Form submission failed - User {user_code} already submitted form {form_id}")
+                return Response(
+                    {
+                        "message": "You have already submitted this form!"
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                
-                logger.info(f"Form submission successful - User: {user_code}, Form: {form_id}, Response ID: {form_response.id}")
+            logger.info(f"Form submission successful - User: {user_code}, Form: {form_id}, Response ID: {form_response.id}")
             
             return Response(
                 {
@@ -210,117 +262,195 @@ class SubmitFormResponse(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class AIFillFormAPI(APIView):
+class BatchSubmitUserThrottle(UserTokenBucketThrottle):
+    scope = 'batch-submit'
+    rate_setting = 'FORM_BATCH_SUBMIT_RATE'
+
+
+class BatchSubmitFormResponse(APIView):
+    """
+    Store many submissions for one form in a single request.
+
+    Meant for replaying submissions queued offline (e.g. by kiosks). Users
+    and existing submissions are resolved with one query each and all valid
+    submissions are written with ``bulk_create`` in one transaction. File
+    answers are not supported here since the payload is JSON only.
+
+    The per item results tell which user codes exist, so only staff may
+    post batches, and at most ``FORM_BATCH_SUBMIT_RATE`` of them.
+    """
+    permission_classes = [IsAdminUser]
+    throttle_classes = [BatchSubmitUserThrottle]
+    MAX_SUBMISSIONS = 500
+
     def post(self, request):
         try:
             form_id = request.data.get('formId')
-            user_input = request.data.get('userInput', '').strip()
+            submissions = request.data.get('submissions')
             
             if not form_id:
                 return Response(
-                    {"error": "Form ID is required"},
+                    {"message": "Form ID is required!"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            if not user_input:
+            if not isinstance(submissions, list) or not submissions:
                 return Response(
-                    {"error": "User input is required"},
+                    {"message": "Submissions are required!"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if len(submissions) > self.MAX_SUBMISSIONS:
+                return Response(
+                    {"message": f"At most {self.MAX_SUBMISSIONS} submissions are allowed per batch!"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
             try:
                 form = Form.objects.get(id=form_id, enable=True)
-            except Form.DoesNotExist:
+            except (Form.DoesNotExist, ValidationError):
                 return Response(
-                    {"error": "Form not found or disabled"},
+                    {"message": "Form not found or disabled!"},
                     status=status.HTTP_404_NOT_FOUND
                 )
-            form_questions = FormQuestion.objects.filter(form=form).select_related('question').order_by('form_index')
             
-            if not form_questions.exists():
-                return Response(
-                    {"error": "No questions found for this form"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            plan = get_validation_plan(form.id)
+            
+            codes = {item.get('user_code') for item in submissions if isinstance(item, dict) and isinstance(item.get('user_code'), str)}
+            users = {user.code: user for user in User.objects.filter(code__in=codes)}
+            submitted = set(
+                FormUser.objects.filter(form=form, user__in=users.values()).values_list('user_id', flat=True)
+            )
             
-            questions_data = []
-            for fq in form_questions:
-                q = fq.question
-                question_info = {
-                    'id': str(q.id),
-                    'question': q.question,
-                    'answer_type': q.answer_type,
-                    'required': q.required,
-                }
+            results = [None] * len(submissions)
+            accepted = []
+            accepted_indexes = []
+            
+            for index, item in enumerate(submissions):
+                error = None
+                errors = None
+                user = None
+                
+                if not isinstance(item, dict):
+                    error = "Invalid submission format!"
+                elif not isinstance(item.get('user_code'), str) or not item['user_code']:
+                    error = "User code is required!"
+                elif item['user_code'] not in users:
+                    error = "Invalid user code!"
+                else:
+                    user = users[item['user_code']]
+                    responses = item.get('responses')
+                    if user.id in submitted:
+                        error = "You have already submitted this form!"
+                    elif not isinstance(responses, dict) or not responses:
+                        error = "Form responses are required!"
+                    else:
+                        responses, errors = validate_responses(plan, responses)
+                        for question_id, answer in responses.items():
+                            if answer['answer_type'] == 'file':
+                                errors[question_id] = 'File uploads are not supported in batch submissions.'
+                        if errors:
+                            error = "Some answers are invalid!"
                 
-                if q.options:
-                    question_info['options'] = [opt.strip() for opt in q.options.split('||')]
+                if error:
+                    results[index] = {"index": index, "status": "error", "message": error}
+                    if errors:
+                        results[index]["errors"] = errors
+                    continue
                 
-                questions_data.append(question_info)
+                # Also guards against the same user appearing twice in one batch
+                submitted.add(user.id)
+                accepted.append((user, responses))
+                accepted_indexes.append(index)
+            
+            if accepted:
+                try:
+                    form_responses = record_submissions(form, accepted)
+                except DuplicateSubmission:
+                    # Another request stored one of these users meanwhile; a retry
+                    # reports it per item and stores the rest
+                    logger.warning(f"Batch submission for form {form_id} conflicted with a concurrent submission")
+                    return Response(
+                        {"message": "Some of these users submitted concurrently, please retry the batch!"},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                for index, form_response in zip(accepted_indexes, form_responses):
+                    results[index] = {"index": index, "status": "created", "response_id": str(form_response.id)}
             
-            api_key = config('GEMINI_API_KEY')
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.5-flash')
+            logger.info(f"Batch submission for form {form_id} - {len(accepted)} stored, {len(submissions) - len(accepted)} rejected")
             
-            prompt = f"""You are a helpful AI assistant that fills out forms based on user input. 
+            return Response(
+                {
+                    "created": len(accepted),
+                    "failed": len(submissions) - len(accepted),
+                    "results": results
+                },
+                status=status.HTTP_200_OK
+            )
             
-The user has provided the following input:
-"{user_input}"
-
-Based on this input, please fill out the following form. Return ONLY a valid JSON object with question IDs as keys and appropriate values.
-
-Form Questions:
-{json.dumps(questions_data, indent=2)}
-
-Instructions:
-1. For 'text' type questions: provide a string value
-2. For 'number' type questions: provide a numeric value
-3. For 'boolean' type questions: provide true or false
-4. For 'radio' type questions: select ONE option EXACTLY as shown in the options array (including any spaces)
-5. For 'checkbox' type questions: provide an array with EXACT option values from the options array (including any spaces)
-6. For 'select' type questions: select ONE option EXACTLY as shown in the options array (including any spaces)
-7. For 'file' type questions: set the value to null (files cannot be auto-filled)
-8. If the user input doesn't provide information for a question, use null for non-required fields or make a reasonable inference for required fields
-9. Ensure all required fields have values (not null)
-10. IMPORTANT: For radio, checkbox, and select - copy the option values EXACTLY as they appear in the options array, do not trim spaces or modify them
-
-Return ONLY a JSON object in this exact format:
-{{
-  "question_id_1": "value1",
-  "question_id_2": 123,
-  "question_id_3": true,
-  "question_id_4": ["option1", "option2"],
-  ...
-}}
-
-Do not include any markdown, explanations, or additional text. Only return the raw JSON object."""
-
-            response = model.generate_content(prompt)
+        except Exception as e:
+            logger.error(f"Batch form submission error: {str(e)}", exc_info=True)
+            return Response(
+                {
+                    "message": "An error occurred while submitting the forms.",
+                    "error": str(e)
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class AIFillUserThrottle(UserTokenBucketThrottle):
+    scope = 'ai-fill'
+    rate_setting = 'FORM_AI_USER_RATE'
+
+
+class AIFillIPThrottle(IPTokenBucketThrottle):
+    scope = 'ai-fill'
+    rate_setting = 'FORM_AI_IP_RATE'
+
+
+class AIFillFormAPI(APIView):
+    throttle_classes = [AIFillUserThrottle, AIFillIPThrottle]
+
+    def post(self, request):
+        try:
+            form_id = request.data.get('formId')
+            user_input = request.data.get('userInput', '').strip()
+            
+            if not form_id:
+                return Response(
+                    {"error": "Form ID is required"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if not user_input:
+                return Response(
+                    {"error": "User input is required"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
             try:
-                response_text = response.text.strip()
-                
-                if response_text.startswith('```'):
-                    response_text = response_text.split('```')[1]
-                    if response_text.startswith('json'):
-                        response_text = response_text[4:].strip()
-                
-                ai_responses = json.loads(response_text)
-                
-                logger.info(f"AI generated responses for form {form_id}: {ai_responses}")
-                
-                return Response({
-                    "success": True,
-                    "responses": ai_responses
-                }, status=status.HTTP_200_OK)
-                
-            except json.JSONDecodeError as e:
+                ai_responses = fill_form(form_id, user_input)
+            except FormUnavailable:
+                return Response(
+                    {"error": "Form not found or disabled"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            except NoQuestions:
+                return Response(
+                    {"error": "No questions found for this form"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            except AIResponseError as e:
                 logger.error(f"Failed to parse AI response: {str(e)}")
-                logger.error(f"Raw response: {response.text}")
                 return Response(
                     {"error": "Failed to parse AI response", "details": str(e)},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
+
+            return Response({
+                "success": True,
+                "responses": ai_responses
+            }, status=status.HTTP_200_OK)
             
         except Exception as e:
             logger.error(f"AI form fill error: {str(e)}", exc_info=True)
@@ -329,6 +459,61 @@ Do not include any markdown, explanations, or additional text. Only return the r
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+@method_decorator(csrf_exempt, name='dispatch')
+class AIFillFormStreamView(View):
+    """
+    Async variant of ``AIFillFormAPI`` that streams the answers as
+    server-sent events (see ``forms.ai.stream_fill``). Request errors are
+    reported as JSON before the stream starts.
+    """
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+
+        form_id = data.get('formId')
+        user_input = (data.get('userInput') or '').strip()
+
+        if not form_id:
+            return JsonResponse({"error": "Form ID is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not user_input:
+            return JsonResponse({"error": "User input is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        for throttle in (AIFillUserThrottle(), AIFillIPThrottle()):
+            if not await sync_to_async(throttle.allow_request)(request, self):
+                wait = math.ceil(throttle.wait() or 0)
+                return JsonResponse(
+                    {"error": f"Request was throttled. Expected available in {wait} seconds."},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={'Retry-After': str(wait)}
+                )
+
+        try:
+            key, cached, prompt = await sync_to_async(prepare_fill)(form_id, user_input)
+        except (FormUnavailable, ValidationError, ValueError):
+            return JsonResponse({"error": "Form not found or disabled"}, status=status.HTTP_404_NOT_FOUND)
+        except NoQuestions:
+            return JsonResponse({"error": "No questions found for this form"}, status=status.HTTP_400_BAD_REQUEST)
+
+        events = stream_fill(form_id, user_input, key, cached, prompt)
+        if cached is None:
+            slot = await acquire_fill_slot(settings.FORM_AI_STREAM_QUEUE_TIMEOUT)
+            if slot is None:
+                return JsonResponse(
+                    {"error": "Too many AI fills in progress, please try again shortly"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': '1'}
+                )
+            events = SlotStream(events, slot)
+
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 '''
     {
     "user_code": "123453rt",
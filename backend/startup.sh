@@ -3,6 +3,12 @@
 # Run database migrations
 python manage.py migrate --noinput
 
-# Start Gunicorn
-gunicorn --bind=0.0.0.0 --timeout 600 AppName.wsgi
+# Create the cache table (only used with CACHE_BACKEND=db)
+python manage.py createcachetable
+
+# Serve the streaming AI fill endpoint from a separate ASGI server (see AppName/asgi.py).
+# ASGI runs every request in its own thread, so persistent connections would never be reused there.
+DB_CONN_MAX_AGE=0 uvicorn AppName.asgi:application --host 0.0.0.0 --port "${ASGI_PORT:-8011}" &
 
+# Start Gunicorn
+exec gunicorn --bind=0.0.0.0 --timeout 600 AppName.wsgi
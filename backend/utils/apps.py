@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class UtilsConfig(AppConfig):
+    name = 'utils'
+
+    def ready(self):
+        from .db import connect_signals
+        connect_signals()
@@ -0,0 +1,196 @@
+"""
+Two-tier Django cache backend.
+
+``TieredCache`` keeps a small per-process LRU in front of a shared cache
+(file, database or Redis, configured as another ``CACHES`` alias). Reads
+are served from the process when possible and fall back to the shared
+tier; writes and deletes go to both. Local entries live at most
+``LOCAL_TIMEOUT`` seconds, which bounds how long another process can serve
+a value that was changed or deleted elsewhere.
+
+Keys are namespaced as ``<namespace>:<rest>`` (see ``cache_key``) and the
+backend counts local hits, shared hits and misses per namespace, plus
+local evictions; ``stats()`` returns the counters of the current process.
+"""
+import pickle
+import threading
+import time
+from collections import Counter, defaultdict
+
+from cachetools import LRUCache
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+FORMS = 'forms'
+USERS = 'users'
+AGGREGATES = 'aggregates'
+RATE_LIMITS = 'ratelimits'
+
+_MISSING = object()
+
+
+def cache_key(namespace, *parts):
+    """Namespaced cache key, e.g. ``cache_key(FORMS, 'schema', form_id)``."""
+    return ':'.join(str(part) for part in (namespace, *parts))
+
+
+def _namespace(key):
+    return key.split(':', 1)[0] if ':' in key else 'default'
+
+
+class _LocalTier(LRUCache):
+    def __init__(self, maxsize, on_evict):
+        super().__init__(maxsize)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        item = super().popitem()
+        self._on_evict()
+        return item
+
+
+class _LocalState:
+    """Local tier and counters shared by every instance of one cache alias."""
+
+    def __init__(self, max_entries):
+        self.lock = threading.Lock()
+        self.local = _LocalTier(max_entries, self.count_eviction)
+        self.counters = defaultdict(Counter)
+        self.evictions = 0
+
+    def count_eviction(self):
+        self.evictions += 1
+
+
+# Django creates a cache instance per thread / async context; like LocMemCache
+# the tier itself lives at module level, one per LOCATION
+_states = {}
+_states_lock = threading.Lock()
+
+
+def _local_state(location, max_entries):
+    with _states_lock:
+        state = _states.get(location)
+        if state is None:
+            state = _states[location] = _LocalState(max_entries)
+        return state
+
+
+class TieredCache(BaseCache):
+    """
+    Options:
+
+    * ``SHARED``: alias of the shared cache (default ``'shared'``).
+    * ``LOCAL_MAX_ENTRIES``: size of the per-process LRU (default 1000).
+    * ``LOCAL_TIMEOUT``: seconds a value is kept locally (default 5).
+
+    Instances with the same ``LOCATION`` share the per-process tier.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        state = _local_state(location or '', options.get('LOCAL_MAX_ENTRIES', 1000))
+        self._lock = state.lock
+        self._local = state.local
+        self._counters = state.counters
+        self._state = state
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _count(self, key, outcome):
+        with self._lock:
+            self._counters[_namespace(key)][outcome] += 1
+
+    def _local_get(self, local_key):
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None:
+                return _MISSING
+            expires_at, pickled = entry
+            if expires_at <= time.monotonic():
+                self._local.pop(local_key, None)
+                return _MISSING
+        return pickle.loads(pickled)
+
+    def _local_set(self, local_key, value, timeout):
+        ttl = self._local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            self._local_delete(local_key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[local_key] = (time.monotonic() + ttl, pickled)
+
+    def _local_delete(self, local_key):
+        with self._lock:
+            self._local.pop(local_key, None)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            self._count(key, 'local_hits')
+            return value
+
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count(key, 'misses')
+            return default
+
+        self._count(key, 'shared_hits')
+        self._local_set(local_key, value, DEFAULT_TIMEOUT)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, timeout, version=version)
+        self._local_set(local_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._local_set(local_key, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        return self._local_get(local_key) is not _MISSING or self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def stats(self):
+        """Counters of this process, per namespace and in total."""
+        with self._lock:
+            namespaces = {name: dict(counter) for name, counter in self._counters.items()}
+            total = sum(self._counters.values(), Counter())
+            return {
+                'local_entries': len(self._local),
+                'local_max_entries': self._local.maxsize,
+                'evictions': self._state.evictions,
+                'local_hits': total['local_hits'],
+                'shared_hits': total['shared_hits'],
+                'misses': total['misses'],
+                'namespaces': namespaces,
+            }
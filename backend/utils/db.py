@@ -0,0 +1,75 @@
+"""
+Database connection reuse metrics.
+
+Counts, per process, the requests served and the database connections
+set up per alias (``connection_created``). With persistent connections
+(``CONN_MAX_AGE``) most requests reuse the connection of the previous one,
+so ``opened`` stays far below ``requests``. With the psycopg pool the
+signal fires on every checkout; checkouts of a connection the pool handed
+out before are counted as ``checkouts`` only, so ``opened`` still counts
+physical connections to the server.
+"""
+import threading
+import weakref
+from collections import Counter
+
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+
+_lock = threading.Lock()
+_requests = 0
+_opened = Counter()
+_checkouts = Counter()
+_seen = weakref.WeakSet()
+
+
+def _count_request(sender, **kwargs):
+    global _requests
+    with _lock:
+        _requests += 1
+
+
+def _is_new(raw_connection):
+    """Whether the driver connection has not been counted before."""
+    try:
+        if raw_connection in _seen:
+            return False
+        _seen.add(raw_connection)
+    except TypeError:
+        # Not weak referenceable (or no driver connection): count it
+        pass
+    return True
+
+
+def _count_connection(sender, connection, **kwargs):
+    with _lock:
+        _checkouts[connection.alias] += 1
+        if _is_new(getattr(connection, 'connection', None)):
+            _opened[connection.alias] += 1
+
+
+def connect_signals():
+    request_started.connect(_count_request, dispatch_uid='utils.db.count_request')
+    connection_created.connect(_count_connection, dispatch_uid='utils.db.count_connection')
+
+
+def connection_stats():
+    """Requests served, connections opened and pool checkouts of this process."""
+    with _lock:
+        opened = sum(_opened.values())
+        return {
+            'requests': _requests,
+            'connections_opened': opened,
+            'connections_by_alias': dict(_opened),
+            'checkouts': sum(_checkouts.values()),
+            'reuse_ratio': round(max(1 - opened / _requests, 0), 4) if _requests else None,
+        }
+
+
+def reset_connection_stats():
+    global _requests
+    with _lock:
+        _requests = 0
+        _opened.clear()
+        _checkouts.clear()
+        _seen.clear()
@@ -0,0 +1,102 @@
+"""
+Tests for the tiered cache backend
+"""
+import threading
+import pytest
+from django.core.cache import caches
+from utils.cache import TieredCache, cache_key, FORMS
+
+
+@pytest.fixture
+def tiered(request):
+    cache = TieredCache(request.node.nodeid, {'OPTIONS': {'SHARED': 'shared', 'LOCAL_MAX_ENTRIES': 2, 'LOCAL_TIMEOUT': 60}})
+    yield cache
+    cache.clear()
+
+
+class TestTieredCache:
+    """Test cases for utils.cache.TieredCache"""
+    
+    def test_read_through_tiers(self, tiered):
+        """Test that a value is served locally after the first shared hit"""
+        caches['shared'].set('forms:a', {'x': 1})
+        
+        assert tiered.get('forms:a') == {'x': 1}
+        assert tiered.get('forms:a') == {'x': 1}
+        assert tiered.get('forms:b', 'fallback') == 'fallback'
+        
+        stats = tiered.stats()['namespaces'][FORMS]
+        assert stats == {'shared_hits': 1, 'local_hits': 1, 'misses': 1}
+    
+    def test_set_and_delete_reach_both_tiers(self, tiered):
+        """Test that writes go to the shared tier and deletes clear both"""
+        tiered.set('forms:a', 1)
+        
+        assert caches['shared'].get('forms:a') == 1
+        tiered.delete('forms:a')
+        assert tiered.get('forms:a') is None
+        assert caches['shared'].get('forms:a') is None
+    
+    def test_local_values_are_copies(self, tiered):
+        """Test that mutating a returned value does not change the cache"""
+        tiered.set('forms:a', {'x': 1})
+        tiered.get('forms:a')['x'] = 2
+        
+        assert tiered.get('forms:a') == {'x': 1}
+    
+    def test_lru_evictions(self, tiered):
+        """Test that the local tier is bounded and counts evictions"""
+        for name in 'abc':
+            tiered.set(f'forms:{name}', name)
+        
+        stats = tiered.stats()
+        assert stats['local_entries'] == 2
+        assert stats['evictions'] == 1
+        assert tiered.get('forms:a') == 'a'
+        assert tiered.stats()['shared_hits'] == 1
+    
+    def test_short_timeouts_respected(self, tiered):
+        """Test that a zero timeout is not kept locally"""
+        tiered.set('forms:a', 1, timeout=0)
+        
+        assert tiered.get('forms:a') is None
+    
+    def test_tier_shared_across_threads(self, tiered, request):
+        """Test that the per-thread cache instances Django creates share one local tier"""
+        tiered.set('forms:a', 1)
+        seen = []
+        
+        def read():
+            other = TieredCache(request.node.nodeid, {'OPTIONS': {'SHARED': 'shared'}})
+            seen.append(other.get('forms:a'))
+        
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        
+        assert seen == [1]
+        assert tiered.stats()['local_hits'] == 1
+    
+    def test_cache_key(self):
+        """Test namespaced keys"""
+        assert cache_key(FORMS, 'schema', 1, 'abc') == 'forms:schema:1:abc'
+
+
+@pytest.mark.django_db
+class TestCacheStatsAPI:
+    """Test cases for the cache statistics endpoint"""
+    
+    def test_requires_admin(self, api_client, user):
+        """Test that regular users cannot read cache statistics"""
+        api_client.force_authenticate(user=user)
+        
+        assert api_client.get('/api/cache/stats/').status_code == 403
+    
+    def test_returns_counters(self, api_client, admin_user):
+        """Test that admins get the counters of the default cache"""
+        api_client.force_authenticate(user=admin_user)
+        
+        response = api_client.get('/api/cache/stats/')
+        
+        assert response.status_code == 200
+        assert {'local_hits', 'shared_hits', 'misses', 'evictions'} <= set(response.json())
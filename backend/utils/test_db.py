@@ -0,0 +1,56 @@
+"""
+Tests for database connection metrics
+"""
+import pytest
+from types import SimpleNamespace
+from django.db.backends.signals import connection_created
+from utils.db import connection_stats, reset_connection_stats
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    reset_connection_stats()
+    yield
+    reset_connection_stats()
+
+
+@pytest.mark.django_db
+class TestConnectionStats:
+    """Test cases for utils.db"""
+    
+    def test_counts_requests_and_connections(self, client):
+        """Test that requests and opened connections are counted"""
+        for _ in range(4):
+            client.get('/api/csrf-token/')
+        connection_created.send(sender=None, connection=SimpleNamespace(alias='default'))
+        
+        stats = connection_stats()
+        
+        assert stats['requests'] == 4
+        assert stats['connections_by_alias'] == {'default': 1}
+        assert stats['reuse_ratio'] == 0.75
+    
+    def test_pool_checkouts_are_not_connections(self):
+        """Test that checking out a pooled connection again is not counted as a new one"""
+        class RawConnection:
+            pass
+        pooled, fresh = RawConnection(), RawConnection()
+        for raw in (pooled, pooled, fresh):
+            connection_created.send(sender=None, connection=SimpleNamespace(alias='default', connection=raw))
+        
+        stats = connection_stats()
+        
+        assert stats['connections_opened'] == 2
+        assert stats['checkouts'] == 3
+    
+    def test_no_requests(self):
+        """Test that the ratio is undefined before the first request"""
+        assert connection_stats()['reuse_ratio'] is None
+    
+    def test_endpoint_requires_admin(self, api_client, user, admin_user):
+        """Test that only admins can read the metrics"""
+        api_client.force_authenticate(user=user)
+        assert api_client.get('/api/db/stats/').status_code == 403
+        
+        api_client.force_authenticate(user=admin_user)
+        assert 'connections_opened' in api_client.get('/api/db/stats/').json()
@@ -0,0 +1,73 @@
+"""
+Tests for the token bucket throttles
+"""
+import pytest
+from rest_framework.test import APIRequestFactory
+from utils.throttling import IPTokenBucketThrottle, parse_rate
+
+
+class ClockedThrottle(IPTokenBucketThrottle):
+    scope = 'test'
+    rate_setting = 'TEST_RATE'
+    now = 1000.0
+
+    def timer(self):
+        return self.now
+
+
+@pytest.fixture
+def throttle(settings):
+    settings.TEST_RATE = '2/min'
+    return ClockedThrottle()
+
+
+class TestTokenBucketThrottle:
+    """Test cases for taking and refilling tokens"""
+    
+    def test_parse_rate(self):
+        """Test the rate format"""
+        assert parse_rate('10/min') == (10, 60)
+        assert parse_rate('5/s') == (5, 1)
+        assert parse_rate('100/day') == (100, 86400)
+    
+    def test_burst_then_refill(self, throttle):
+        """Test that the bucket allows a burst of its capacity and refills over time"""
+        request = APIRequestFactory().post('/', REMOTE_ADDR='10.0.0.1')
+        
+        assert throttle.allow_request(request, None)
+        assert throttle.allow_request(request, None)
+        assert not throttle.allow_request(request, None)
+        assert throttle.wait() == pytest.approx(30)
+        
+        throttle.now += 30
+        assert throttle.allow_request(request, None)
+        assert not throttle.allow_request(request, None)
+    
+    def test_buckets_per_address(self, throttle):
+        """Test that clients do not share a bucket"""
+        factory = APIRequestFactory()
+        
+        for _ in range(2):
+            assert throttle.allow_request(factory.post('/', REMOTE_ADDR='10.0.0.1'), None)
+        assert throttle.allow_request(factory.post('/', REMOTE_ADDR='10.0.0.2'), None)
+    
+    def test_forwarded_for_is_not_trusted(self, throttle, settings):
+        """Test that a client cannot get a fresh bucket by sending its own X-Forwarded-For"""
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}
+        factory = APIRequestFactory()
+        
+        # nginx appends the address it saw to whatever the client sent
+        for spoofed in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+            request = factory.post('/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR=f'{spoofed}, 10.0.0.1')
+            allowed = throttle.allow_request(request, None)
+        
+        assert not allowed
+    
+    def test_denied_without_lock(self, throttle, monkeypatch):
+        """Test that a request is denied when the bucket stays locked"""
+        monkeypatch.setattr('utils.throttling.LOCK_ATTEMPTS', 1)
+        request = APIRequestFactory().post('/', REMOTE_ADDR='10.0.0.1')
+        throttle.cache.add('ratelimits:test:ip-10.0.0.1:lock', True, 5)
+        
+        assert not throttle.allow_request(request, None)
+        assert throttle.wait() == 1
@@ -0,0 +1,112 @@
+"""
+Token bucket throttles for DRF views.
+
+A bucket holds up to ``N`` tokens for a rate of ``N/period`` and refills
+continuously at that rate; each request takes one token, so short bursts
+are absorbed while the long-run rate stays bounded. Buckets live in the
+``shared`` cache (not the per-process tier in front of it), so every
+process sees the same state. Updates take a short lock in the same cache;
+a request that cannot get the lock in time is denied rather than risk a
+lost update.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from authentication.authentication import authenticate_request
+from .cache import cache_key, RATE_LIMITS
+
+LOCK_ATTEMPTS = 50
+LOCK_RETRY_DELAY = 0.005
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    """``'10/min'`` -> ``(10, 60)``: bucket capacity and refill period in seconds."""
+    number, period = rate.split('/')
+    return int(number), _PERIODS[period.strip()[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Subclasses set ``scope``, ``rate_setting`` (the name of a setting such
+    as ``'10/min'``) and ``get_ident``; requests without an ident are not
+    throttled.
+    """
+    scope = None
+    rate_setting = None
+    cache_alias = 'shared'
+    timer = time.time
+
+    def __init__(self):
+        self.capacity, self.period = parse_rate(getattr(settings, self.rate_setting))
+        self.wait_seconds = None
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def allow_request(self, request, view):
+        ident = self.get_ident(request)
+        if ident is None:
+            return True
+
+        key = cache_key(RATE_LIMITS, self.scope, ident)
+        lock = f'{key}:lock'
+        if not self._lock(lock):
+            self.wait_seconds = 1
+            return False
+        try:
+            return self._take(key)
+        finally:
+            self.cache.delete(lock)
+
+    def _lock(self, lock):
+        for _ in range(LOCK_ATTEMPTS):
+            if self.cache.add(lock, True, 1):
+                return True
+            time.sleep(LOCK_RETRY_DELAY)
+        return False
+
+    def _take(self, key):
+        now = self.timer()
+        refill = self.capacity / self.period
+        tokens, updated_at = self.cache.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * refill)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        else:
+            self.wait_seconds = (1 - tokens) / refill
+        self.cache.set(key, (tokens, now), self.period + 1)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """One bucket per authenticated user, by session/token or JWT cookie."""
+
+    def get_ident(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            user, error = authenticate_request(request)
+            if error:
+                return None
+        return f'user-{user.pk}'
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """
+    One bucket per client address: ``REMOTE_ADDR``, or the entry of
+    ``X-Forwarded-For`` added by the outermost of ``NUM_PROXIES`` trusted
+    proxies, so a client cannot pick its own address.
+    """
+
+    def get_ident(self, request):
+        return f'ip-{super().get_ident(request)}'
@@ -0,0 +1,26 @@
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .db import connection_stats
+
+
+class CacheStatsAPI(APIView):
+    """Hit, miss and eviction counters of the default cache in this process."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        cache = caches['default']
+        if not hasattr(cache, 'stats'):
+            return Response({'error': 'The default cache keeps no statistics'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(cache.stats(), status=status.HTTP_200_OK)
+
+
+class DatabaseStatsAPI(APIView):
+    """Requests served and database connections opened by this process."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(connection_stats(), status=status.HTTP_200_OK)
@@ -44,6 +44,8 @@ const submitFormResponse = async (
   data: FormData | FormSubmissionData,
 ): Promise<FormSubmissionResponse> => {
   const response = await api.post("/forms/submit/", data, {
+    // Lets the server check uploads against the form while they stream in
+    params: data instanceof FormData ? { formId: data.get("formId") } : undefined,
     headers: {
       "Content-Type":
         data instanceof FormData ? "multipart/form-data" : "application/json",
@@ -1,3 +1,5 @@
 source venv/bin/activate
 cd backend/
+python manage.py createcachetable
+DB_CONN_MAX_AGE=0 uvicorn AppName.asgi:application --host 127.0.0.1 --port 8011 &
 python manage.py runserver 0.0.0.0:8010
\ No newline at end of file